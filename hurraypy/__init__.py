@@ -29,13 +29,16 @@ import logging
 
 try:
     from hurraypy.client import connect
+    from .cache import ChunkCache, MetadataCache
     from .nodes import File, Group, Dataset
+    from .pool import ConnectionPool
 except ImportError as e:
     warnings.warn("Unable to import modules: {}\nYou can ignore this"
                   " warning if it occurs during installation of the package"
                   .format(e))
 
-__all__ = ["connect", "__version__", "Dataset", "File", "Group"]
+__all__ = ["connect", "__version__", "ChunkCache", "ConnectionPool",
+           "Dataset", "File", "Group", "MetadataCache"]
 
 __version__ = '0.0.3'
 
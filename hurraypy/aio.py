@@ -0,0 +1,753 @@
+# Copyright (c) 2016, Meteotest
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of Meteotest nor the
+#      names of its contributors may be used to endorse or promote products
+#      derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL <COPYRIGHT HOLDER> BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+asyncio-based hurray client. Mirrors the API of ``Connection`` and of the
+node classes in ``hurraypy.nodes``, but all operations that talk to the
+server are coroutines::
+
+    >>> conn = await hurraypy.aio.connect("localhost:2222")
+    >>> f = await conn.File("myfile.h5")
+    >>> dst = await f["/mygroup/mydataset"]
+    >>> arr = await dst.read(np.s_[0:10, :])
+    >>> unit = await dst.attrs["unit"]
+    >>> await dst.attrs.set("unit", "m")
+
+Concurrent requests are distributed over up to ``size`` sockets.
+"""
+
+import asyncio
+import io
+import os
+import struct
+
+import msgpack
+
+from .client import (pack_request, check_status, add_db_arg, parse_addr,
+                     DIRECT_COMMANDS)
+from .exceptions import NodeError, MessageError
+from .log import log
+from .msgpack_ext import get_decoder, StreamUnpacker
+from .nodes import TREE_PAGE_SIZE, _walk_tree, normalize_key
+from .protocol import (CMD_CREATE_DATABASE, CMD_LIST_DATABASES,
+                       CMD_USE_DATABASE, CMD_RENAME_DATABASE,
+                       CMD_DELETE_DATABASE, CMD_GET_NODE, CMD_CONTAINS,
+                       CMD_CREATE_GROUP, CMD_REQUIRE_GROUP,
+                       CMD_CREATE_DATASET, CMD_REQUIRE_DATASET,
+                       CMD_GET_KEYS, CMD_GET_TREE, CMD_GET_FILESIZE,
+                       CMD_GET_NODES, CMD_KW_PATHS, CMD_ITER_TREE,
+                       CMD_KW_MAX_DEPTH, CMD_KW_PATTERN, CMD_KW_CURSOR,
+                       CMD_KW_LIMIT, RESPONSE_NODES, RESPONSE_CURSOR,
+                       CMD_SLICE_DATASET, CMD_BROADCAST_DATASET,
+                       CMD_ATTRIBUTES_GET, CMD_ATTRIBUTES_SET,
+                       CMD_ATTRIBUTES_CONTAINS, CMD_ATTRIBUTES_KEYS,
+                       CMD_ATTRIBUTES_GET_MANY, CMD_ATTRIBUTES_UPDATE,
+                       CMD_KW_PATH, CMD_KW_KEY, CMD_KW_KEYS, CMD_KW_OVERWRITE,
+                       CMD_KW_DB_RENAMETO, CMD_KW_SHAPE, CMD_KW_DTYPE,
+                       CMD_KW_CHUNKS, CMD_KW_COMPRESSION,
+                       CMD_KW_COMPRESSION_OPTS, CMD_KW_FILLVALUE,
+                       CMD_KW_REQUIRE_EXACT, RESPONSE_DATA,
+                       RESPONSE_NODE_KEYS, RESPONSE_NODE_TREE,
+                       RESPONSE_ATTRS_KEYS, RESPONSE_ATTRS_CONTAINS, MSG_LEN)
+from .status_codes import (KEY_ERROR, NODE_NOT_FOUND, INCOMPATIBLE_DATA,
+                           UNKNOWN_COMMAND)
+
+
+class AsyncConnection(object):
+    """
+    asyncio connection to a hurray server
+    """
+
+    def __init__(self, host=None, port=None, udsocket=None, size=1):
+        """
+        Use ``connect()`` to create connections.
+
+        Args:
+            host: hostname of IP
+            port: TCP port
+            udsocket: path to unix domain socket
+            size: maximum number of sockets used for concurrent requests
+        """
+        self._host = host
+        self._port = port
+        if udsocket:
+            self._udsocket = os.path.abspath(os.path.expanduser(udsocket))
+        else:
+            self._udsocket = None
+        self._size = size
+        # idle (reader, writer) pairs
+        self._streams = asyncio.Queue()
+        self._num_streams = 0
+        self._closed = False
+
+    def __repr__(self):
+        if self._udsocket is not None:
+            return "<AsyncConnection (udsocket={})>".format(self._udsocket)
+        else:
+            return ("<AsyncConnection (host={}, port={})>"
+                    .format(self._host, self._port))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type, value, tb):
+        await self.close()
+
+    async def _open_stream(self):
+        if self._udsocket:
+            return await asyncio.open_unix_connection(self._udsocket)
+        else:
+            return await asyncio.open_connection(self._host, int(self._port))
+
+    async def _checkout(self):
+        if self._closed:
+            raise ValueError("connection is closed")
+        if self._streams.empty() and self._num_streams < self._size:
+            self._num_streams += 1
+            try:
+                return await self._open_stream()
+            except BaseException:
+                self._num_streams -= 1
+                raise
+        return await self._streams.get()
+
+    def _checkin(self, stream, healthy=True):
+        if healthy and not self._closed:
+            self._streams.put_nowait(stream)
+        else:
+            stream[1].close()
+            self._num_streams -= 1
+
+    async def close(self):
+        """
+        Close all idle sockets.
+        """
+        self._closed = True
+        while not self._streams.empty():
+            _, writer = self._streams.get_nowait()
+            writer.close()
+            self._num_streams -= 1
+
+    async def File(self, h5file, mode="w"):
+        """
+        Open hdf5 file (cf. ``Connection.File``)
+        """
+        # TODO implement mode
+        await self.send_rcv(CMD_USE_DATABASE, h5file=h5file, args={})
+        return File(conn=self, h5file=h5file, path="/")
+
+    async def create_file(self, name, overwrite=False):
+        """
+        Create an hdf5 file (cf. ``Connection.create_file``)
+        """
+        args = {
+            CMD_KW_OVERWRITE: overwrite,
+        }
+        await self.send_rcv(CMD_CREATE_DATABASE, h5file=name, args=args)
+
+        return File(conn=self, h5file=name, path='/')
+
+    async def list_files(self, path=""):
+        """
+        cf. ``Connection.list_files``
+        """
+        args = {
+            CMD_KW_PATH: path,
+        }
+        result = await self.send_rcv(CMD_LIST_DATABASES, args=args)
+
+        return result[RESPONSE_DATA]
+
+    async def _recv(self, reader, direct=False, out=None):
+        """
+        Receive and decode message (cf. ``Connection._recv``)
+        """
+        header = await reader.readexactly(2 * MSG_LEN)
+        protocol_ver, msg_length = struct.unpack('>II', header)
+        log.debug("Handle request (Protocol: v%d, Msg size: %d)",
+                  protocol_ver, msg_length)
+        msg_data = await reader.readexactly(msg_length)
+
+        decoder = get_decoder(self, file_cls=File, group_cls=Group,
+                              dataset_cls=Dataset)
+        if direct or out is not None:
+            stream = io.BytesIO(msg_data)
+            unpacker = StreamUnpacker(stream.read, stream.readinto,
+                                      object_hook=decoder, out=out)
+            return unpacker.unpack()
+        else:
+            return msgpack.unpackb(msg_data, object_hook=decoder,
+                                   use_list=False, encoding='utf-8')
+
+    async def send_rcv(self, cmd, args, h5file=None, data=None, out=None):
+        """
+        Process a request to the server (cf. ``Connection.send_rcv``)
+        """
+        add_db_arg(args, h5file)
+
+        buffers = pack_request(cmd, args, data)
+        stream = await self._checkout()
+        reader, writer = stream
+        healthy = False
+        try:
+            for buf in buffers:
+                writer.write(buf)
+            await writer.drain()
+            result = await self._recv(reader, direct=cmd in DIRECT_COMMANDS,
+                                      out=out)
+            healthy = True
+        finally:
+            # a cancelled request leaves the socket out of sync
+            self._checkin(stream, healthy)
+
+        check_status(result)
+
+        return result
+
+
+async def connect(addr, size=1):
+    """
+    Create and return an ``AsyncConnection``.
+
+    Args:
+        addr: server address, cf. ``hurraypy.connect()``
+        size: maximum number of sockets used for concurrent requests
+
+    Returns: AsyncConnection object
+    """
+    conn = AsyncConnection(size=size, **parse_addr(addr))
+    # open first socket immediately to report connection errors early
+    conn._checkin(await conn._checkout())
+
+    return conn
+
+
+class Node(object):
+    """
+    HDF5 node (cf. ``hurraypy.nodes.Node``)
+    """
+
+    def __init__(self, conn, h5file, path):
+        self.conn = conn
+        self._h5file = h5file
+        self._path = path
+        self.attrs = AttributeManager(conn=conn, h5file=h5file, path=path)
+
+    @property
+    def h5file(self):
+        return self._h5file
+
+    @property
+    def path(self):
+        return self._path
+
+    def _compose_path(self, name):
+        if name.startswith('/'):  # absolute path
+            return name
+        else:  # relative path
+            return os.path.join(self.path, name)
+
+    async def _get(self, key):
+        path = self._compose_path(key)
+        args = {
+            CMD_KW_PATH: path,
+        }
+        try:
+            result = await self.conn.send_rcv(CMD_GET_NODE,
+                                              h5file=self.h5file, args=args)
+        except NodeError as e:
+            if e.status == NODE_NOT_FOUND:
+                raise KeyError("group/dataset not found")
+            else:
+                raise e
+
+        return result[RESPONSE_DATA]  # Group or Dataset
+
+    def __getitem__(self, key):
+        """
+        Usage: ``node = await group["path"]``
+        """
+        return self._get(key)
+
+
+class Group(Node):
+    """
+    HDF5 group (cf. ``hurraypy.nodes.Group``)
+    """
+
+    def __repr__(self):
+        return "<Group (db={}, path={})>".format(self.h5file, self._path)
+
+    async def create_group(self, name):
+        group_path = self._compose_path(name)
+        args = {
+            CMD_KW_PATH: group_path,
+        }
+        await self.conn.send_rcv(CMD_CREATE_GROUP, h5file=self.h5file,
+                                 args=args)
+        return Group(conn=self.conn, h5file=self.h5file, path=group_path)
+
+    async def require_group(self, name):
+        group_path = self._compose_path(name)
+        args = {
+            CMD_KW_PATH: group_path,
+        }
+        await self.conn.send_rcv(CMD_REQUIRE_GROUP, h5file=self.h5file,
+                                 args=args)
+        return Group(conn=self.conn, h5file=self.h5file, path=group_path)
+
+    def _dataset_args(self, name, shape, dtype, chunks, compression,
+                      compression_opts, fillvalue):
+        args = {
+            CMD_KW_PATH: self._compose_path(name),
+            CMD_KW_CHUNKS: chunks,
+        }
+        if shape is not None:
+            args[CMD_KW_SHAPE] = shape
+        if dtype is not None:
+            args[CMD_KW_DTYPE] = dtype
+        if compression is not None:
+            args[CMD_KW_COMPRESSION] = compression
+        if compression_opts is not None:
+            args[CMD_KW_COMPRESSION_OPTS] = compression_opts
+        if fillvalue is not None:
+            args[CMD_KW_FILLVALUE] = fillvalue
+        return args
+
+    async def create_dataset(self, name, shape=None, dtype=None, data=None,
+                             chunks=True, compression=None,
+                             compression_opts=None, fillvalue=None):
+        """
+        cf. ``hurraypy.nodes.Group.create_dataset``
+        """
+        if data is None and shape is None:
+            raise ValueError("Either 'data' or 'shape' must be specified")
+
+        if compression not in (None, "gzip", "lzf", "szip"):
+            raise ValueError("Unknown 'compression' filter: {}"
+                             .format(compression))
+
+        args = self._dataset_args(name, shape, dtype, chunks, compression,
+                                  compression_opts, fillvalue)
+        result = await self.conn.send_rcv(CMD_CREATE_DATASET,
+                                          h5file=self.h5file, args=args,
+                                          data=data)
+
+        return result[RESPONSE_DATA]  # Dataset
+
+    async def require_dataset(self, name, shape=None, dtype=None, data=None,
+                              chunks=True, compression=None,
+                              compression_opts=None, fillvalue=None,
+                              exact=False):
+        """
+        cf. ``hurraypy.nodes.Group.require_dataset``
+        """
+        if data is None and shape is None:
+            raise ValueError("Either 'data' or 'shape' must be specified")
+
+        args = self._dataset_args(name, shape, dtype, chunks, compression,
+                                  compression_opts, fillvalue)
+        args[CMD_KW_REQUIRE_EXACT] = exact
+        try:
+            result = await self.conn.send_rcv(CMD_REQUIRE_DATASET,
+                                              h5file=self.h5file, args=args,
+                                              data=data)
+        except MessageError as e:
+            if e.status == INCOMPATIBLE_DATA:
+                raise TypeError("shape or dtype incompatible")
+            else:
+                raise e
+
+        return result[RESPONSE_DATA]  # Dataset
+
+    async def keys(self):
+        args = {
+            CMD_KW_PATH: self._path,
+        }
+        result = await self.conn.send_rcv(CMD_GET_KEYS, h5file=self.h5file,
+                                          args=args)
+
+        return result[RESPONSE_DATA][RESPONSE_NODE_KEYS]
+
+    async def items(self):
+        """
+        Returns a list of (key, node) tuples (in a single request).
+        """
+        nodes = await self._get_nodes(None)
+        return [(os.path.basename(node.path), node) for node in nodes]
+
+    async def values(self):
+        """
+        Returns a list of all child nodes (in a single request).
+        """
+        return await self._get_nodes(None)
+
+    async def get_many(self, paths, default=None):
+        """
+        Return multiple groups/datasets as dict (cf.
+        ``hurraypy.nodes.Group.get_many``).
+        """
+        paths = list(paths)
+        nodes = await self._get_nodes([self._compose_path(p) for p in paths])
+        return {path: default if node is None else node
+                for path, node in zip(paths, nodes)}
+
+    async def _get_nodes(self, paths):
+        args = {
+            CMD_KW_PATH: self._path,
+        }
+        if paths is not None:
+            args[CMD_KW_PATHS] = paths
+        try:
+            result = await self.conn.send_rcv(CMD_GET_NODES,
+                                              h5file=self.h5file, args=args)
+        except MessageError as me:
+            if me.status != UNKNOWN_COMMAND:
+                raise
+            # server does not support multi-node requests: request nodes
+            # concurrently
+            if paths is None:
+                paths = await self.keys()
+            return await asyncio.gather(*[self._get_or_none(path)
+                                          for path in paths])
+
+        return list(result[RESPONSE_DATA])
+
+    async def _get_or_none(self, path):
+        try:
+            return await self._get(path)
+        except KeyError:
+            return None
+
+    async def contains(self, key):
+        """
+        Async replacement for ``key in group``
+        """
+        args = {
+            CMD_KW_PATH: self._path,
+            CMD_KW_KEY: key
+        }
+        result = await self.conn.send_rcv(CMD_CONTAINS, h5file=self.h5file,
+                                          args=args)
+
+        return result[RESPONSE_DATA]
+
+    async def tree(self):
+        """
+        Return tree data structure consisting of all groups and datasets
+        (cf. ``hurraypy.nodes.Group.tree``).
+        """
+        args = {
+            CMD_KW_PATH: self._path,
+        }
+        result = await self.conn.send_rcv(CMD_GET_TREE, h5file=self.h5file,
+                                          args=args)
+        return result[RESPONSE_DATA][RESPONSE_NODE_TREE]
+
+    async def iter_tree(self, max_depth=None, pattern=None,
+                        page_size=TREE_PAGE_SIZE):
+        """
+        Asynchronous generator of this group and all groups and datasets
+        below it, requested page by page (cf.
+        ``hurraypy.nodes.Group.iter_tree``)::
+
+            >>> async for node in group.iter_tree(max_depth=1):
+            ...     print(node.path)
+        """
+        args = {
+            CMD_KW_PATH: self._path,
+            CMD_KW_LIMIT: page_size,
+        }
+        if max_depth is not None:
+            args[CMD_KW_MAX_DEPTH] = max_depth
+        if pattern is not None:
+            args[CMD_KW_PATTERN] = pattern
+
+        cursor = None
+        while True:
+            if cursor is not None:
+                args[CMD_KW_CURSOR] = cursor
+            try:
+                result = await self.conn.send_rcv(CMD_ITER_TREE,
+                                                  h5file=self.h5file,
+                                                  args=dict(args))
+            except MessageError as me:
+                if me.status != UNKNOWN_COMMAND or cursor is not None:
+                    raise
+                # server does not support paged traversal
+                for node in _walk_tree(await self.tree(), max_depth,
+                                       pattern):
+                    yield node
+                return
+            page = result[RESPONSE_DATA]
+            for node in page[RESPONSE_NODES]:
+                yield node
+            cursor = page[RESPONSE_CURSOR]
+            if cursor is None:
+                return
+
+    async def visititems(self, func, max_depth=None):
+        """
+        Recursively visit all objects in this group and subgroups (cf.
+        ``hurraypy.nodes.Group.visititems``). ``func`` is a regular
+        callable.
+        """
+        nodes = self.iter_tree(max_depth=max_depth)
+        try:
+            async for node in nodes:
+                value = func(node.path, node)
+                if value is not None:
+                    return value
+        finally:
+            await nodes.aclose()
+
+
+class File(Group):
+    """
+    File object (cf. ``hurraypy.nodes.File``)
+    """
+
+    def __repr__(self):
+        return "<File (db={}, path={})>".format(self.h5file, self._path)
+
+    async def size(self):
+        """
+        return file size
+        """
+        result = await self.conn.send_rcv(CMD_GET_FILESIZE,
+                                          h5file=self.h5file, args={})
+
+        return result[RESPONSE_DATA]
+
+    async def rename(self, new):
+        """
+        Rename hdf5 file and return a new ``File`` object.
+        """
+        result = await self.conn.send_rcv(CMD_RENAME_DATABASE,
+                                          h5file=self.h5file,
+                                          args={CMD_KW_DB_RENAMETO: new})
+        self._h5file = None
+
+        return result[RESPONSE_DATA]
+
+    async def delete(self):
+        """
+        Delete hdf5 file.
+        """
+        await self.conn.send_rcv(CMD_DELETE_DATABASE, h5file=self.h5file,
+                                 args={})
+        self._h5file = None
+
+
+class Dataset(Node):
+    """
+    HDF5 dataset (cf. ``hurraypy.nodes.Dataset``)
+    """
+
+    def __init__(self, conn, h5file, path, shape, dtype, chunks=None):
+        Node.__init__(self, conn, h5file, path)
+        self.__shape = shape
+        self.__dtype = dtype
+        self.__chunks = chunks
+
+    def __repr__(self):
+        return ("<Dataset {} {} (db={}, path={})>"
+                .format(self.shape, self.dtype, self.h5file, self._path))
+
+    def __getitem__(self, key):
+        """
+        Usage: ``arr = await dataset[0:10, :]``
+        """
+        return self.read(key)
+
+    async def read(self, key=slice(None), out=None):
+        """
+        Read ``dataset[key]``, optionally into a caller-owned array ``out``
+        (cf. ``hurraypy.nodes.Dataset.read``).
+        """
+        args = {
+            CMD_KW_PATH: self.path,
+            CMD_KW_KEY: normalize_key(key)
+        }
+        result = await self.conn.send_rcv(CMD_SLICE_DATASET,
+                                          h5file=self.h5file, args=args,
+                                          out=out)
+        return result[RESPONSE_DATA]
+
+    async def write(self, key, value):
+        """
+        Async replacement for ``dataset[key] = value``
+        """
+        args = {
+            CMD_KW_PATH: self.path,
+            CMD_KW_KEY: normalize_key(key),
+        }
+        await self.conn.send_rcv(CMD_BROADCAST_DATASET, h5file=self.h5file,
+                                 args=args, data=value)
+
+    @property
+    def shape(self):
+        return self.__shape
+
+    @property
+    def dtype(self):
+        return self.__dtype
+
+    @property
+    def chunks(self):
+        return self.__chunks
+
+
+class AttributeManager(object):
+    """
+    cf. ``hurraypy.nodes.AttributeManager``
+    """
+
+    def __init__(self, conn, h5file, path):
+        self.conn = conn
+        self.__h5file = h5file
+        self.__path = path
+
+    @property
+    def h5file(self):
+        return self.__h5file
+
+    async def keys(self):
+        args = {
+            CMD_KW_PATH: self.__path,
+        }
+        result = await self.conn.send_rcv(CMD_ATTRIBUTES_KEYS,
+                                          h5file=self.h5file, args=args)
+        return result[RESPONSE_DATA][RESPONSE_ATTRS_KEYS]
+
+    async def contains(self, key):
+        """
+        Async replacement for ``key in attrs``
+        """
+        args = {
+            CMD_KW_PATH: self.__path,
+            CMD_KW_KEY: key,
+        }
+        result = await self.conn.send_rcv(CMD_ATTRIBUTES_CONTAINS,
+                                          h5file=self.h5file, args=args)
+        return result[RESPONSE_DATA][RESPONSE_ATTRS_CONTAINS]
+
+    def __getitem__(self, key):
+        """
+        Usage: ``value = await attrs["key"]``
+        """
+        return self._getitem(key)
+
+    async def _getitem(self, key):
+        args = {
+            CMD_KW_PATH: self.__path,
+            CMD_KW_KEY: key,
+        }
+        result = await self.conn.send_rcv(CMD_ATTRIBUTES_GET,
+                                          h5file=self.h5file, args=args)
+        return result[RESPONSE_DATA]
+
+    async def get(self, key, defaultvalue):
+        """
+        Return attribute value or return a default value if key is missing.
+        """
+        try:
+            return await self._getitem(key)
+        except NodeError as ne:
+            if ne.status == KEY_ERROR:
+                return defaultvalue
+            raise
+
+    async def set(self, key, value):
+        """
+        Async replacement for ``attrs[key] = value``
+        """
+        args = {
+            CMD_KW_PATH: self.__path,
+            CMD_KW_KEY: key,
+        }
+        await self.conn.send_rcv(CMD_ATTRIBUTES_SET, h5file=self.h5file,
+                                 args=args, data=value)
+
+    async def to_dict(self):
+        """
+        Return all attributes as dict (in a single request)
+        """
+        return await self._get_many(None)
+
+    async def get_many(self, keys, defaultvalue=None):
+        """
+        Return the values of multiple attributes as dict (in a single
+        request), using ``defaultvalue`` for missing attributes.
+        """
+        keys = list(keys)
+        values = await self._get_many(keys)
+        return {key: values.get(key, defaultvalue) for key in keys}
+
+    async def _get_many(self, keys):
+        """
+        Returns a dict with the values of existing attributes ``keys`` (all
+        attributes if None)
+        """
+        args = {
+            CMD_KW_PATH: self.__path,
+        }
+        if keys is not None:
+            args[CMD_KW_KEYS] = keys
+        try:
+            result = await self.conn.send_rcv(CMD_ATTRIBUTES_GET_MANY,
+                                              h5file=self.h5file, args=args)
+        except MessageError as me:
+            if me.status != UNKNOWN_COMMAND:
+                raise
+            # server does not support bulk attribute requests
+            missing = object()
+            if keys is None:
+                keys = await self.keys()
+            values = {}
+            for key in keys:
+                value = await self.get(key, missing)
+                if value is not missing:
+                    values[key] = value
+            return values
+
+        return dict(result[RESPONSE_DATA])
+
+    async def update(self, mapping):
+        """
+        Set/overwrite multiple attributes (in a single request)
+        """
+        mapping = dict(mapping)
+        args = {
+            CMD_KW_PATH: self.__path,
+        }
+        try:
+            await self.conn.send_rcv(CMD_ATTRIBUTES_UPDATE,
+                                     h5file=self.h5file, args=args,
+                                     data=mapping)
+        except MessageError as me:
+            if me.status != UNKNOWN_COMMAND:
+                raise
+            for key, value in mapping.items():
+                await self.set(key, value)
@@ -25,14 +25,21 @@
 
 import collections
 import errno
+import itertools
 import numbers
 import socket
+import time
 
 _ERRNO_WOULDBLOCK = (errno.EWOULDBLOCK, errno.EAGAIN)
 
 if hasattr(errno, "WSAEWOULDBLOCK"):
     _ERRNO_WOULDBLOCK += (errno.WSAEWOULDBLOCK,)
 
+_HAS_SENDMSG = hasattr(socket.socket, "sendmsg")
+
+# maximum number of iovecs passed to a single sendmsg() call
+_IOV_MAX = 1024
+
 
 def _merge_prefix(deque, size):
     """Replace the first entries in a deque of strings with a single
@@ -51,7 +58,10 @@ def _merge_prefix(deque, size):
         prefix.append(chunk)
         remaining -= len(chunk)
     if prefix:
-        deque.appendleft(type(prefix[0])().join(prefix))
+        if isinstance(prefix[0], memoryview):
+            deque.appendleft(b"".join(prefix))
+        else:
+            deque.appendleft(type(prefix[0])().join(prefix))
     if not deque:
         deque.appendleft(b"")
 
@@ -70,6 +80,12 @@ class BufferFullError(Exception):
     """
 
 
+class StreamClosedError(IOError):
+    """Exception raised by `Buffer` methods when the socket is closed before
+    the requested number of bytes could be read.
+    """
+
+
 class Buffer(object):
     def __init__(self, socket, max_buffer_size=None,
                  read_chunk_size=None):
@@ -85,17 +101,68 @@ class Buffer(object):
         self._closed = False
         self.socket = socket
 
+        # total number of bytes consumed by readers, used to keep track of
+        # message boundaries if a read is interrupted
+        self.bytes_consumed = 0
+        # time.monotonic() value after which I/O fails with socket.timeout
+        self._deadline = None
+
     def closed(self):
         """Returns true if the socket has been closed."""
         return self._closed
 
     def close(self):
-        if not self.closed():
-            self.socket.close()
-            self.socket = None
-            self._closed = True
+        # may be called concurrently, e.g., by a reader thread
+        sock, self.socket = self.socket, None
+        self._closed = True
+        if sock is not None:
+            try:
+                # wake up threads blocked in recv()
+                sock.shutdown(socket.SHUT_RDWR)
+            except (socket.error, IOError, OSError):
+                pass
+            sock.close()
+
+    def set_deadline(self, deadline):
+        """Make subsequent reads and writes fail with ``socket.timeout`` once
+        ``time.monotonic()`` exceeds ``deadline`` (None: no deadline).
+
+        A read that times out does not close the socket and does not lose
+        data: ``bytes_consumed`` tells how far the stream has been read.
+        """
+        self._deadline = deadline
+        if deadline is None and self.socket is not None:
+            self.socket.settimeout(None)
+
+    def _apply_deadline(self):
+        if self._deadline is not None:
+            remaining = self._deadline - time.monotonic()
+            if remaining <= 0:
+                raise socket.timeout("timed out")
+            self.socket.settimeout(remaining)
+
+    def is_alive(self):
+        """Returns False if the socket has been closed (by either side) or if
+        there is unread data, which is unexpected between requests."""
+        if self.closed():
+            return False
+        if self._read_buffer_size > 0:
+            return False
+        timeout = self.socket.gettimeout()
+        try:
+            self.socket.settimeout(0.0)
+            try:
+                self.socket.recv(1, socket.MSG_PEEK)
+            finally:
+                self.socket.settimeout(timeout)
+        except socket.error as e:
+            # nothing to read => socket is still open
+            return errno_from_exception(e) in _ERRNO_WOULDBLOCK
+        # EOF or unexpected data
+        return False
 
     def read_from_socket(self):
+        self._apply_deadline()
         try:
             chunk = self.socket.recv(self.read_chunk_size)
         except socket.error as e:
@@ -113,7 +180,12 @@ class Buffer(object):
             return b""
         _merge_prefix(self._read_buffer, loc)
         self._read_buffer_size -= loc
-        return self._read_buffer.popleft()
+        self.bytes_consumed += loc
+        data = self._read_buffer.popleft()
+        if isinstance(data, memoryview):
+            # remainder left behind by read_into()
+            data = data.tobytes()
+        return data
 
     def read_bytes(self, num_bytes):
         """Read a number of bytes.
@@ -125,6 +197,8 @@ class Buffer(object):
                 while True:
                     try:
                         chunk = self.read_from_socket()
+                    except socket.timeout:
+                        raise
                     except (socket.error, IOError, OSError) as e:
                         if errno_from_exception(e) == errno.EINTR:
                             continue
@@ -142,30 +216,104 @@ class Buffer(object):
                 if self._read_buffer_size >= num_bytes:
                     break
 
+            if self._read_buffer_size < num_bytes:
+                raise StreamClosedError("Stream closed after {} of {} bytes"
+                                        .format(self._read_buffer_size,
+                                                num_bytes))
+
         return self._consume(num_bytes)
 
+    def read_into(self, buf):
+        """Fill the writable buffer ``buf`` (e.g., a ``bytearray``) with
+        exactly ``len(buf)`` bytes.
+
+        Data that is already buffered is copied first, the remainder is
+        received directly into ``buf`` using ``socket.recv_into()``. Unlike
+        ``read_bytes()``, this neither buffers chunks nor joins them, i.e.,
+        the payload is copied only once.
+
+        Returns:
+            number of bytes read (``len(buf)``)
+        """
+        view = memoryview(buf).cast('B')
+        num_bytes = len(view)
+        pos = 0
+
+        # drain data that has already been read from the socket
+        while self._read_buffer and pos < num_bytes:
+            chunk = memoryview(self._read_buffer.popleft())
+            n = min(len(chunk), num_bytes - pos)
+            view[pos:pos + n] = chunk[:n]
+            if n < len(chunk):
+                # keep the unread rest without copying it
+                self._read_buffer.appendleft(chunk[n:])
+            self._read_buffer_size -= n
+            self.bytes_consumed += n
+            pos += n
+
+        while pos < num_bytes:
+            if self.closed():
+                raise StreamClosedError("Stream closed after {} of {} bytes"
+                                        .format(pos, num_bytes))
+            try:
+                self._apply_deadline()
+                n = self.socket.recv_into(view[pos:])
+            except socket.timeout:
+                raise
+            except (socket.error, IOError, OSError) as e:
+                if errno_from_exception(e) == errno.EINTR:
+                    continue
+                self.close()
+                raise
+            if n == 0:
+                self.close()
+            self.bytes_consumed += n
+            pos += n
+
+        return num_bytes
+
     def write(self, data):
         """Write the given data to this socket.
         """
-        assert isinstance(data, bytes)
-
-        if data and not self.closed():
-            write_buffer_size = 0
-            write_buffer = collections.deque()
-            # Break up large contiguous strings before inserting them in the
-            # write buffer, so we don't have to recopy the entire thing
-            # as we slice off pieces to send to the socket.
-            WRITE_BUFFER_CHUNK_SIZE = 128 * 1024
-            for i in range(0, len(data), WRITE_BUFFER_CHUNK_SIZE):
-                write_buffer.append(data[i:i + WRITE_BUFFER_CHUNK_SIZE])
-            write_buffer_size += len(data)
-
-            while write_buffer:
-                try:
+        self.writev([data])
+
+    def writev(self, buffers):
+        """Write a sequence of buffers (bytes, bytearray, memoryview or
+        contiguous numpy arrays) to this socket.
+
+        Buffers are passed to ``socket.sendmsg()`` as separate iovecs
+        (scatter-gather I/O), i.e., they are neither concatenated nor sliced
+        into copies. Falls back to ``socket.send()`` on platforms without
+        ``sendmsg()``.
+        """
+        write_buffer = collections.deque()
+        for data in buffers:
+            view = memoryview(data).cast('B')
+            if view.nbytes:
+                write_buffer.append(view)
+
+        if not write_buffer or self.closed():
+            return
+
+        while write_buffer:
+            try:
+                self._apply_deadline()
+                if _HAS_SENDMSG:
+                    iovecs = list(itertools.islice(write_buffer, _IOV_MAX))
+                    num_bytes = self.socket.sendmsg(iovecs)
+                else:
                     num_bytes = self.socket.send(write_buffer[0])
-                    _merge_prefix(write_buffer, num_bytes)
+            except (socket.error, IOError, OSError) as e:
+                if errno_from_exception(e) == errno.EINTR:
+                    continue
+                self.close()
+                raise
+            # drop buffers that were sent completely
+            while num_bytes:
+                first = write_buffer[0]
+                if num_bytes >= first.nbytes:
                     write_buffer.popleft()
-                    write_buffer_size -= num_bytes
-                except (socket.error, IOError, OSError) as e:
-                    self.close()
-                    raise
+                    num_bytes -= first.nbytes
+                else:
+                    write_buffer[0] = first[num_bytes:]
+                    num_bytes = 0
@@ -0,0 +1,311 @@
+# Copyright (c) 2016, Meteotest
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of Meteotest nor the
+#      names of its contributors may be used to endorse or promote products
+#      derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL <COPYRIGHT HOLDER> BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Client-side caches of metadata (nodes, keys, attributes, ...) and of
+dataset chunks
+"""
+
+import collections
+import threading
+import time
+
+import numpy as np
+
+from .protocol import (CMD_GET_NODE, CMD_GET_NODES, CMD_GET_KEYS,
+                       CMD_CONTAINS, CMD_GET_TREE, CMD_ITER_TREE,
+                       CMD_GET_FILESIZE, CMD_ATTRIBUTES_GET,
+                       CMD_ATTRIBUTES_KEYS, CMD_ATTRIBUTES_CONTAINS,
+                       CMD_ATTRIBUTES_SET, CMD_ATTRIBUTES_GET_MANY,
+                       CMD_ATTRIBUTES_UPDATE, CMD_BROADCAST_DATASET,
+                       CMD_SLICE_DATASET, CMD_READ_REGIONS,
+                       CMD_READ_POINTS, CMD_WRITE_REGIONS,
+                       CMD_WRITE_POINTS, CMD_LIST_DATABASES,
+                       CMD_USE_DATABASE, CMD_NEGOTIATE, CMD_OPEN_HANDLE,
+                       CMD_CREATE_DATASET, CMD_REQUIRE_DATASET,
+                       CMD_RENAME_DATABASE, CMD_DELETE_DATABASE,
+                       CMD_CREATE_DATABASE, CMD_BATCH, CMD_KW_DB,
+                       CMD_KW_PATH)
+from .nodes import Node
+
+# responses to these commands are cached
+CACHED_COMMANDS = (CMD_GET_NODE, CMD_GET_NODES, CMD_GET_KEYS, CMD_CONTAINS,
+                   CMD_GET_TREE, CMD_GET_FILESIZE, CMD_ATTRIBUTES_GET,
+                   CMD_ATTRIBUTES_KEYS, CMD_ATTRIBUTES_CONTAINS,
+                   CMD_ATTRIBUTES_GET_MANY)
+
+# commands that are neither cached nor modify metadata
+READ_COMMANDS = (CMD_SLICE_DATASET, CMD_READ_REGIONS, CMD_READ_POINTS,
+                 CMD_LIST_DATABASES, CMD_USE_DATABASE, CMD_NEGOTIATE,
+                 CMD_OPEN_HANDLE, CMD_ITER_TREE)
+
+# commands that modify dataset contents (but no metadata other than the
+# file size)
+DATA_WRITE_COMMANDS = (CMD_BROADCAST_DATASET, CMD_WRITE_REGIONS,
+                       CMD_WRITE_POINTS)
+
+ATTRIBUTE_COMMANDS = (CMD_ATTRIBUTES_GET, CMD_ATTRIBUTES_KEYS,
+                      CMD_ATTRIBUTES_CONTAINS, CMD_ATTRIBUTES_GET_MANY)
+
+
+def copy_result(obj, conn=None):
+    """
+    Returns a deep copy of a decoded response (or part of it), so that
+    cached results are not modified through the objects handed out.
+
+    Args:
+        obj: response, e.g., a dict with nodes or arrays
+        conn: connection the nodes in the copy are bound to
+
+    Returns:
+        copy of ``obj``
+    """
+    if isinstance(obj, Node):
+        return obj._copy(conn)
+    elif isinstance(obj, np.ndarray):
+        return obj.copy()
+    elif isinstance(obj, dict):
+        return {key: copy_result(value, conn) for key, value in obj.items()}
+    elif isinstance(obj, (list, tuple)):
+        # including Tree objects
+        return type(obj)(copy_result(item, conn) for item in obj)
+    return obj
+
+
+class MetadataCache(object):
+    """
+    Thread-safe LRU cache of responses to metadata requests (see
+    ``CACHED_COMMANDS``), used by ``Connection.send_rcv``. Entries expire
+    after ``ttl`` seconds, so changes made by other clients become visible
+    eventually. Writes of the client itself invalidate the affected entries
+    immediately.
+
+    The same cache can be shared by several connections, e.g., by passing it
+    to a ``ConnectionPool``.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        """
+        Args:
+            maxsize: maximum number of cached responses
+            ttl: time to live (seconds) of cached responses
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # key => (expiry time, result), least recently used first
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        Returns a dict with the number of hits, misses and cached entries
+        """
+        return {"hits": self.hits, "misses": self.misses,
+                "size": len(self._entries)}
+
+    def key(self, cmd, args):
+        """
+        Returns the cache key of a request, or None if the response cannot
+        be cached.
+        """
+        if cmd not in CACHED_COMMANDS:
+            return None
+        # further arguments, e.g., attribute key(s)
+        options = tuple(sorted(
+            (name, tuple(value) if isinstance(value, list) else value)
+            for name, value in args.items()
+            if name not in (CMD_KW_DB, CMD_KW_PATH)))
+        key = (cmd, args.get(CMD_KW_DB), args.get(CMD_KW_PATH), options)
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def get(self, key, conn=None):
+        """
+        Returns a copy of the cached result, or None. Nodes in the copy are
+        bound to ``conn``.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return copy_result(entry[1], conn)
+
+    def put(self, key, result):
+        """
+        Cache a copy of ``result`` (which the caller may modify)
+        """
+        result = copy_result(result)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, db=None, path=None, commands=None):
+        """
+        Remove entries of file ``db`` (all files if None), node ``path``
+        (all nodes if None) and ``commands`` (all commands if None).
+        """
+        with self._lock:
+            for key in list(self._entries):
+                cmd, key_db, key_path, _ = key
+                if ((db is None or key_db == db)
+                        and (path is None or key_path == path)
+                        and (commands is None or cmd in commands)):
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def invalidate_request(self, cmd, args):
+        """
+        Remove entries that may be outdated by request ``cmd`` (a write of
+        the client).
+        """
+        if cmd in CACHED_COMMANDS or cmd in READ_COMMANDS:
+            return
+        db = args.get(CMD_KW_DB)
+        if cmd in (CMD_ATTRIBUTES_SET, CMD_ATTRIBUTES_UPDATE):
+            self.invalidate(db, args.get(CMD_KW_PATH), ATTRIBUTE_COMMANDS)
+            # trees may include attributes
+            self.invalidate(db, commands=(CMD_GET_TREE,))
+        elif cmd in DATA_WRITE_COMMANDS:
+            self.invalidate(db, commands=(CMD_GET_FILESIZE,))
+        else:
+            # creating groups/datasets, renaming files, batches, unknown
+            # commands etc.
+            self.invalidate(db)
+
+
+class ChunkCache(object):
+    """
+    Thread-safe LRU cache of dataset chunks with a byte budget, used by
+    ``Dataset.read()`` for chunked datasets. Selections are assembled from
+    cached chunks where possible; only missing chunks are requested from
+    the server. Writes of the client invalidate the affected datasets (see
+    ``invalidate_request()``), changes made by other clients are not
+    detected.
+
+    Like ``MetadataCache``, a chunk cache can be shared by several
+    connections, e.g., those of a ``ConnectionPool``.
+    """
+
+    def __init__(self, maxbytes=256 * 1024 * 1024):
+        """
+        Args:
+            maxbytes: maximum total size (bytes) of cached chunks
+        """
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        # (db, path, chunk index) => array, least recently used first
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        Returns a dict with the number of hits, misses, cached chunks and
+        their total size in bytes
+        """
+        return {"hits": self.hits, "misses": self.misses,
+                "size": len(self._entries), "nbytes": self.nbytes}
+
+    def get(self, key):
+        """
+        Returns the cached (read-only) chunk array, or None
+        """
+        with self._lock:
+            arr = self._entries.get(key)
+            if arr is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return arr
+
+    def put(self, key, arr):
+        """
+        Cache chunk ``arr`` (which must not be modified afterwards)
+        """
+        if arr.nbytes > self.maxbytes:
+            return
+        arr.flags.writeable = False
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self._entries[key] = arr
+            self.nbytes += arr.nbytes
+            while self.nbytes > self.maxbytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def invalidate(self, db=None, path=None):
+        """
+        Remove chunks of file ``db`` (all files if None) and dataset
+        ``path`` (all datasets if None).
+        """
+        with self._lock:
+            for key in list(self._entries):
+                key_db, key_path, _ = key
+                if ((db is None or key_db == db)
+                        and (path is None or key_path == path)):
+                    self.nbytes -= self._entries.pop(key).nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def invalidate_request(self, cmd, args):
+        """
+        Remove chunks that may be outdated by request ``cmd`` (a write of
+        the client).
+        """
+        db = args.get(CMD_KW_DB)
+        if cmd in DATA_WRITE_COMMANDS + (CMD_CREATE_DATASET,
+                                         CMD_REQUIRE_DATASET):
+            self.invalidate(db, args.get(CMD_KW_PATH))
+        elif cmd in (CMD_BATCH, CMD_CREATE_DATABASE, CMD_RENAME_DATABASE,
+                     CMD_DELETE_DATABASE):
+            self.invalidate(db)
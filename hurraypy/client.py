@@ -26,22 +26,100 @@
 hurray Python client, connection interface
 """
 
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+import collections
+import io
 import socket
-import struct
 import os
+import threading
+import time
 
 import msgpack
 
-from hurraypy.buffer import Buffer
-from hurraypy.exceptions import (MessageError, DatabaseError, NodeError,
-                                 ServerError)
+from hurraypy.buffer import Buffer, StreamClosedError
+from hurraypy.exceptions import (HurrayError, MessageError, DatabaseError,
+                                 NodeError, ServerError)
+from .cache import ChunkCache, MetadataCache
+from .compression import get_codec
 from .log import log
-from .msgpack_ext import get_decoder, encode
-from .nodes import File, Node
+from .msgpack_ext import get_decoder, packb_iovec, StreamUnpacker
+from .nodes import File, Node, normalize_key
 from .protocol import (CMD_CREATE_DATABASE, CMD_LIST_DATABASES, CMD_KW_STATUS,
                        CMD_KW_DB, CMD_KW_PATH, CMD_KW_OVERWRITE,
                        CMD_USE_DATABASE, CMD_KW_CMD, CMD_KW_ARGS, CMD_KW_DATA,
-                       RESPONSE_DATA, MSG_LEN, PROTOCOL_VER)
+                       CMD_SLICE_DATASET, CMD_ATTRIBUTES_GET, CMD_KW_KEY,
+                       CMD_CREATE_GROUP, CMD_REQUIRE_GROUP,
+                       CMD_CREATE_DATASET, CMD_REQUIRE_DATASET,
+                       CMD_BROADCAST_DATASET, CMD_ATTRIBUTES_SET, CMD_BATCH,
+                       CMD_NEGOTIATE, CMD_KW_FEATURES, CMD_KW_CODEC,
+                       CMD_KW_COMPRESS, RESPONSE_DATA,
+                       CMD_GET_NODE, CMD_GET_KEYS, CMD_CONTAINS, CMD_GET_TREE,
+                       CMD_GET_NODES, CMD_ITER_TREE, CMD_GET_FILESIZE,
+                       CMD_READ_REGIONS, CMD_READ_POINTS, CMD_WRITE_REGIONS,
+                       CMD_WRITE_POINTS, CMD_ATTRIBUTES_CONTAINS,
+                       CMD_ATTRIBUTES_KEYS, CMD_OPEN_HANDLE, CMD_KW_HANDLE,
+                       CMD_ATTRIBUTES_GET_MANY, CMD_ATTRIBUTES_UPDATE,
+                       CMD_RENAME_DATABASE, CMD_DELETE_DATABASE,
+                       PROTOCOL_VER, PROTOCOL_VER_MASK,
+                       PROTOCOL_FEATURE_REQUEST_ID,
+                       PROTOCOL_FEATURE_COMPRESSION, PROTOCOL_CODEC_SHIFT,
+                       PROTOCOL_CODEC_MASK, PROTOCOL_FEATURE_V2,
+                       PROTOCOL_VER_2, PROTOCOL_FLAG_CODEC_MASK, HEADER_V1,
+                       HEADER_V1_REQUEST_ID, HEADER_V2, OPCODES, KEYWORD_IDS,
+                       PROTOCOL_FEATURE_HANDLES)
+from .status_codes import OK, UNKNOWN_COMMAND, INVALID_HANDLE, MISSING_DATA
+
+# commands that can be sent in a batch
+BATCH_COMMANDS = (CMD_CREATE_GROUP, CMD_REQUIRE_GROUP, CMD_CREATE_DATASET,
+                  CMD_REQUIRE_DATASET, CMD_BROADCAST_DATASET,
+                  CMD_WRITE_REGIONS, CMD_WRITE_POINTS, CMD_ATTRIBUTES_SET,
+                  CMD_ATTRIBUTES_UPDATE)
+
+# default maximum size (bytes) of dataset slices transferred in one request
+STREAM_THRESHOLD = 64 * 1024 * 1024
+
+# responses to these commands (typically) contain numpy arrays, which are
+# decoded directly from the socket
+DIRECT_COMMANDS = (CMD_SLICE_DATASET, CMD_READ_REGIONS, CMD_READ_POINTS,
+                   CMD_ATTRIBUTES_GET)
+
+# commands without side effects, which are retried after a reconnect
+IDEMPOTENT_COMMANDS = (CMD_GET_NODE, CMD_GET_NODES, CMD_GET_KEYS,
+                       CMD_CONTAINS, CMD_GET_TREE, CMD_ITER_TREE,
+                       CMD_GET_FILESIZE, CMD_SLICE_DATASET, CMD_READ_REGIONS,
+                       CMD_READ_POINTS, CMD_ATTRIBUTES_GET,
+                       CMD_ATTRIBUTES_CONTAINS, CMD_ATTRIBUTES_KEYS,
+                       CMD_ATTRIBUTES_GET_MANY, CMD_LIST_DATABASES,
+                       CMD_USE_DATABASE)
+
+# commands addressing an existing file or node, which are sent with a
+# session handle instead of file name and path if possible
+HANDLE_COMMANDS = (CMD_GET_NODE, CMD_GET_NODES, CMD_CONTAINS, CMD_GET_KEYS,
+                   CMD_GET_TREE, CMD_ITER_TREE, CMD_GET_FILESIZE,
+                   CMD_SLICE_DATASET, CMD_READ_REGIONS, CMD_READ_POINTS,
+                   CMD_BROADCAST_DATASET, CMD_WRITE_REGIONS,
+                   CMD_WRITE_POINTS, CMD_ATTRIBUTES_GET, CMD_ATTRIBUTES_SET,
+                   CMD_ATTRIBUTES_CONTAINS, CMD_ATTRIBUTES_KEYS,
+                   CMD_ATTRIBUTES_GET_MANY, CMD_ATTRIBUTES_UPDATE)
+
+# maximum number of session handles per connection
+MAX_HANDLES = 1024
+
+# number of requests addressing a node by file name and path after which a
+# session handle is opened for it
+HANDLE_MIN_USES = 2
+
+# default minimum size (bytes) of messages that are compressed
+COMPRESSION_THRESHOLD = 16 * 1024
+
+# maximum delay (seconds) between two connection attempts
+MAX_RETRY_BACKOFF = 2.0
+
+
+class RequestTimeoutError(socket.timeout):
+    """Exception raised when a request does not complete before its
+    deadline. The connection remains usable.
+    """
 
 
 class Connection:
@@ -49,7 +127,11 @@ class Connection:
     Connection to an hfive server and database/file
     """
 
-    def __init__(self, host=None, port=None, udsocket=None, no_delay=True):
+    def __init__(self, host=None, port=None, udsocket=None, no_delay=True,
+                 stream_threshold=None, multiplex=False, retries=3,
+                 retry_backoff=0.05, timeout=None, compression=None,
+                 compression_threshold=None, protocol=1, handles=False,
+                 cache=None, chunk_cache=None):
         """
         Initialize a connection to a hurray server
 
@@ -58,25 +140,80 @@ class Connection:
             port: TCP port
             udsocket: path to unix domain socket
             no_delay: enable
+            stream_threshold: dataset reads and writes larger than this
+                number of bytes are split into multiple requests of at most
+                ``stream_threshold`` bytes each (default: 64 MiB)
+            multiplex: if True and supported by the server, tag requests
+                with ids so that multiple threads can have requests in
+                flight at the same time and responses may arrive out of
+                order. Otherwise, requests are serialized.
+            retries: if the connection is lost, reconnect (with exponential
+                backoff) and retry idempotent requests (see
+                ``IDEMPOTENT_COMMANDS``) up to this many times
+            retry_backoff: delay (seconds) before the first reconnect
+                attempt, doubled for each subsequent attempt
+            timeout: default timeout (seconds) of requests, cf.
+                ``send_rcv()`` (None: wait forever)
+            compression: name of a codec (e.g., "zlib" or "lzma", see
+                ``compression.py``). If supported by the server, messages
+                of at least ``compression_threshold`` bytes (default: 16
+                KiB) are compressed in both directions.
+            compression_threshold: see ``compression``
+            protocol: highest protocol version to use. Version 2 (compact
+                headers and messages with integer opcodes) is negotiated
+                with the server, falling back to version 1.
+            handles: if supported by the server, obtain session handles for
+                nodes that are used repeatedly (``HANDLE_MIN_USES``).
+                Subsequent requests for these nodes send the handle instead
+                of file name and node path, which saves the server looking
+                them up.
+            cache: ``MetadataCache`` for responses to metadata requests
+                (e.g., ``Group.__getitem__``, ``keys()``, attributes), or
+                True to create one with default settings. Disabled by
+                default.
+            chunk_cache: ``ChunkCache`` for chunks of datasets read with
+                ``Dataset.read()``/``__getitem__``, or True to create one
+                with default settings. Disabled by default.
         """
         self._host = host
         self._port = port
+        self._no_delay = no_delay
+        self._multiplex = multiplex
+        self._protocol = protocol
+        self._use_handles = handles
+        self.cache = MetadataCache() if cache is True else cache
+        self.chunk_cache = (ChunkCache() if chunk_cache is True
+                            else chunk_cache)
+        self.stream_threshold = stream_threshold or STREAM_THRESHOLD
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.timeout = timeout
+        if compression is not None:
+            get_codec(compression)  # fail early for unknown codecs
+        self._compression = compression
+        self.compression_threshold = (COMPRESSION_THRESHOLD
+                                      if compression_threshold is None
+                                      else compression_threshold)
         if udsocket:
             self._udsocket = os.path.abspath(os.path.expanduser(udsocket))
         else:
             self._udsocket = None
 
-        if udsocket:
-            self.__socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-            self.__socket.connect(self._udsocket)
-        else:
-            self.__socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            if no_delay:
-                self.__socket.setsockopt(socket.IPPROTO_TCP,
-                                         socket.TCP_NODELAY, 1)
-            self.__socket.connect((host, int(port)))
+        # serializes requests of multiple threads
+        self._lock = threading.RLock()
+
+        # connection-like object that decoded groups/datasets are bound to
+        # (a ``ConnectionPool`` sets this to itself)
+        self.node_conn = self
 
-        self.__buffer = Buffer(self.__socket)
+        # set by close(), prevents reconnects
+        self._shutdown = False
+        # incremented with every (re)connect
+        self._generation = 0
+
+        self._pending_lock = threading.Lock()
+        self._next_request_id = 0
+        self._connect()
 
         parent_self = self
 
@@ -115,9 +252,244 @@ class Connection:
             return ("<Connection (host={}, port={})>"
                     .format(self._host, self._port))
 
+    def _connect(self):
+        """
+        Open the socket and negotiate protocol features. Nodes hold a
+        reference to the ``Connection``, not the socket, so they keep
+        working after a reconnect.
+        """
+        if self._udsocket:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self._udsocket)
+            except BaseException:
+                sock.close()
+                raise
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            if self._no_delay:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            try:
+                sock.connect((self._host, int(self._port)))
+            except BaseException:
+                sock.close()
+                raise
+
+        self.__buffer = Buffer(sock)
+        self._generation += 1
+
+        # protocol features accepted by the server
+        self._features = 0
+        # version field of the last response
+        self._peer_version = None
+
+        # responses owed by the server to interrupted requests, and unread
+        # bytes of an interrupted response; skipped before the next request
+        self._owed = 0
+        self._skip = 0
+
+        # multiplexing: request id => (future, direct, out)
+        self._pending = {}
+        self._reader = None
+        # codec used to compress requests
+        self._codec = None
+        # session handles: (file name, node path) => handle, and number of
+        # requests for nodes without handle (guarded by self._lock)
+        self._handles = {}
+        self._path_uses = {}
+
+        features = 0
+        if self._multiplex:
+            features |= PROTOCOL_FEATURE_REQUEST_ID
+        if self._compression is not None:
+            features |= PROTOCOL_FEATURE_COMPRESSION
+        if self._protocol >= PROTOCOL_VER_2:
+            features |= PROTOCOL_FEATURE_V2
+        if self._use_handles:
+            features |= PROTOCOL_FEATURE_HANDLES
+        if features:
+            accepted = self._negotiate(features)
+            if accepted & PROTOCOL_FEATURE_COMPRESSION:
+                self._codec = get_codec(self._compression)
+            if accepted & PROTOCOL_FEATURE_REQUEST_ID:
+                self._start_reader()
+            elif self._multiplex:
+                log.debug("Server does not support multiplexing")
+
+    def _reconnect(self, generation):
+        """
+        Replace a broken connection, unless another thread already did so
+        (i.e., ``generation`` is outdated). Retries with exponential backoff.
+        """
+        with self._lock:
+            if self._shutdown:
+                raise StreamClosedError("Connection closed")
+            if generation != self._generation and not self.closed():
+                return
+            self.__buffer.close()
+            self._fail_pending(self._pending,
+                               StreamClosedError("Connection lost"))
+            delay = self.retry_backoff
+            for attempt in range(self.retries + 1):
+                try:
+                    self._connect()
+                    log.debug("Reconnected to %r", self)
+                    return
+                except (socket.error, IOError, OSError) as e:
+                    self.__buffer.close()
+                    log.debug("Reconnect failed (attempt %d): %s",
+                              attempt + 1, e)
+                    if attempt == self.retries:
+                        raise
+                time.sleep(delay)
+                delay = min(2 * delay, MAX_RETRY_BACKOFF)
+
     def close(self):
+        self._shutdown = True
+        self.__buffer.close()
+
+    def _abort(self):
+        """
+        Close the socket because the stream is out of sync. Unlike
+        ``close()``, this allows a reconnect.
+        """
         self.__buffer.close()
 
+    def closed(self):
+        """
+        Returns true if the connection has been closed.
+        """
+        return self.__buffer.closed()
+
+    def is_alive(self):
+        """
+        Cheap health check that does not send a request: returns False if
+        the connection has been closed (by either side) or if there is
+        unexpected data on the socket.
+        """
+        if self._reader is not None:
+            return not self.closed() and self._reader.is_alive()
+        with self._lock:
+            if self._owed or self._skip:
+                # pending data is expected, it is skipped before the next
+                # request
+                return not self.closed()
+            return self.__buffer.is_alive()
+
+    @property
+    def multiplexed(self):
+        """
+        True if requests are tagged with request ids
+        """
+        return self._reader is not None
+
+    def _negotiate(self, features):
+        """
+        Ask the server to enable optional protocol ``features`` (bitmask of
+        ``PROTOCOL_FEATURE_*`` constants). Servers that do not know
+        ``CMD_NEGOTIATE`` do not support any features.
+
+        Returns:
+            the features accepted by the server
+        """
+        args = {CMD_KW_FEATURES: features}
+        if features & PROTOCOL_FEATURE_COMPRESSION:
+            args[CMD_KW_CODEC] = self._compression
+        with self._lock:
+            result = self.__send_rcv(CMD_NEGOTIATE, args, None)
+        if result[CMD_KW_STATUS] == UNKNOWN_COMMAND:
+            return 0
+        check_status(result)
+        accepted = self._peer_version & ~PROTOCOL_VER_MASK & features
+        self._features |= accepted
+        log.debug("Negotiated protocol features: 0x%x", accepted)
+
+        return accepted
+
+    def _start_reader(self):
+        self._reader = threading.Thread(target=self._read_responses,
+                                        args=(self.__buffer, self._pending),
+                                        name="hurraypy-reader")
+        self._reader.daemon = True
+        self._reader.start()
+
+    def _read_responses(self, buffer, pending):
+        """
+        Background thread dispatching responses received on ``buffer`` to
+        the requests waiting in ``pending`` (both are replaced on reconnect)
+        """
+        try:
+            while True:
+                codec, request_id, msg_length = self._read_header(buffer)
+                with self._pending_lock:
+                    request = pending.pop(request_id, None)
+                if request is None:
+                    # request was abandoned (e.g., timed out)
+                    buffer.read_into(bytearray(msg_length))
+                    continue
+                future, direct, out = request
+                try:
+                    result = self._read_body(msg_length, direct=direct,
+                                             out=out, buffer=buffer,
+                                             codec=codec)
+                except Exception as e:
+                    future.set_exception(e)
+                    raise
+                future.set_result(result)
+        except BaseException as e:
+            if not buffer.closed():
+                log.debug("Reader thread failed: %s", e)
+            buffer.close()
+            self._fail_pending(pending, StreamClosedError(
+                "Connection closed: {}".format(e)))
+
+    def _fail_pending(self, pending, exc):
+        with self._pending_lock:
+            futures = [future for future, _, _ in pending.values()]
+            pending.clear()
+        for future in futures:
+            if not future.done():
+                future.set_exception(exc)
+
+    def _submit(self, cmd, args, data, out=None, compress=None):
+        """
+        Send a request on a multiplexed connection.
+
+        Returns:
+            ``concurrent.futures.Future`` of the response
+        """
+        future = Future()
+        # the lock only serializes writes, the reader thread does not need it
+        with self._lock:
+            if self.closed():
+                raise StreamClosedError("Connection closed")
+            request_id = self._next_request_id
+            self._next_request_id = (request_id + 1) % 2**32
+            with self._pending_lock:
+                self._pending[request_id] = (future, cmd in DIRECT_COMMANDS,
+                                             out)
+            try:
+                self._send(cmd, args, data, request_id=request_id,
+                           compress=compress)
+            except BaseException:
+                with self._pending_lock:
+                    self._pending.pop(request_id, None)
+                self.__buffer.close()
+                raise
+
+        return future
+
+    def _abandon(self, future):
+        """
+        Forget a request submitted with ``_submit()``, e.g., after a timeout.
+        Its response is skipped by the reader thread.
+        """
+        with self._pending_lock:
+            for request_id, (f, _, _) in list(self._pending.items()):
+                if f is future:
+                    del self._pending[request_id]
+                    break
+
     def create_file(self, name, overwrite=False):
         """
         Create an hdf5 file
@@ -154,62 +526,199 @@ class Connection:
 
         return files
 
-    def _recv(self):
+    def _recv(self, direct=False, out=None):
         """
         Receive and decode message
 
+        Args:
+            direct: if True, decode the message while reading it from the
+                socket, receiving numpy array data directly into its final
+                array (see ``msgpack_ext.StreamUnpacker``)
+            out: optional numpy array the array in the response is written
+                to (implies ``direct``)
+
         Returns:
             Tuple (result, array), where result is a dict and array is either a
             numpy array or None.
         """
-        # read protocol version
-        protocol_ver = self.__buffer.read_bytes(MSG_LEN)
-        protocol_ver = struct.unpack('>I', protocol_ver)[0]
+        codec, _, msg_length = self._read_header()
+
+        buffer = self.__buffer
+        end = buffer.bytes_consumed + msg_length
+        try:
+            return self._read_body(msg_length, direct=direct, out=out,
+                                   codec=codec)
+        except BaseException:
+            # e.g., timeout or KeyboardInterrupt: remember where the message
+            # ends so that the connection can be reused
+            self._skip = end - buffer.bytes_consumed
+            raise
+
+    def _resync(self):
+        """
+        Skip responses (or the rest of a response) to interrupted requests.
+        """
+        buffer = self.__buffer
+        while self._skip or self._owed:
+            if not self._skip:
+                _, _, self._skip = self._read_header()
+                continue
+            start = buffer.bytes_consumed
+            try:
+                buffer.read_into(bytearray(min(self._skip, 65536)))
+            finally:
+                self._skip -= buffer.bytes_consumed - start
 
-        # Read message length (4 bytes) and unpack it into an integer
-        raw_msg_length = self.__buffer.read_bytes(MSG_LEN)
-        msg_length = struct.unpack('>I', raw_msg_length)[0]
-        log.debug("Handle request (Protocol: v%d, Msg size: %d)",
-                  protocol_ver, msg_length)
+    def _read_header(self, buffer=None):
+        """
+        Read frame header
 
-        log.debug("Read total of {} bytes ..."
-                  .format(2 * MSG_LEN + msg_length))
+        Returns:
+            tuple (codec id or 0, request id or None, message length)
+        """
+        buffer = buffer or self.__buffer
+        # Read protocol version, (flags,) request id and message length.
+        # Note that the frame layout depends on the features negotiated so
+        # far (the response to CMD_NEGOTIATE is a plain v1 frame). The
+        # header is read at once, i.e., either completely or not at all.
+        features = self._features
+        if features & PROTOCOL_FEATURE_V2:
+            protocol_ver, flags, request_id, msg_length = HEADER_V2.unpack(
+                buffer.read_bytes(HEADER_V2.size))
+            codec = flags & PROTOCOL_FLAG_CODEC_MASK
+        else:
+            if features & PROTOCOL_FEATURE_REQUEST_ID:
+                protocol_ver, request_id, msg_length = \
+                    HEADER_V1_REQUEST_ID.unpack(
+                        buffer.read_bytes(HEADER_V1_REQUEST_ID.size))
+            else:
+                protocol_ver, msg_length = HEADER_V1.unpack(
+                    buffer.read_bytes(HEADER_V1.size))
+            codec = _codec_id(protocol_ver)
+        if not features & PROTOCOL_FEATURE_REQUEST_ID:
+            request_id = None
+            self._owed -= 1
+        self._peer_version = protocol_ver
+        log.debug("Handle response (Protocol: v%d, Msg size: %d)",
+                  protocol_ver & PROTOCOL_VER_MASK, msg_length)
 
-        msg_data = self.__buffer.read_bytes(msg_length)
+        return codec, request_id, msg_length
 
-        # decode message
-        result = msgpack.unpackb(msg_data, object_hook=get_decoder(self),
-                                 use_list=False, encoding='utf-8')
+    def _read_body(self, msg_length, direct=False, out=None, buffer=None,
+                   codec=0):
+        """
+        Read and decode message body of ``msg_length`` bytes (cf.
+        ``_recv()``), compressed with codec id ``codec`` (0: uncompressed)
+        """
+        buffer = buffer or self.__buffer
+        read_bytes, read_into = buffer.read_bytes, buffer.read_into
+        msg_data = None
+        if codec:
+            compressed = bytearray(msg_length)
+            read_into(compressed)
+            msg_data = get_codec(codec).decompress(compressed)
+            msg_length = len(msg_data)
+            stream = io.BytesIO(msg_data)
+            read_bytes, read_into = stream.read, stream.readinto
+
+        if direct or out is not None:
+            unpacker = StreamUnpacker(read_bytes, read_into,
+                                      object_hook=get_decoder(self.node_conn),
+                                      out=out)
+            result = unpacker.unpack()
+            if unpacker.bytes_read < msg_length:
+                # skip trailing bytes
+                read_into(bytearray(msg_length - unpacker.bytes_read))
+        else:
+            if msg_data is None:
+                # receive the message body in one go into a buffer of known
+                # size
+                msg_data = bytearray(msg_length)
+                read_into(msg_data)
+
+            # decode message
+            result = msgpack.unpackb(msg_data,
+                                     object_hook=get_decoder(self.node_conn),
+                                     use_list=False, encoding='utf-8')
+
+        if self._features & PROTOCOL_FEATURE_V2:
+            # [status, data]
+            result = {CMD_KW_STATUS: result[0], RESPONSE_DATA: result[1]}
 
         # if result contains a Node => set node.conn = self.conn
         # TODO make this cleaner
         if "data" in result and isinstance(result["data"], Node):
-            result["data"].conn = self
+            result["data"].conn = self.node_conn
 
         return result
 
-    def __send_rcv(self, cmd, args, data):
+    def _send(self, cmd, args, data, request_id=None, compress=None):
         """
-        helper for ``send_rcv()``
+        Send a request without waiting for the response
+
+        Args:
+            compress: compress the request (if compression has been
+                negotiated) regardless of its size (True), never (False), or
+                if it is larger than ``compression_threshold`` (None)
         """
-        msg = msgpack.packb({
-            CMD_KW_CMD: cmd,
-            CMD_KW_ARGS: args,
-            CMD_KW_DATA: data
-        }, default=encode, use_bin_type=True)
+        codec = self._codec if compress is not False else None
+        threshold = 0 if compress else self.compression_threshold
+        self.__buffer.writev(pack_request(cmd, args, data,
+                                          features=self._features,
+                                          request_id=request_id,
+                                          codec=codec,
+                                          compression_threshold=threshold,
+                                          compact=bool(self._features
+                                                       & PROTOCOL_FEATURE_V2)))
+        if request_id is None:
+            self._owed += 1
 
-        log.debug("Sending %d bytes...", len(msg))
-        # Prefix message with protocol version
-        rsp = struct.pack('>I', PROTOCOL_VER)
-        # Prefix each message with a 4-byte length (network byte order)
-        rsp += struct.pack('>I', len(msg))
-        rsp += msg
-        self.__buffer.write(rsp)
+    def __send_rcv(self, cmd, args, data, out=None, compress=None):
+        """
+        helper for ``send_rcv()``
+        """
+        self._resync()
+        try:
+            self._send(cmd, args, data, compress=compress)
+        except BaseException:
+            # the request may have been sent partially
+            self._abort()
+            raise
 
         # receive answer from server
-        return self._recv()
+        return self._recv(direct=cmd in DIRECT_COMMANDS, out=out)
+
+    def pipeline(self, max_in_flight=128):
+        """
+        Returns a ``Pipeline`` that sends many requests back-to-back and
+        reads the responses afterwards, i.e., without waiting a full round
+        trip per request::
+
+            >>> with conn.pipeline() as pipe:
+            ...     futures = [pipe.read(dst, i) for i in range(1000)]
+            >>> rows = [f.result() for f in futures]
+
+        Args:
+            max_in_flight: maximum number of requests sent before their
+                responses are read
+        """
+        return Pipeline(self, max_in_flight=max_in_flight)
+
+    def batch(self, h5file):
+        """
+        Returns a ``Batch`` that collects write operations on file
+        ``h5file`` and sends them to the server in a single message::
 
-    def send_rcv(self, cmd, args, h5file=None, data=None):
+            >>> with conn.batch("myfile.h5") as b:
+            ...     grp = b.file.require_group("/mygrp")
+            ...     grp.attrs["unit"] = "m"
+            ...     dst = grp.create_dataset("mydst", data=arr)
+            >>> b.results  # one result (or exception) per operation
+        """
+        return Batch(self, h5file)
+
+    def send_rcv(self, cmd, args, h5file=None, data=None, out=None,
+                 timeout=None, compress=None):
         """
         Process a request to the server
 
@@ -218,38 +727,646 @@ class Connection:
             args: command arguments
             h5file: name / relative path to hdf5 file
             data: numpy array or None
+            out: numpy array the array in the response is written to, or
+                None
+            timeout: maximum number of seconds to wait for the response
+                (default: the connection's ``timeout``)
+            compress: if compression has been negotiated, compress request
+                and response regardless of their size (True) or not at all
+                (False). By default (None), messages are compressed if they
+                are larger than the ``compression_threshold``.
 
         Returns:
             Tuple (result, array)
+
+        Raises:
+            RequestTimeoutError if the request times out. The rest of the
+            response is skipped before the next request, i.e., the
+            connection can still be used.
         """
-        if CMD_KW_DB in args:
-            raise ValueError("{} must not be in argument 'args'"
-                             .format(CMD_KW_DB))
-        else:
-            if h5file is not None:
-                args[CMD_KW_DB] = h5file
+        add_db_arg(args, h5file)
+        chunk_cache = self.chunk_cache
+        if chunk_cache is None:
+            return self._send_rcv_cached(cmd, args, data, out, timeout,
+                                         compress)
+        try:
+            return self._send_rcv_cached(cmd, args, data, out, timeout,
+                                         compress)
+        finally:
+            chunk_cache.invalidate_request(cmd, args)
+
+    def _send_rcv_cached(self, cmd, args, data, out, timeout, compress):
+        """
+        helper for ``send_rcv()``: use the metadata cache
+        """
+        cache = self.cache
+        if cache is None:
+            return self._send_rcv_handle(cmd, args, data, out, timeout,
+                                         compress)
+
+        cache_key = cache.key(cmd, args)
+        if cache_key is None:
+            try:
+                return self._send_rcv_handle(cmd, args, data, out, timeout,
+                                             compress)
+            finally:
+                cache.invalidate_request(cmd, args)
+
+        result = cache.get(cache_key, conn=self.node_conn)
+        if result is None:
+            result = self._send_rcv_handle(cmd, args, data, out, timeout,
+                                           compress)
+            cache.put(cache_key, result)
+
+        return result
+
+    def _invalidate_caches(self, cmd, args):
+        """
+        Remove cached metadata and chunks that may be outdated by request
+        ``cmd`` (for requests not sent with ``send_rcv()``)
+        """
+        if self.cache is not None:
+            self.cache.invalidate_request(cmd, args)
+        if self.chunk_cache is not None:
+            self.chunk_cache.invalidate_request(cmd, args)
+
+    def _send_rcv_handle(self, cmd, args, data, out, timeout, compress):
+        """
+        helper for ``send_rcv()``: use session handles if possible
+        """
+        if not self._features & PROTOCOL_FEATURE_HANDLES:
+            return self._send_rcv(cmd, args, data, out, timeout, compress)
+
+        db = args.get(CMD_KW_DB)
+        if cmd in (CMD_RENAME_DATABASE, CMD_DELETE_DATABASE):
+            self._drop_handles(db)
+        if cmd not in HANDLE_COMMANDS:
+            return self._send_rcv(cmd, args, data, out, timeout, compress)
+
+        key = (db, args.get(CMD_KW_PATH, "/"))
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle is None:
+                # handles are opened lazily, i.e., nodes that are used only
+                # once do not cost an extra round trip
+                uses = self._path_uses.get(key, 0) + 1
+                if len(self._path_uses) >= MAX_HANDLES:
+                    self._path_uses.clear()
+                self._path_uses[key] = uses
+        if handle is None and uses == HANDLE_MIN_USES:
+            handle = self._open_handle(*key)
+        if handle is not None:
+            handle_args = {k: v for k, v in args.items()
+                           if k not in (CMD_KW_DB, CMD_KW_PATH)}
+            handle_args[CMD_KW_HANDLE] = handle
+            try:
+                return self._send_rcv(cmd, handle_args, data, out, timeout,
+                                      compress)
+            except MessageError as e:
+                if e.status != INVALID_HANDLE:
+                    raise
+                # e.g., file renamed by another client or new session after
+                # a reconnect => resend request with file name and path (a
+                # new handle is opened with the next request)
+                with self._lock:
+                    if self._handles.get(key) == handle:
+                        del self._handles[key]
+                    self._path_uses[key] = HANDLE_MIN_USES - 1
 
-        result = self.__send_rcv(cmd, args, data)
+        return self._send_rcv(cmd, args, data, out, timeout, compress)
 
-        status = result[CMD_KW_STATUS]
+    def _open_handle(self, db, path):
+        """
+        Obtain a session handle for node ``path`` in file ``db``
+
+        Returns:
+            the handle or None
+        """
+        with self._lock:
+            if len(self._handles) >= MAX_HANDLES:
+                return None
+        args = {CMD_KW_DB: db, CMD_KW_PATH: path}
+        try:
+            result = self._send_rcv(CMD_OPEN_HANDLE, args, None, None, None,
+                                    None)
+        except HurrayError as e:
+            log.debug("Cannot open handle for %s:%s: %s", db, path, e)
+            return None
+        handle = result[RESPONSE_DATA]
+        with self._lock:
+            self._handles[(db, path)] = handle
+            self._path_uses.pop((db, path), None)
+        return handle
+
+    def _drop_handles(self, db):
+        """
+        Forget all handles of file ``db`` (e.g., before it is renamed)
+        """
+        with self._lock:
+            for key in list(self._handles):
+                if key[0] == db:
+                    del self._handles[key]
+            for key in list(self._path_uses):
+                if key[0] == db:
+                    del self._path_uses[key]
+
+    def _send_rcv(self, cmd, args, data, out, timeout, compress):
+        """
+        helper for ``send_rcv()``: send request (with retries) and check the
+        status of the response
+        """
+        idempotent = cmd in IDEMPOTENT_COMMANDS
+        if timeout is None:
+            timeout = self.timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if compress is not None and self._codec is not None:
+            # tells the server whether to compress the response
+            args[CMD_KW_COMPRESS] = bool(compress)
 
-        # Handle errors
-        if status >= 200:
-            error_msg = result.get(CMD_KW_DATA, "")
-            if 200 <= status < 300:
-                raise MessageError(status, error_msg)
-            elif 300 <= status < 400:
-                raise DatabaseError(status, error_msg)
-            elif 400 <= status < 500:
-                raise NodeError(status, error_msg)
-            elif 500 <= status < 600:
-                raise ServerError(status, error_msg)
+        attempt = 0
+        while True:
+            generation = self._ensure_connected(check_alive=not idempotent)
+            try:
+                result = self._request(cmd, args, data, out, deadline,
+                                       compress=compress)
+                break
+            except (socket.timeout, FutureTimeoutError):
+                raise RequestTimeoutError(
+                    "{} timed out after {} s".format(cmd, timeout))
+            except (socket.error, IOError, OSError) as e:
+                self.__buffer.close()
+                if (not idempotent or self._shutdown
+                        or attempt >= self.retries):
+                    raise
+                attempt += 1
+                log.debug("Retrying %s after connection error: %s", cmd, e)
+                self._reconnect(generation)
+
+        check_status(result)
 
         return result
 
+    def _request(self, cmd, args, data, out, deadline, compress=None):
+        """
+        Send a request and wait for the response until ``deadline`` (a
+        ``time.monotonic()`` value or None)
+        """
+        if self._reader is not None:
+            future = self._submit(cmd, args, data, out=out,
+                                  compress=compress)
+            try:
+                return future.result(timeout=_remaining(deadline))
+            except FutureTimeoutError:
+                self._abandon(future)
+                raise
+
+        if not self._lock.acquire(timeout=_remaining(deadline, -1)):
+            raise socket.timeout("timed out")
+        try:
+            self.__buffer.set_deadline(deadline)
+            try:
+                return self.__send_rcv(cmd, args, data, out=out,
+                                       compress=compress)
+            finally:
+                self.__buffer.set_deadline(None)
+        finally:
+            self._lock.release()
+
+    def _ensure_connected(self, check_alive=False):
+        """
+        Reconnect if the connection has been lost. Before non-idempotent
+        requests (``check_alive=True``), a connection closed by the server
+        is detected without sending anything, so such requests are never
+        sent on a dead socket.
+
+        Returns:
+            the current connection generation
+        """
+        generation = self._generation
+        if self._shutdown:
+            return generation
+        if self.closed():
+            self._reconnect(generation)
+        elif (check_alive and self._reader is None
+              and not (self._owed or self._skip)):
+            with self._lock:
+                alive = self.__buffer.is_alive()
+            if not alive:
+                log.debug("Connection lost, reconnecting")
+                self._reconnect(generation)
+
+        return self._generation
+
+
+class Pipeline(object):
+    """
+    Collects requests and processes them with pipelining: requests are
+    written back-to-back and the responses read in order. Use
+    ``Connection.pipeline()`` to create pipelines.
+    """
+
+    def __init__(self, conn, max_in_flight=128):
+        self._conn = conn
+        self._max_in_flight = max(1, max_in_flight)
+        # (cmd, args, data, out, transform, future)
+        self._requests = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        if type is None:
+            self.execute(raise_on_error=False)
+
+    def __len__(self):
+        return len(self._requests)
+
+    def send_rcv(self, cmd, args, h5file=None, data=None, out=None,
+                 transform=None):
+        """
+        Queue a request (cf. ``Connection.send_rcv``).
+
+        Args:
+            transform: optional callable applied to the result
+
+        Returns:
+            ``concurrent.futures.Future`` that is resolved by ``execute()``
+        """
+        add_db_arg(args, h5file)
+        future = Future()
+        self._requests.append((cmd, args, data, out, transform, future))
+
+        return future
+
+    def read(self, dataset, key=slice(None), out=None):
+        """
+        Queue ``dataset[key]`` (cf. ``Dataset.read``).
+
+        Returns:
+            ``concurrent.futures.Future`` of the numpy array
+        """
+        args = {
+            CMD_KW_PATH: dataset.path,
+            CMD_KW_KEY: normalize_key(key),
+        }
+        return self.send_rcv(CMD_SLICE_DATASET, args, h5file=dataset.h5file,
+                             out=out,
+                             transform=lambda result: result[RESPONSE_DATA])
+
+    def execute(self, raise_on_error=True):
+        """
+        Send all queued requests and read the responses.
+
+        Args:
+            raise_on_error: raise the first error returned by the server
+                (after all responses have been read). Otherwise, errors are
+                returned in the result list.
+
+        Returns:
+            list of results, in the order of the requests
+        """
+        requests, self._requests = self._requests, []
+
+        self._conn._ensure_connected(check_alive=True)
+        try:
+            if self._conn.multiplexed:
+                self._execute_multiplexed(requests)
+            else:
+                self._execute(requests)
+        finally:
+            for cmd, args in (request[:2] for request in requests):
+                self._conn._invalidate_caches(cmd, args)
+
+        results = []
+        for request in requests:
+            future = request[-1]
+            error = future.exception()
+            if error is not None and raise_on_error:
+                raise error
+            results.append(error if error is not None else future.result())
+
+        return results
+
+    def _execute_multiplexed(self, requests):
+        """
+        Pipelining on a multiplexed connection: submit requests, but keep
+        at most ``max_in_flight`` of them outstanding.
+        """
+        in_flight = collections.deque()
+
+        def complete():
+            response, transform, future = in_flight.popleft()
+            try:
+                result = response.result()
+                check_status(result)
+                if transform is not None:
+                    result = transform(result)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+        for cmd, args, data, out, transform, future in requests:
+            if len(in_flight) >= self._max_in_flight:
+                complete()
+            try:
+                response = self._conn._submit(cmd, args, data, out=out)
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            in_flight.append((response, transform, future))
+        while in_flight:
+            complete()
+
+    def _execute(self, requests):
+        """
+        Pipelining on a connection without request ids: write requests and
+        read the responses in order.
+        """
+        pending = collections.deque()
+        conn = self._conn
+
+        def complete():
+            cmd, _, _, out, transform, future = pending.popleft()
+            result = conn._recv(direct=cmd in DIRECT_COMMANDS, out=out)
+            try:
+                check_status(result)
+                if transform is not None:
+                    result = transform(result)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+        with conn._lock:
+            try:
+                conn._resync()
+                for request in requests:
+                    if len(pending) >= self._max_in_flight:
+                        complete()
+                    cmd, args, data = request[:3]
+                    conn._send(cmd, args, data)
+                    pending.append(request)
+                while pending:
+                    complete()
+            except BaseException as e:
+                # responses that have not been read are skipped before the
+                # next request
+                for request in requests:
+                    if not request[-1].done():
+                        request[-1].set_exception(e)
+                raise
+
+
+def pack_request(cmd, args, data, features=0, request_id=None, codec=None,
+                 compression_threshold=0, compact=False):
+    """
+    Serialize a request, including protocol version and length prefix.
+
+    Args:
+        features: negotiated protocol features
+        request_id: request id (only if feature
+            ``PROTOCOL_FEATURE_REQUEST_ID`` has been negotiated)
+        codec: ``compression.Codec`` used to compress messages of at least
+            ``compression_threshold`` bytes (only if feature
+            ``PROTOCOL_FEATURE_COMPRESSION`` has been negotiated)
+        compact: use protocol v2 (only if feature ``PROTOCOL_FEATURE_V2``
+            has been negotiated)
+
+    Returns:
+        list of buffers to be written to the socket. The payload of numpy
+        arrays is referenced, not copied.
+    """
+    if compact:
+        # unknown commands and keywords are sent as strings
+        buffers = packb_iovec([
+            OPCODES.get(cmd, cmd),
+            {KEYWORD_IDS.get(key, key): value
+             for key, value in args.items()},
+            data
+        ])
+    else:
+        buffers = packb_iovec({
+            CMD_KW_CMD: cmd,
+            CMD_KW_ARGS: args,
+            CMD_KW_DATA: data
+        })
+    msg_length = sum(memoryview(b).nbytes for b in buffers)
+
+    codec_id = 0
+    if codec is not None and msg_length >= compression_threshold:
+        compressed = codec.compress(b"".join(buffers))
+        # incompressible data is sent as is
+        if len(compressed) < msg_length:
+            buffers = [compressed]
+            msg_length = len(compressed)
+            codec_id = codec.id
+
+    log.debug("Sending %d bytes...", msg_length)
+    # Prefix message with protocol version and a 4-byte length (network
+    # byte order)
+    if compact:
+        header = HEADER_V2.pack(PROTOCOL_VER_2, codec_id, request_id or 0,
+                                msg_length)
+    else:
+        version = (PROTOCOL_VER | features
+                   | codec_id << PROTOCOL_CODEC_SHIFT)
+        if request_id is not None:
+            header = HEADER_V1_REQUEST_ID.pack(version, request_id,
+                                               msg_length)
+        else:
+            header = HEADER_V1.pack(version, msg_length)
+
+    return [header] + buffers
+
+
+class Batch(object):
+    """
+    Collects operations and sends them as a single ``CMD_BATCH`` message.
+    Use ``Connection.batch()`` to create batches.
+
+    ``Batch`` mimics the connection interface, i.e., operations are
+    recorded by calling the regular ``Group``/``Dataset``/``AttributeManager``
+    API of nodes bound to the batch (e.g., ``batch.file``). Only write
+    operations (``BATCH_COMMANDS``) can be batched. Return values that
+    depend on the server's response (e.g., the ``Dataset`` returned by
+    ``create_dataset()``) are ``concurrent.futures.Future`` objects that are
+    resolved when the batch is sent.
+    """
+
+    # no automatic splitting of large datasets (cf. Dataset.__setitem__)
+    stream_threshold = float("inf")
+
+    def __init__(self, conn, h5file):
+        self._conn = conn
+        self._h5file = h5file
+        # (cmd, args, data, future)
+        self._ops = []
+        self.results = None
+        self.file = File(conn=self, h5file=h5file, path="/")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        if type is None:
+            self.send(raise_on_error=False)
+
+    def __len__(self):
+        return len(self._ops)
+
+    def send_rcv(self, cmd, args, h5file=None, data=None, out=None):
+        """
+        Record an operation (cf. ``Connection.send_rcv``)
+
+        Returns:
+            a placeholder response, whose data is a
+            ``concurrent.futures.Future``
+        """
+        if cmd not in BATCH_COMMANDS:
+            raise ValueError("command '{}' cannot be batched".format(cmd))
+        add_db_arg(args, h5file)
+        future = Future()
+        self._ops.append((cmd, args, data, future))
+
+        return {CMD_KW_STATUS: OK, RESPONSE_DATA: future}
+
+    def send(self, raise_on_error=True):
+        """
+        Send all recorded operations in one message. If the server does not
+        support batches, the operations are sent one by one.
+
+        Args:
+            raise_on_error: raise the first error returned by the server.
+                Otherwise, errors are returned in the result list.
+
+        Returns:
+            list of results (``data`` of each response), in the order of
+            the operations
+        """
+        ops, self._ops = self._ops, []
+        if not ops:
+            self.results = []
+            return self.results
+
+        batch = [{CMD_KW_CMD: cmd, CMD_KW_ARGS: args, CMD_KW_DATA: data}
+                 for cmd, args, data, _ in ops]
+        try:
+            result = self._conn.send_rcv(CMD_BATCH, h5file=self._h5file,
+                                         args={}, data=batch)
+        except MessageError as me:
+            if me.status != UNKNOWN_COMMAND:
+                raise
+            # server does not support batches
+            results = [self._send_op(cmd, args, data)
+                       for cmd, args, data, _ in ops]
+        else:
+            responses = result[RESPONSE_DATA]
+            if len(responses) != len(ops):
+                error = MessageError(
+                    MISSING_DATA, "{} responses to a batch of {} operations"
+                    .format(len(responses), len(ops)))
+                for _, _, _, future in ops:
+                    future.set_exception(error)
+                self.results = [error] * len(ops)
+                raise error
+            results = [_batch_result(response) for response in responses]
+
+        self.results = results
+        for (_, _, _, future), r in zip(ops, results):
+            if isinstance(r, Exception):
+                future.set_exception(r)
+            else:
+                future.set_result(r)
+
+        if raise_on_error:
+            for r in self.results:
+                if isinstance(r, Exception):
+                    raise r
+
+        return self.results
+
+    def _send_op(self, cmd, args, data):
+        """
+        Send a single recorded operation.
+
+        Returns:
+            the ``data`` of the response or the exception raised
+        """
+        args = dict(args)
+        h5file = args.pop(CMD_KW_DB, None)
+        try:
+            result = self._conn.send_rcv(cmd, args=args, h5file=h5file,
+                                         data=data)
+        except HurrayError as e:
+            return e
+        return result[RESPONSE_DATA]
+
+
+def _batch_result(response):
+    """
+    Returns the ``data`` of a response in a batch or the exception that
+    corresponds to its status
+    """
+    try:
+        check_status(response)
+    except HurrayError as e:
+        return e
+    return response.get(RESPONSE_DATA)
+
+
+def _codec_id(protocol_ver):
+    """
+    Returns the id of the codec a message has been compressed with (0 if
+    it is not compressed)
+    """
+    return (protocol_ver & PROTOCOL_CODEC_MASK) >> PROTOCOL_CODEC_SHIFT
+
+
+def _remaining(deadline, default=None):
+    """
+    Returns the number of seconds until ``deadline`` (a ``time.monotonic()``
+    value), or ``default`` if there is no deadline.
+    """
+    if deadline is None:
+        return default
+    return max(0, deadline - time.monotonic())
+
+
+def add_db_arg(args, h5file):
+    """
+    Add the name of the hdf5 file to the request arguments ``args``.
+    """
+    if CMD_KW_DB in args:
+        raise ValueError("{} must not be in argument 'args'"
+                         .format(CMD_KW_DB))
+    else:
+        if h5file is not None:
+            args[CMD_KW_DB] = h5file
+
+
+def check_status(result):
+    """
+    Raise the appropriate exception if the status of a response indicates an
+    error.
+    """
+    status = result[CMD_KW_STATUS]
+
+    # Handle errors
+    if status >= 200:
+        error_msg = result.get(CMD_KW_DATA, "")
+        if 200 <= status < 300:
+            raise MessageError(status, error_msg)
+        elif 300 <= status < 400:
+            raise DatabaseError(status, error_msg)
+        elif 400 <= status < 500:
+            raise NodeError(status, error_msg)
+        elif 500 <= status < 600:
+            raise ServerError(status, error_msg)
+
 
 # def connect(host='localhost', port=2222, udsocket=None):
-def connect(addr):
+def connect(addr, **kwargs):
     """
     Creates and returns a database connection object.
 
@@ -257,15 +1374,26 @@ def connect(addr):
         addr: either "host:port" or path to a UNIX domain socket. If port is
             omitted, default port ``2222`` is used. Examples:
             "localhost:2222", "~/hurray.sock", "192.168.1.2"
+        kwargs: further arguments passed to ``Connection``
 
     Returns: Connection object
     """
+    return Connection(**dict(parse_addr(addr), **kwargs))
+
+
+def parse_addr(addr):
+    """
+    Parse a server address (cf. ``connect()``).
+
+    Returns:
+        dict with either keys ``host`` and ``port`` or key ``udsocket``
+    """
     if "/" in addr:
-        return Connection(udsocket=addr)
+        return {"udsocket": addr}
     else:
         if ":" in addr:
             host, port = addr.split(":")
             port = int(port)
-            return Connection(host=host, port=port)
+            return {"host": host, "port": port}
         else:
-            return Connection(host=addr, port=2222)
+            return {"host": addr, "port": 2222}
@@ -0,0 +1,84 @@
+# Copyright (c) 2016, Meteotest
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of Meteotest nor the
+#      names of its contributors may be used to endorse or promote products
+#      derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL <COPYRIGHT HOLDER> BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Codecs for compressed message bodies
+
+Codecs are identified by name (negotiated with ``CMD_NEGOTIATE``) and by a
+small integer id, which is stored in the version field of compressed frames.
+Further codecs can be added with ``register_codec()``.
+"""
+
+import collections
+import lzma
+import zlib
+
+Codec = collections.namedtuple("Codec", ["name", "id", "compress",
+                                         "decompress"])
+
+# name => Codec, id => Codec
+_CODECS = {}
+_CODEC_IDS = {}
+
+
+def register_codec(name, codec_id, compress, decompress):
+    """
+    Register a codec.
+
+    Args:
+        name: codec name, must be known to the server as well
+        codec_id: integer in [1, 255]
+        compress: function bytes-like => bytes
+        decompress: function bytes-like => bytes
+    """
+    if not 0 < codec_id < 256:
+        raise ValueError("codec id must be in [1, 255]")
+    codec = Codec(name, codec_id, compress, decompress)
+    _CODECS[name] = codec
+    _CODEC_IDS[codec_id] = codec
+
+
+def get_codec(codec):
+    """
+    Returns the ``Codec`` with the given name or id.
+    """
+    try:
+        if isinstance(codec, int):
+            return _CODEC_IDS[codec]
+        return _CODECS[codec]
+    except KeyError:
+        raise ValueError("Unknown codec: {}".format(codec))
+
+
+def codec_names():
+    """
+    Returns the names of all registered codecs.
+    """
+    return sorted(_CODECS)
+
+
+# zlib with a low compression level is fast enough for high bandwidths
+register_codec("zlib", 1, lambda data: zlib.compress(data, 1),
+               zlib.decompress)
+register_codec("lzma", 2, lzma.compress, lzma.decompress)
@@ -28,20 +28,23 @@ scalars) and slices.
 """
 
 from inspect import isclass
+import struct
 
+import msgpack
 import numpy as np
 from numpy.lib.format import header_data_from_array_1_0
 
 from .nodes import File, Group, Dataset
 from .protocol import (RESPONSE_H5FILE, RESPONSE_NODE_TYPE, NODE_TYPE_GROUP,
                        NODE_TYPE_FILE, NODE_TYPE_DATASET, RESPONSE_NODE_SHAPE,
-                       RESPONSE_NODE_DTYPE, RESPONSE_NODE_PATH)
+                       RESPONSE_NODE_DTYPE, RESPONSE_NODE_PATH,
+                       RESPONSE_NODE_ATTRS, RESPONSE_NODE_CHUNKS)
 
 
 def encode(obj):
     """
-    Encode numpy arrays and slices. Also converts numpy scalars and dtypes
-    to pure Python objects.
+    Encode numpy arrays, slices and Ellipsis. Also converts numpy scalars
+    and dtypes to pure Python objects.
 
     Args:
         obj: object to serialize
@@ -51,27 +54,108 @@ def encode(obj):
     """
     if isinstance(obj, np.ndarray):
         arr = header_data_from_array_1_0(obj)
-        arr['arraydata'] = obj.tostring()
+        # Fortran-ordered arrays (cf. the header) are serialized as such
+        arr['arraydata'] = obj.tobytes(order='A')
         arr['__ndarray__'] = True
         return arr
     elif isinstance(obj, slice):
         return {
             '__slice__': (obj.start, obj.stop, obj.step)
         }
+    elif obj is Ellipsis:
+        return {
+            '__ellipsis__': True
+        }
     elif isclass(obj) and issubclass(obj, np.number):
         # make sure numpy type classes such as np.float64 (used, e.g., as dtype
         # arguments) are serialized to strings
         return obj().dtype.name
     elif isinstance(obj, np.dtype):
         return obj.name
-    elif isinstance(obj, np.number):
+    elif isinstance(obj, (np.number, np.bool_)):
         # convert to Python scalar
-        return np.asscalar(obj)
+        return obj.item()
 
     return obj
 
 
-def get_decoder(connection):
+def _bin_header(length):
+    """
+    msgpack header of a bin object of ``length`` bytes
+    """
+    if length < 2**8:
+        return struct.pack('>BB', 0xc4, length)
+    elif length < 2**16:
+        return struct.pack('>BH', 0xc5, length)
+    else:
+        return struct.pack('>BI', 0xc6, length)
+
+
+def _pack_ndarray(packer, obj):
+    """
+    Pack a C-contiguous numpy array like ``encode()`` does, but return a list
+    of buffers where the array data is a memoryview of ``obj`` instead of a
+    copy.
+    """
+    header = header_data_from_array_1_0(obj)
+    buffers = [packer.pack_map_header(len(header) + 2)]
+    for key, value in header.items():
+        buffers.append(packer.pack(key))
+        buffers.append(packer.pack(value))
+    # a byte view works for all dtypes, even those not supported by the
+    # buffer protocol (e.g., datetime64)
+    arraydata = memoryview(obj.reshape(-1).view(np.uint8))
+    buffers.append(packer.pack('arraydata'))
+    buffers.append(_bin_header(arraydata.nbytes))
+    buffers.append(arraydata)
+    buffers.append(packer.pack('__ndarray__'))
+    buffers.append(packer.pack(True))
+
+    return buffers
+
+
+def packb_iovec(obj):
+    """
+    Serialize ``obj`` like
+    ``msgpack.packb(obj, default=encode, use_bin_type=True)``, but return a
+    list of buffers instead of a single bytes object. The data of
+    C-contiguous numpy arrays that are values of the (top-level) dict ``obj``
+    or elements of the (top-level) list/tuple ``obj`` is referenced, not
+    copied. Concatenating the buffers yields the same bytes as
+    ``msgpack.packb()``.
+
+    Args:
+        obj: object to serialize
+
+    Returns:
+        list of bytes and memoryview objects
+    """
+    packer = msgpack.Packer(default=encode, use_bin_type=True)
+    if isinstance(obj, dict):
+        buffers = [packer.pack_map_header(len(obj))]
+        for key, value in obj.items():
+            buffers.append(packer.pack(key))
+            _pack_value(packer, value, buffers)
+    elif isinstance(obj, (list, tuple)):
+        buffers = [packer.pack_array_header(len(obj))]
+        for value in obj:
+            _pack_value(packer, value, buffers)
+    else:
+        buffers = [packer.pack(obj)]
+
+    return buffers
+
+
+def _pack_value(packer, value, buffers):
+    if (isinstance(value, np.ndarray) and value.flags.c_contiguous
+            and value.dtype != object):
+        buffers.extend(_pack_ndarray(packer, value))
+    else:
+        buffers.append(packer.pack(value))
+
+
+def get_decoder(connection, file_cls=File, group_cls=Group,
+                dataset_cls=Dataset):
     """
     Returns a msgpack decoder function, using ``connection`` to create proper
     ``Group`` and ``Dataset`` objects.
@@ -79,6 +163,7 @@ def get_decoder(connection):
     Args:
         connection: Connection object that is assigned to decoded groups and
             datasets
+        file_cls, group_cls, dataset_cls: classes of decoded nodes
 
     Returns:
         msgpack decoder function
@@ -90,7 +175,8 @@ def get_decoder(connection):
         """
 
         if '__ndarray__' in obj:
-            arr = np.fromstring(obj['arraydata'], dtype=np.dtype(obj['descr']))
+            arr = np.frombuffer(obj['arraydata'],
+                                dtype=np.dtype(obj['descr'])).copy()
             shape = obj[RESPONSE_NODE_SHAPE]
             arr.shape = shape
             if obj['fortran_order']:
@@ -99,24 +185,194 @@ def get_decoder(connection):
             return arr
         elif '__slice__' in obj:
             return slice(*obj['__slice__'])
+        elif '__ellipsis__' in obj:
+            return Ellipsis
         elif (isinstance(obj, dict)
               and obj.get(RESPONSE_NODE_TYPE, None) == NODE_TYPE_GROUP):
             # convert to Group object
-            return Group(conn=connection, h5file=obj[RESPONSE_H5FILE],
-                         path=obj[RESPONSE_NODE_PATH])
+            node = group_cls(conn=connection, h5file=obj[RESPONSE_H5FILE],
+                             path=obj[RESPONSE_NODE_PATH])
         elif (isinstance(obj, dict)
               and obj.get(RESPONSE_NODE_TYPE, None) == NODE_TYPE_FILE):
             # convert to File object
-            return File(conn=connection, h5file=obj[RESPONSE_H5FILE],
-                        path=obj[RESPONSE_NODE_PATH])
+            node = file_cls(conn=connection, h5file=obj[RESPONSE_H5FILE],
+                            path=obj[RESPONSE_NODE_PATH])
         elif (isinstance(obj, dict)
               and obj.get(RESPONSE_NODE_TYPE, None) == NODE_TYPE_DATASET):
             # convert to Dataset object
-            return Dataset(conn=connection, h5file=obj[RESPONSE_H5FILE],
-                           path=obj[RESPONSE_NODE_PATH],
-                           shape=obj[RESPONSE_NODE_SHAPE],
-                           dtype=obj[RESPONSE_NODE_DTYPE])
+            node = dataset_cls(conn=connection,
+                               h5file=obj[RESPONSE_H5FILE],
+                               path=obj[RESPONSE_NODE_PATH],
+                               shape=obj[RESPONSE_NODE_SHAPE],
+                               dtype=obj[RESPONSE_NODE_DTYPE],
+                               chunks=obj.get(RESPONSE_NODE_CHUNKS))
+        else:
+            return obj
 
-        return obj
+        # attribute summary inlined by the server (cf. Group.tree())
+        summary = obj.get(RESPONSE_NODE_ATTRS)
+        if summary is not None and hasattr(node.attrs, '_set_summary'):
+            node.attrs._set_summary(summary)
+        return node
 
     return decode
+
+
+class StreamUnpacker(object):
+    """
+    Minimal msgpack decoder that reads directly from a stream. The data of
+    serialized numpy arrays (cf. ``encode()``) is received straight into a
+    freshly allocated array (or into ``out``), i.e., without intermediate
+    copies. Other objects are decoded like
+    ``msgpack.unpackb(..., use_list=False, encoding='utf-8')``.
+    """
+
+    def __init__(self, read_bytes, read_into, object_hook=None, out=None):
+        """
+        Args:
+            read_bytes: callable ``read_bytes(num_bytes) -> bytes``
+            read_into: callable ``read_into(buf)`` filling a writable buffer
+            object_hook: called with every decoded dict (except for numpy
+                arrays, which are decoded by the unpacker itself)
+            out: optional numpy array the first decoded array is written to
+        """
+        self._read_bytes = read_bytes
+        self._read_into = read_into
+        self._object_hook = object_hook
+        self._out = out
+        # total number of bytes consumed
+        self.bytes_read = 0
+
+    def _read(self, num_bytes):
+        self.bytes_read += num_bytes
+        return self._read_bytes(num_bytes)
+
+    def _unpack_from(self, fmt, num_bytes):
+        return struct.unpack(fmt, self._read(num_bytes))[0]
+
+    def unpack(self):
+        """
+        Read and return one object from the stream.
+        """
+        b = self._read(1)[0]
+        if b <= 0x7f:  # positive fixint
+            return b
+        elif b >= 0xe0:  # negative fixint
+            return b - 0x100
+        elif 0x80 <= b <= 0x8f:
+            return self._unpack_map(b & 0x0f)
+        elif 0x90 <= b <= 0x9f:
+            return self._unpack_array(b & 0x0f)
+        elif 0xa0 <= b <= 0xbf:
+            return self._read(b & 0x1f).decode('utf-8')
+        elif b == 0xc0:
+            return None
+        elif b == 0xc2:
+            return False
+        elif b == 0xc3:
+            return True
+        elif b in (0xc4, 0xc5, 0xc6):
+            return self._read(self._bin_length(b))
+        elif b in (0xc7, 0xc8, 0xc9):
+            length = self._unpack_from(*_EXT_LENGTH[b])
+            code = self._unpack_from('>b', 1)
+            return msgpack.ExtType(code, self._read(length))
+        elif b in _FIXED:
+            return self._unpack_from(*_FIXED[b])
+        elif 0xd4 <= b <= 0xd8:
+            code = self._unpack_from('>b', 1)
+            return msgpack.ExtType(code, self._read(2 ** (b - 0xd4)))
+        elif b in (0xd9, 0xda, 0xdb):
+            length = self._unpack_from(*_STR_LENGTH[b])
+            return self._read(length).decode('utf-8')
+        elif b == 0xdc:
+            return self._unpack_array(self._unpack_from('>H', 2))
+        elif b == 0xdd:
+            return self._unpack_array(self._unpack_from('>I', 4))
+        elif b == 0xde:
+            return self._unpack_map(self._unpack_from('>H', 2))
+        elif b == 0xdf:
+            return self._unpack_map(self._unpack_from('>I', 4))
+        raise ValueError("invalid msgpack type byte 0x{:02x}".format(b))
+
+    def _bin_length(self, b):
+        return self._unpack_from(*_BIN_LENGTH[b])
+
+    def _unpack_array(self, length):
+        return tuple(self.unpack() for _ in range(length))
+
+    def _unpack_map(self, length):
+        obj = {}
+        for _ in range(length):
+            key = self.unpack()
+            if key == 'arraydata' and all(k in obj for k in _ARRAY_HEADER):
+                obj[key] = self._unpack_arraydata(obj)
+            else:
+                obj[key] = self.unpack()
+
+        if '__ndarray__' in obj and isinstance(obj['arraydata'], np.ndarray):
+            arr = obj['arraydata']
+            if obj['fortran_order']:
+                arr = arr.transpose()
+            out, self._out = self._out, None
+            if out is not None and out is not arr:
+                out[...] = arr
+                arr = out
+            return arr
+
+        if self._object_hook is not None:
+            return self._object_hook(obj)
+        return obj
+
+    def _unpack_arraydata(self, header):
+        """
+        Receive array data directly into a numpy array. Returns bytes if
+        the data does not match the array header.
+        """
+        b = self._read(1)[0]
+        if b not in _BIN_LENGTH:
+            raise ValueError("invalid array data type byte 0x{:02x}"
+                             .format(b))
+        num_bytes = self._bin_length(b)
+
+        dtype = np.dtype(header['descr'])
+        shape = tuple(header['shape'])
+        fortran_order = header['fortran_order']
+        if fortran_order:
+            shape = shape[::-1]
+        if num_bytes != dtype.itemsize * int(np.prod(shape)):
+            return self._read(num_bytes)
+
+        out = self._out
+        if out is not None and (out.shape != tuple(header['shape'])
+                                or out.dtype != dtype):
+            # raised before the data is consumed (cf. Connection._recv)
+            raise ValueError(
+                "output array of shape {} and dtype {} does not match the "
+                "received array of shape {} and dtype {}".format(
+                    out.shape, out.dtype, tuple(header['shape']), dtype))
+        if (out is not None and not fortran_order and out.flags.c_contiguous
+                and out.flags.writeable):
+            arr = out
+        else:
+            arr = np.empty(shape, dtype=dtype)
+
+        self.bytes_read += num_bytes
+        if num_bytes:
+            self._read_into(memoryview(arr.reshape(-1).view(np.uint8)))
+
+        return arr
+
+
+# keys of the array header preceding 'arraydata', cf. encode()
+_ARRAY_HEADER = ('descr', 'fortran_order', 'shape')
+
+# lengths and formats of msgpack types (type byte => (format, num_bytes))
+_BIN_LENGTH = {0xc4: ('>B', 1), 0xc5: ('>H', 2), 0xc6: ('>I', 4)}
+_EXT_LENGTH = {0xc7: ('>B', 1), 0xc8: ('>H', 2), 0xc9: ('>I', 4)}
+_STR_LENGTH = {0xd9: ('>B', 1), 0xda: ('>H', 2), 0xdb: ('>I', 4)}
+_FIXED = {
+    0xca: ('>f', 4), 0xcb: ('>d', 8),
+    0xcc: ('>B', 1), 0xcd: ('>H', 2), 0xce: ('>I', 4), 0xcf: ('>Q', 8),
+    0xd0: ('>b', 1), 0xd1: ('>h', 2), 0xd2: ('>i', 4), 0xd3: ('>q', 8),
+}
@@ -26,7 +26,16 @@
 Hdf5 entities (Nodes, Groups, Datasets)
 """
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import copy
+from fnmatch import fnmatchcase
+import itertools
 import os
+import threading
+import time
+
+import numpy as np
 
 from hurraypy.exceptions import NodeError, MessageError
 from hurraypy.protocol import (CMD_GET_NODE, CMD_CONTAINS, CMD_CREATE_DATASET,
@@ -45,11 +54,182 @@ from hurraypy.protocol import (CMD_GET_NODE, CMD_CONTAINS, CMD_CREATE_DATASET,
                                CMD_KW_DB_RENAMETO, CMD_SLICE_DATASET,
                                CMD_BROADCAST_DATASET, CMD_GET_KEYS,
                                CMD_GET_FILESIZE, CMD_GET_TREE,
-                               RESPONSE_NODE_KEYS)
-from hurraypy.status_codes import KEY_ERROR, NODE_NOT_FOUND, INCOMPATIBLE_DATA
+                               RESPONSE_NODE_KEYS, CMD_ATTRIBUTES_GET_MANY,
+                               CMD_ATTRIBUTES_UPDATE, CMD_KW_KEYS,
+                               CMD_KW_ATTRS, CMD_KW_PATHS, CMD_GET_NODES,
+                               CMD_ITER_TREE, CMD_KW_MAX_DEPTH,
+                               CMD_KW_PATTERN, CMD_KW_CURSOR, CMD_KW_LIMIT,
+                               RESPONSE_NODES, RESPONSE_CURSOR,
+                               CMD_READ_REGIONS, CMD_READ_POINTS,
+                               CMD_WRITE_REGIONS, CMD_WRITE_POINTS,
+                               ATTRS_COUNT, ATTRS_KEYS,
+                               ATTRS_VALUES)
+from hurraypy.status_codes import (KEY_ERROR, NODE_NOT_FOUND,
+                                   INCOMPATIBLE_DATA, UNKNOWN_COMMAND)
 from .ipython import (CSS_TREE, ICON_GROUP, ICON_DATASET, ICON_DATASET_ATTRS,
                       ICON_GROUP_ATTRS, IMG_STYLE)
 
+# default number of nodes per response of Group.iter_tree()
+TREE_PAGE_SIZE = 1000
+
+# default size (bytes) of the blocks of Dataset.iter_chunks() if a dataset
+# is not chunked
+ITER_BLOCK_NBYTES = 4 * 1024 * 1024
+
+# Dataset.read_parallel(): size (bytes) of the first piece read by every
+# worker, and transfer time (seconds) subsequent pieces are sized for
+PARALLEL_PIECE_NBYTES = 4 * 1024 * 1024
+PARALLEL_PIECE_SECONDS = 0.25
+
+
+def normalize_key(key):
+    """
+    Prepare a selection for serialization: index lists (and boolean masks)
+    are converted to numpy arrays, which the server applies like h5py does
+    (lists would arrive as tuples). Slices, integers, Ellipsis and arrays
+    are kept.
+
+    Args:
+        key: selection, e.g., ``np.s_[..., [1, 5, 7]]``
+
+    Returns:
+        selection
+    """
+    if isinstance(key, tuple):
+        return tuple(_normalize_index(index) for index in key)
+    return _normalize_index(key)
+
+
+def _normalize_index(index):
+    if isinstance(index, (list, range)):
+        arr = np.asarray(index)
+        if arr.dtype != bool:
+            arr = arr.astype(np.intp)
+        return arr
+    return index
+
+
+def _selection_shape(shape, key):
+    """
+    Return the shape of ``dataset[key]`` for a dataset of shape ``shape``
+    (without allocating memory for basic slicing).
+    """
+    return np.broadcast_to(np.empty((), dtype=np.uint8), shape)[key].shape
+
+
+def _split_selection(shape, key, row_nbytes, max_nbytes):
+    """
+    Split selection ``key`` along its first axis into pieces of at most
+    ``max_nbytes`` bytes.
+
+    Args:
+        shape: dataset shape
+        key: selection (slice or tuple starting with a slice)
+        row_nbytes: size in bytes of one "row" of the selection, i.e., of
+            ``dataset[key][0]``
+        max_nbytes: maximum size of a piece
+
+    Returns:
+        list of tuples ``(dataset_key, selection_key)``, where
+        ``dataset_key`` selects a piece of the dataset and
+        ``selection_key`` the corresponding part of the selection, or None if
+        ``key`` cannot be split.
+    """
+    if not isinstance(key, tuple):
+        key = (key,)
+    if not shape or not key or not isinstance(key[0], slice):
+        return None
+    rows = range(*key[0].indices(shape[0]))
+    if rows.step < 0:
+        return None
+
+    rows_per_piece = max(1, max_nbytes // max(1, row_nbytes))
+    pieces = []
+    for i in range(0, len(rows), rows_per_piece):
+        piece_rows = rows[i:i + rows_per_piece]
+        first = slice(piece_rows.start, piece_rows[-1] + 1, rows.step)
+        pieces.append(((first,) + key[1:],
+                       slice(i, i + len(piece_rows))))
+
+    return pieces
+
+
+def _block_selections(shape, axis, block):
+    """
+    Yields selections (tuples of slices) that split a dataset of shape
+    ``shape`` along ``axis`` into blocks of ``block`` indices.
+    """
+    for start in range(0, shape[axis], block):
+        stop = min(start + block, shape[axis])
+        yield (slice(None),) * axis + (slice(start, stop),)
+
+
+def _aligned_rows(rows, start, num_rows, chunk):
+    """
+    Returns the number of rows of the piece of ``rows`` (a range of dataset
+    indices) starting at ``rows[start]`` that has (about) ``num_rows`` rows
+    and ends at a chunk boundary (if possible).
+    """
+    first = rows[start]
+    end = first + num_rows * rows.step
+    if chunk:
+        aligned = end // chunk * chunk
+        end = aligned if aligned > first else aligned + chunk
+    return len(range(first, min(end, rows.stop), rows.step))
+
+
+def _basic_ranges(shape, key):
+    """
+    Returns a list of tuples ``(range, is_index)``, one per dimension, of
+    the indices selected by ``key``, or None if ``key`` is not a basic
+    selection of integers and slices (with positive steps).
+    """
+    if not isinstance(key, tuple):
+        key = (key,)
+    if len(key) > len(shape):
+        return None
+    key = key + (slice(None),) * (len(shape) - len(key))
+    ranges = []
+    for n, k in zip(shape, key):
+        if isinstance(k, slice):
+            r = range(*k.indices(n))
+            if r.step < 0:
+                return None
+            ranges.append((r, False))
+        elif (isinstance(k, (int, np.integer))
+              and not isinstance(k, (bool, np.bool_))):
+            i = int(k) + n if k < 0 else int(k)
+            if not 0 <= i < n:
+                return None
+            ranges.append((range(i, i + 1), True))
+        else:
+            return None
+
+    return ranges
+
+
+def _check_attrs_option(attrs):
+    """
+    Returns ``attrs`` if it is a valid ``CMD_KW_ATTRS`` option
+    """
+    if attrs not in (ATTRS_COUNT, ATTRS_KEYS, ATTRS_VALUES):
+        raise ValueError("invalid attrs option: {}".format(attrs))
+    return attrs
+
+
+def _walk_tree(tree, max_depth=None, pattern=None):
+    """
+    Yields the nodes of ``tree`` (cf. ``Group.tree()``) in the order of
+    ``Group.iter_tree()``
+    """
+    stack = [(tree, 0)]
+    while stack:
+        (node, children), depth = stack.pop()
+        if pattern is None or fnmatchcase(node.path, pattern):
+            yield node
+        if max_depth is None or depth < max_depth:
+            stack.extend((child, depth + 1) for child in reversed(children))
+
 
 class Node(object):
     """
@@ -78,6 +258,15 @@ class Node(object):
         self._conn = value
         self.attrs.conn = value
 
+    def _copy(self, conn):
+        """
+        Returns a copy of this node bound to ``conn`` (cf. ``MetadataCache``)
+        """
+        node = copy.copy(self)
+        node.attrs = self.attrs._copy(conn)
+        node.conn = conn
+        return node
+
     @property
     def h5file(self):
         return self._h5file
@@ -243,6 +432,20 @@ class Group(Node):
             args[CMD_KW_COMPRESSION_OPTS] = compression_opts
         if fillvalue is not None:
             args[CMD_KW_FILLVALUE] = fillvalue
+
+        stream = (data is not None and isinstance(data, np.ndarray)
+                  and data.nbytes > self.conn.stream_threshold
+                  and shape in (None, data.shape))
+        if stream:
+            # create an empty dataset and write data piece by piece
+            args[CMD_KW_SHAPE] = data.shape
+            args.setdefault(CMD_KW_DTYPE, data.dtype)
+            result = self.conn.send_rcv(CMD_CREATE_DATASET,
+                                        h5file=self.h5file, args=args)
+            dst = result["data"]  # Dataset
+            dst[:] = data
+            return dst
+
         result = self.conn.send_rcv(CMD_CREATE_DATASET, h5file=self.h5file,
                                     args=args, data=data)
 
@@ -314,8 +517,64 @@ class Group(Node):
         return result[RESPONSE_DATA][RESPONSE_NODE_KEYS]
 
     def items(self):
-        for key in self.keys():
-            yield key, self[key]
+        # all children in a single request
+        for node in self._get_nodes(None):
+            yield os.path.basename(node.path), node
+
+    def values(self):
+        for node in self._get_nodes(None):
+            yield node
+
+    def get_many(self, paths, default=None):
+        """
+        Return multiple groups/datasets (in a single request).
+
+        Args:
+            paths: absolute paths or paths relative to this group
+            default: value of nodes that do not exist
+
+        Returns:
+            dict mapping the given paths to ``Group`` or ``Dataset``
+            instances (or ``default``)
+        """
+        paths = list(paths)
+        nodes = self._get_nodes([self._compose_path(p) for p in paths])
+
+        return {path: default if node is None else node
+                for path, node in zip(paths, nodes)}
+
+    def _get_nodes(self, paths):
+        """
+        Returns a list of nodes (None for missing nodes) at ``paths``, or of
+        all children of this group if None
+        """
+        args = {
+            CMD_KW_PATH: self._path,
+        }
+        if paths is not None:
+            args[CMD_KW_PATHS] = paths
+        try:
+            result = self.conn.send_rcv(CMD_GET_NODES, h5file=self.h5file,
+                                        args=args)
+        except MessageError as me:
+            if me.status != UNKNOWN_COMMAND:
+                raise
+            # server does not support multi-node requests
+            if paths is None:
+                return [self[key] for key in self.keys()]
+            return [self.get(path) for path in paths]
+
+        return list(result[RESPONSE_DATA])
+
+    def get(self, name, default=None):
+        """
+        Return the group or dataset ``name``, or ``default`` if it does not
+        exist.
+        """
+        try:
+            return self[name]
+        except KeyError:
+            return default
 
     def __contains__(self, key):
         args = {
@@ -330,7 +589,7 @@ class Group(Node):
     def __delitem__(self, key):
         raise NotImplementedError()
 
-    def visititems(self, func):
+    def visititems(self, func, attrs=None, max_depth=None):
         """
         Recursively visit all objects in this group and subgroups. You have
         to supply a callable with the signature::
@@ -349,51 +608,117 @@ class Group(Node):
             >>> group.visititems(find_foo)
             'some/subgroup/foo'
 
+        Nodes are requested page by page (cf. ``iter_tree()``), i.e.,
+        visiting stops on the server as well.
+
         Args:
             func: callable
+            attrs: attribute information to be included with the visited
+                objects (cf. ``tree()``)
+            max_depth: do not visit nodes deeper than ``max_depth`` levels
+                below this group (None: no limit)
         """
-        # get the whole (sub)tree of nodes from server
-        tree = self.tree()
-
-        # traverse tree recursively
-
-        def traverse(treenode):
-            node, children = treenode
-            func(node.path, node)
-            for child in children:
-                traverse(child)
+        for node in self.iter_tree(max_depth=max_depth, attrs=attrs):
+            value = func(node.path, node)
+            if value is not None:
+                return value
 
-        traverse(tree)
+        return None
 
-    def visit(self, func):
+    def visit(self, func, max_depth=None):
         """
         Like ``visititems()`` but ``func`` expects a callable with just one
         argument::
 
             func(name) -> None or return value
         """
-        tree = self.tree()
+        for node in self.iter_tree(max_depth=max_depth):
+            value = func(node.path)
+            if value is not None:
+                return value
 
-        def traverse(treenode):
-            node, children = treenode
-            func(node.path)
-            for child in children:
-                traverse(child)
+        return None
 
-        traverse(tree)
+    def iter_tree(self, max_depth=None, pattern=None, attrs=None,
+                  page_size=TREE_PAGE_SIZE):
+        """
+        Iterate over this group and all groups and datasets below it (depth
+        first, parents before their children). Nodes are requested in pages
+        of ``page_size`` nodes, so iteration starts before the whole tree
+        has been traversed, and stopping the iteration ends the traversal on
+        the server, too::
+
+            >>> for dst in f.iter_tree(pattern='*/temperature'):
+            ...     print(dst.shape)
+
+        Args:
+            max_depth: maximum depth below this group (0: this group only,
+                None: no limit)
+            pattern: only yield nodes whose path matches this shell-style
+                pattern (cf. ``fnmatch``). Nodes below non-matching groups
+                are still visited.
+            attrs: attribute information to be included with the nodes
+                (cf. ``tree()``)
+            page_size: maximum number of nodes per response
 
-    def tree(self):
+        Returns:
+            generator of ``Group`` and ``Dataset`` instances
+        """
+        args = {
+            CMD_KW_PATH: self._path,
+            CMD_KW_LIMIT: page_size,
+        }
+        if max_depth is not None:
+            args[CMD_KW_MAX_DEPTH] = max_depth
+        if pattern is not None:
+            args[CMD_KW_PATTERN] = pattern
+        if attrs is not None:
+            args[CMD_KW_ATTRS] = _check_attrs_option(attrs)
+
+        cursor = None
+        while True:
+            if cursor is not None:
+                args[CMD_KW_CURSOR] = cursor
+            try:
+                result = self.conn.send_rcv(CMD_ITER_TREE,
+                                            h5file=self.h5file,
+                                            args=dict(args))
+            except MessageError as me:
+                if me.status != UNKNOWN_COMMAND or cursor is not None:
+                    raise
+                # server does not support paged traversal
+                yield from _walk_tree(self.tree(attrs=attrs), max_depth,
+                                      pattern)
+                return
+            page = result[RESPONSE_DATA]
+            yield from page[RESPONSE_NODES]
+            cursor = page[RESPONSE_CURSOR]
+            if cursor is None:
+                return
+
+    def tree(self, attrs=None):
         """
         Return tree data structure consisting of all groups and datasets.
         A tree node is defined recursively as a tuple:
 
             [Dataset/Group, [children]]
 
+        With ``attrs``, the server includes attribute information of every
+        node in its response. ``len(node.attrs)`` (and, depending on
+        ``attrs``, ``node.attrs.keys()`` or attribute values) is then
+        answered from this snapshot without further requests, e.g., when
+        rendering the tree in a notebook.
+
+        Args:
+            attrs: None, ``'count'``, ``'keys'``, or ``'values'``
+
         Returns: list
         """
         args = {
             CMD_KW_PATH: self._path,
         }
+        if attrs is not None:
+            args[CMD_KW_ATTRS] = _check_attrs_option(attrs)
         result = self.conn.send_rcv(CMD_GET_TREE, h5file=self.h5file,
                                     args=args)
         tree = result[RESPONSE_DATA][RESPONSE_NODE_TREE]
@@ -406,11 +731,11 @@ class File(Group):
     File object
     """
 
-    # def __enter__(self):
-    #     return self
+    def __enter__(self):
+        return self
 
-    # def __exit__(self, *args):
-    #     pass
+    def __exit__(self, *args):
+        pass
 
     def _repr_html_(self):
         """ representation in jupyter notebooks """
@@ -494,10 +819,11 @@ class Dataset(Node):
     Wrapper for h5py.Dataset
     """
 
-    def __init__(self, conn, h5file, path, shape, dtype):
+    def __init__(self, conn, h5file, path, shape, dtype, chunks=None):
         Node.__init__(self, conn, h5file, path)
         self.__shape = shape
         self.__dtype = dtype
+        self.__chunks = chunks
 
     def __repr__(self):
         return ("<Dataset {} {} (db={}, path={})>"
@@ -524,20 +850,508 @@ class Dataset(Node):
         Raises:
             IndexError if ``key`` was illegal
         """
+        return self.read(key)
+
+    def read(self, key=slice(None), out=None):
+        """
+        Like ``__getitem__()``, but optionally writes the result into a
+        caller-owned array, which must match shape and dtype of the
+        selection. If ``out`` is C-contiguous, the data is received directly
+        into ``out`` without intermediate copies. If the connection has a
+        ``chunk_cache``, chunked datasets are read through it, i.e., only
+        chunks that are not cached are requested. Example::
+
+            >>> out = np.empty((10, 300), dtype=dst.dtype)
+            >>> dst.read(np.s_[0:10, :], out=out)
+
+        Args:
+            key: key object, e.g., slice() object
+            out: numpy array or None
+
+        Returns:
+            Numpy array (``out`` if specified and the selection is not a
+            scalar)
+
+        Raises:
+            IndexError if ``key`` was illegal, ValueError if ``out`` does not
+            match the selection
+        """
+        key = normalize_key(key)
+        cache = getattr(self.conn, "chunk_cache", None)
+        if cache is not None and self.chunks:
+            result = self._read_cached(cache, key, out)
+            if result is not None:
+                return result
+
+        return self._read(key, out)
+
+    def _read(self, key, out=None):
+        """
+        Read ``self[key]``, split into multiple requests if it is large.
+        """
         # TODO check if dtype corresponds to self.dtype (dataset may have been
         # overwritten in the meantime)
+        pieces = self._split(key, np.dtype(self.dtype).itemsize)
+        if pieces is not None:
+            # large selection => read it piece by piece into one array
+            sel_shape, pieces = pieces
+            if out is None:
+                out = np.empty(sel_shape, dtype=self.dtype)
+            for dst_key, sel_key in pieces:
+                self._slice(dst_key, out=out[sel_key])
+            return out
+
+        return self._slice(key, out=out)
+
+    def _read_cached(self, cache, key, out):
+        """
+        Read ``self[key]`` from the chunks in ``cache`` (a ``ChunkCache``)
+        and request missing chunks from the server.
+
+        Returns:
+            the selection, or None if it cannot be read through the cache
+            (fancy indexing, selections larger than the cache, ...)
+        """
+        shape = tuple(self.shape)
+        chunks = tuple(self.chunks)
+        ranges = _basic_ranges(shape, key)
+        if (ranges is None or len(chunks) != len(shape)
+                or not all(r for r, _ in ranges)):
+            return None
+        sel_shape = tuple(len(r) for r, is_index in ranges if not is_index)
+        if out is not None and out.shape != sel_shape:
+            return None
+        # chunk indices covered by the selection, along each axis
+        spans = [range(r[0] // c, r[-1] // c + 1)
+                 for (r, _), c in zip(ranges, chunks)]
+        chunk_nbytes = np.dtype(self.dtype).itemsize * int(np.prod(chunks))
+        num_chunks = int(np.prod([len(s) for s in spans]))
+        if chunk_nbytes * num_chunks > cache.maxbytes:
+            return None
+
+        prefix = (self.h5file, self.path)
+        found = {}
+        missing = []
+        for idx in itertools.product(*spans):
+            arr = cache.get(prefix + (idx,))
+            if arr is None:
+                missing.append(idx)
+            else:
+                found[idx] = arr
+
+        # request missing chunks: one region per run of chunk rows (along
+        # the first axis) with the same bounding box along the other axes
+        runs = []
+        for first, group in itertools.groupby(missing, lambda idx: idx[0]):
+            group = list(group)
+            box = [(min(idx[d] for idx in group), max(idx[d] for idx in group))
+                   for d in range(1, len(shape))]
+            if runs and runs[-1][0][1] == first - 1 and runs[-1][1:] == box:
+                runs[-1][0] = (runs[-1][0][0], first)
+            else:
+                runs.append([(first, first)] + box)
+        for bounds in runs:
+            region = tuple(slice(lo * c, min((hi + 1) * c, n))
+                           for (lo, hi), c, n in zip(bounds, chunks, shape))
+            data = self._read(region)
+            for idx in itertools.product(*(range(lo, hi + 1)
+                                           for lo, hi in bounds)):
+                sub = tuple(slice((i - lo) * c, (i - lo + 1) * c)
+                            for i, (lo, _), c in zip(idx, bounds, chunks))
+                arr = data[sub].copy()
+                cache.put(prefix + (idx,), arr)
+                found[idx] = arr
+
+        # assemble the selection
+        if out is None:
+            out = np.empty(sel_shape, dtype=self.dtype)
+        for idx, arr in found.items():
+            src, dst = [], []
+            for (r, is_index), i, c in zip(ranges, idx, chunks):
+                lo = i * c
+                # positions in r of the indices within this chunk
+                start = max(0, -(-(lo - r.start) // r.step))
+                stop = min(len(r), -(-(lo + c - r.start) // r.step))
+                if start >= stop:
+                    break
+                if is_index:
+                    src.append(r.start - lo)
+                else:
+                    src.append(slice(r[start] - lo, r[stop - 1] - lo + 1,
+                                     r.step))
+                    dst.append(slice(start, stop))
+            else:
+                out[tuple(dst)] = arr[tuple(src)]
+
+        return out if sel_shape else out[()]
+
+    def read_regions(self, keys):
+        """
+        Read multiple selections (hyperslabs, index lists, ...) in a single
+        request::
+
+            >>> first, last = dst.read_regions([np.s_[0:10], np.s_[-10:]])
+
+        Args:
+            keys: list of selections
+
+        Returns:
+            list of numpy arrays (or scalars), one per selection
+        """
+        keys = [normalize_key(key) for key in keys]
+        if not keys:
+            return []
+        args = {
+            CMD_KW_PATH: self.path,
+            CMD_KW_KEYS: keys,
+        }
+        try:
+            result = self.conn.send_rcv(CMD_READ_REGIONS, h5file=self.h5file,
+                                        args=args)
+        except MessageError as me:
+            if me.status != UNKNOWN_COMMAND:
+                raise
+            # server does not support multi-region reads
+            return [self.read(key) for key in keys]
+
+        return list(result[RESPONSE_DATA])
+
+    def read_points(self, coords):
+        """
+        Read the elements at the given coordinates (a point selection, cf.
+        h5py) in a single request::
+
+            >>> values = dst.read_points([(0, 3), (10, 7), (42, 0)])
+
+        Args:
+            coords: array-like of shape (number of points, dataset rank)
+
+        Returns:
+            1-dimensional numpy array
+        """
+        ndim = len(self.shape)
+        coords = np.asarray(coords, dtype=np.intp)
+        if coords.ndim == 1 and ndim == 1:
+            coords = coords[:, np.newaxis]
+        if coords.ndim != 2 or coords.shape[1] != ndim:
+            raise ValueError("coordinates must have shape (n, {})"
+                             .format(ndim))
+        args = {
+            CMD_KW_PATH: self.path,
+        }
+        try:
+            result = self.conn.send_rcv(CMD_READ_POINTS, h5file=self.h5file,
+                                        args=args,
+                                        data=np.ascontiguousarray(coords))
+        except MessageError as me:
+            if me.status != UNKNOWN_COMMAND:
+                raise
+            # read points as (single element) regions
+            values = self.read_regions([tuple(point) for point in coords])
+            return np.array(values, dtype=self.dtype).reshape(len(coords))
+
+        return result[RESPONSE_DATA]
+
+    def write_regions(self, regions):
+        """
+        Write multiple selections in a single request, which the server
+        applies as one write::
+
+            >>> dst.write_regions([(np.s_[0, 0:3], 0), (np.s_[5:7], arr)])
+
+        Args:
+            regions: list of ``(selection, value)`` tuples. Values are
+                broadcast to their selection like in ``dataset[key] = value``.
+        """
+        keys = [normalize_key(key) for key, _ in regions]
+        values = [value for _, value in regions]
+        if not keys:
+            return
+        args = {
+            CMD_KW_PATH: self.path,
+            CMD_KW_KEYS: keys,
+        }
+        try:
+            self.conn.send_rcv(CMD_WRITE_REGIONS, h5file=self.h5file,
+                               args=args, data=values)
+        except MessageError as me:
+            if me.status != UNKNOWN_COMMAND:
+                raise
+            self._write_regions_batch(keys, values)
+
+    def _write_regions_batch(self, keys, values):
+        """
+        Write regions as separate ``CMD_BROADCAST_DATASET`` operations of a
+        batch, or one request per region if the connection (e.g., a
+        ``ConnectionPool``) or the server does not support batches.
+        """
+        if hasattr(self.conn, "batch"):
+            batch = self.conn.batch(self.h5file)
+            dst = Dataset(batch, self.h5file, self.path, self.shape,
+                          self.dtype)
+            for key, value in zip(keys, values):
+                dst[key] = value
+            try:
+                batch.send()
+                return
+            except MessageError as me:
+                if me.status != UNKNOWN_COMMAND:
+                    raise
+        for key, value in zip(keys, values):
+            self[key] = value
+
+    def write_points(self, coords, values):
+        """
+        Write the elements at the given coordinates (a point selection, cf.
+        ``read_points()``) in a single request::
+
+            >>> dst.write_points([(0, 3), (10, 7), (42, 0)], [1, 2, 3])
+
+        Args:
+            coords: array-like of shape (number of points, dataset rank)
+            values: one value per point, or a scalar written to all points
+        """
+        ndim = len(self.shape)
+        coords = np.asarray(coords, dtype=np.intp)
+        if coords.ndim == 1 and ndim == 1:
+            coords = coords[:, np.newaxis]
+        if coords.ndim != 2 or coords.shape[1] != ndim:
+            raise ValueError("coordinates must have shape (n, {})"
+                             .format(ndim))
+        values = np.ascontiguousarray(
+            np.broadcast_to(np.asarray(values, dtype=self.dtype),
+                            (len(coords),)))
+        if not len(coords):
+            return
+        args = {
+            CMD_KW_PATH: self.path,
+        }
+        try:
+            self.conn.send_rcv(CMD_WRITE_POINTS, h5file=self.h5file,
+                               args=args,
+                               data=[np.ascontiguousarray(coords), values])
+        except MessageError as me:
+            if me.status != UNKNOWN_COMMAND:
+                raise
+            # write points as (single element) regions
+            self.write_regions([(tuple(point), value)
+                                for point, value in zip(coords, values)])
+
+    def read_parallel(self, key=slice(None), out=None, workers=None):
+        """
+        Like ``read()``, but the selection is split along its first axis
+        into chunk-aligned pieces, which are read concurrently by
+        ``workers`` threads. This is worthwhile for large selections read
+        through a ``ConnectionPool`` (or a multiplexed connection), where
+        every thread uses its own stream::
+
+            >>> pool = ConnectionPool("localhost:2222", size=8)
+            >>> dst = pool.File("myfile.h5")["/mydataset"]
+            >>> arr = dst.read_parallel(np.s_[0:100000, :])
+
+        Piece sizes adapt to the measured throughput of every stream: each
+        worker sizes its next piece to take about
+        ``PARALLEL_PIECE_SECONDS``. Towards the end, pieces get smaller so
+        that all workers finish at about the same time.
+
+        Args:
+            key: selection; if it does not start with a slice (with a
+                positive step), it is read with ``read()``
+            out: numpy array or None (cf. ``read()``)
+            workers: number of concurrent requests (default: size of the
+                connection pool, 4 otherwise)
+
+        Returns:
+            Numpy array (``out`` if specified)
+        """
+        if workers is None:
+            workers = getattr(self.conn, "size", 4)
+        itemsize = np.dtype(self.dtype).itemsize
+        try:
+            sel_shape = _selection_shape(self.shape, key)
+        except (IndexError, TypeError, ValueError):
+            # let the server report invalid keys
+            return self.read(key, out=out)
+        key = key if isinstance(key, tuple) else (key,)
+        if (workers < 2 or not sel_shape or not key
+                or not isinstance(key[0], slice)):
+            return self.read(key, out=out)
+        rows = range(*key[0].indices(self.shape[0]))
+        if rows.step < 0 or not rows:
+            return self.read(key, out=out)
+
+        if out is None:
+            out = np.empty(sel_shape, dtype=self.dtype)
+        elif out.shape != sel_shape:
+            raise ValueError("out has shape {}, expected {}"
+                             .format(out.shape, sel_shape))
+        row_nbytes = max(1, itemsize * int(np.prod(sel_shape[1:])))
+        chunk = self.chunks[0] if self.chunks else None
+        max_nbytes = self.conn.stream_threshold
+        lock = threading.Lock()
+        position = [0]  # next row to be read
+
+        def worker():
+            nbytes = min(PARALLEL_PIECE_NBYTES, max_nbytes)
+            while True:
+                with lock:
+                    start = position[0]
+                    if start >= len(rows):
+                        return
+                    num_rows = max(1, nbytes // row_nbytes)
+                    # leave some work for the other workers
+                    num_rows = min(num_rows,
+                                   -(-(len(rows) - start) // workers))
+                    num_rows = _aligned_rows(rows, start, num_rows, chunk)
+                    position[0] = start + num_rows
+                piece = rows[start:start + num_rows]
+                dst_key = ((slice(piece.start, piece[-1] + 1, rows.step),)
+                           + key[1:])
+                t0 = time.monotonic()
+                try:
+                    self.read(dst_key, out=out[start:start + num_rows])
+                except BaseException:
+                    # stop the other workers
+                    with lock:
+                        position[0] = len(rows)
+                    raise
+                elapsed = time.monotonic() - t0
+                # size the next piece according to this stream's throughput
+                bandwidth = num_rows * row_nbytes / max(elapsed, 1e-6)
+                nbytes = int(min(max_nbytes,
+                                 bandwidth * PARALLEL_PIECE_SECONDS))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(worker) for _ in range(workers)]
+            for future in futures:
+                future.result()
+
+        return out
+
+    def read_direct(self, dest, source_sel=None, dest_sel=None):
+        """
+        Read ``dataset[source_sel]`` into the existing array
+        ``dest[dest_sel]`` (cf. ``h5py.Dataset.read_direct``). Data is
+        received directly into ``dest`` if the target region is
+        C-contiguous (and has the dataset's dtype); strided targets, e.g.,
+        views into shared memory, are filled in place, too. Example::
+
+            >>> buf = np.empty((10, 300), dtype=dst.dtype)
+            >>> dst.read_direct(buf, np.s_[0:10, :])
+
+        Args:
+            dest: writeable numpy array
+            source_sel: selection of the dataset (default: all)
+            dest_sel: basic selection of ``dest`` (default: all)
+
+        Raises:
+            ValueError if the shapes of the selections differ (other than
+            in dimensions of length 1)
+            TypeError if ``dest_sel`` does not select a view of ``dest``
+        """
+        if source_sel is None:
+            source_sel = slice(None)
+        target = dest if dest_sel is None else dest[dest_sel]
+        if not isinstance(target, np.ndarray) or (
+                target.size and not np.may_share_memory(target, dest)):
+            raise TypeError("dest_sel must select a view of dest (basic "
+                            "slicing)")
+        try:
+            sel_shape = _selection_shape(self.shape, source_sel)
+        except (IndexError, TypeError, ValueError):
+            # let the server report invalid keys
+            sel_shape = target.shape
+        if sel_shape != target.shape:
+            if ([n for n in sel_shape if n != 1]
+                    != [n for n in target.shape if n != 1]):
+                raise ValueError("shape of source selection {} does not "
+                                 "match shape of destination {}"
+                                 .format(sel_shape, target.shape))
+            # only differ in dimensions of length 1 => still a view
+            target = target.reshape(sel_shape)
+
+        result = self.read(source_sel, out=target)
+        if result is not target:
+            # scalar selection
+            target[...] = result
+
+    def write_direct(self, source, source_sel=None, dest_sel=None):
+        """
+        Write ``source[source_sel]`` to ``dataset[dest_sel]`` (cf.
+        ``h5py.Dataset.write_direct``). C-contiguous source regions are
+        sent without intermediate copies.
+
+        Args:
+            source: numpy array
+            source_sel: selection of ``source`` (default: all)
+            dest_sel: selection of the dataset (default: all)
+        """
+        source = np.asarray(source)
+        if source_sel is not None:
+            source = source[source_sel]
+        if dest_sel is None:
+            dest_sel = slice(None)
+        # a single copy of strided sources (instead of one by the
+        # serializer and one by msgpack)
+        self[dest_sel] = np.ascontiguousarray(source)
+
+    def _slice(self, key, out=None):
+        """
+        Read ``self[key]`` in a single request.
+        """
         args = {
             CMD_KW_PATH: self.path,
             CMD_KW_KEY: key
         }
         result = self.conn.send_rcv(CMD_SLICE_DATASET, h5file=self.h5file,
-                                    args=args)
+                                    args=args, out=out)
         return result[RESPONSE_DATA]
 
+    def _split(self, key, itemsize):
+        """
+        Split a selection that is larger than the connection's
+        ``stream_threshold`` into pieces (cf. ``_split_selection()``).
+
+        Returns:
+            tuple ``(selection shape, pieces)`` or None if the selection is
+            small enough or cannot be split.
+        """
+        try:
+            sel_shape = _selection_shape(self.shape, key)
+        except (IndexError, TypeError, ValueError):
+            # let the server report invalid keys
+            return None
+        nbytes = itemsize * int(np.prod(sel_shape))
+        if not sel_shape or nbytes <= self.conn.stream_threshold:
+            return None
+        pieces = _split_selection(self.shape, key, nbytes // sel_shape[0],
+                                  self.conn.stream_threshold)
+        if pieces is None:
+            return None
+
+        return sel_shape, pieces
+
     def __setitem__(self, key, value):
         """
         Broadcasting for datasets. Example: mydataset[0,:] = np.arange(100)
         """
+        key = normalize_key(key)
+        if isinstance(value, np.ndarray):
+            pieces = self._split(key, value.dtype.itemsize)
+            if pieces is not None:
+                # large selection => write it piece by piece
+                sel_shape, pieces = pieces
+                value = np.broadcast_to(value, sel_shape)
+                for dst_key, sel_key in pieces:
+                    self._broadcast(dst_key, value[sel_key])
+                return
+
+        self._broadcast(key, value)
+
+    def _broadcast(self, key, value):
+        """
+        Write ``self[key] = value`` in a single request.
+        """
         args = {
             CMD_KW_PATH: self.path,
             CMD_KW_KEY: key,
@@ -561,6 +1375,79 @@ class Dataset(Node):
         """
         return self.__dtype
 
+    @property
+    def chunks(self):
+        """
+        Returns:
+            chunk shape tuple, or None if the dataset is not chunked (or the
+            server did not report it)
+        """
+        return self.__chunks
+
+    def iter_chunks(self, axis=0, block=None, prefetch=2):
+        """
+        Iterate over the dataset in blocks along ``axis``. Block boundaries
+        are aligned to the dataset's chunks, i.e., no chunk is read twice.
+        While the caller processes a block, the next ``prefetch`` blocks are
+        read in the background::
+
+            >>> for sel, arr in dst.iter_chunks(prefetch=4):
+            ...     total += arr.sum()
+
+        Args:
+            axis: axis along which the dataset is split
+            block: (minimum) number of indices along ``axis`` per block.
+                It is rounded up to a multiple of the chunk shape. By
+                default, a block spans one chunk (or about
+                ``ITER_BLOCK_NBYTES`` bytes if the dataset is not chunked).
+            prefetch: number of blocks that are read ahead (0: read blocks
+                only when they are requested)
+
+        Returns:
+            generator of tuples ``(selection, array)``, where ``selection``
+            is a tuple of slices and ``array`` is ``dataset[selection]``
+        """
+        shape = tuple(self.shape)
+        ndim = len(shape)
+        if not -ndim <= axis < ndim:
+            raise ValueError("invalid axis {} for dataset of shape {}"
+                             .format(axis, shape))
+        axis %= ndim
+
+        chunk = self.chunks[axis] if self.chunks else None
+        if block is None:
+            if chunk is not None:
+                block = chunk
+            else:
+                slab_nbytes = (np.dtype(self.dtype).itemsize
+                               * int(np.prod(shape)) // max(1, shape[axis]))
+                block = ITER_BLOCK_NBYTES // max(1, slab_nbytes)
+        elif chunk is not None:
+            block = -(-block // chunk) * chunk
+        block = max(1, block)
+
+        selections = _block_selections(shape, axis, block)
+        if prefetch <= 0:
+            for sel in selections:
+                yield sel, self.read(sel)
+            return
+
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=prefetch) as executor:
+            try:
+                for sel in selections:
+                    pending.append((sel, executor.submit(self.read, sel)))
+                    if len(pending) > prefetch:
+                        sel, future = pending.popleft()
+                        yield sel, future.result()
+                while pending:
+                    sel, future = pending.popleft()
+                    yield sel, future.result()
+            finally:
+                # iteration stopped early: discard blocks not read yet
+                for _, future in pending:
+                    future.cancel()
+
 
 class AttributeManager(object):
     """
@@ -576,6 +1463,28 @@ class AttributeManager(object):
         self.__conn = conn
         self.__h5file = h5file
         self.__path = path
+        # attribute count, keys, or values inlined into a tree response
+        self.__summary = None
+
+    def _set_summary(self, summary):
+        """
+        Remember attribute information sent along with a tree (cf.
+        ``Group.tree()``). It is discarded as soon as attributes are changed
+        through this object.
+
+        Args:
+            summary: number of attributes, tuple of keys, or dict of values
+        """
+        self.__summary = summary
+
+    def _copy(self, conn):
+        """
+        Returns a copy of this object bound to ``conn`` (cf. ``Node._copy``)
+        """
+        attrs = copy.copy(self)
+        attrs.__summary = copy.deepcopy(self.__summary)
+        attrs.conn = conn
+        return attrs
 
     def __iter__(self):
         # In order to be compatible with h5py, we return a generator.
@@ -598,6 +1507,8 @@ class AttributeManager(object):
         """
         Returns attribute keys (list)
         """
+        if isinstance(self.__summary, (tuple, list, dict)):
+            return list(self.__summary)
         args = {
             CMD_KW_PATH: self.__path,
         }
@@ -606,6 +1517,8 @@ class AttributeManager(object):
         return result[RESPONSE_DATA][RESPONSE_ATTRS_KEYS]
 
     def __contains__(self, key):
+        if isinstance(self.__summary, (tuple, list, dict)):
+            return key in self.__summary
         args = {
             CMD_KW_PATH: self.__path,
             CMD_KW_KEY: key,
@@ -615,6 +1528,8 @@ class AttributeManager(object):
         return result[RESPONSE_DATA][RESPONSE_ATTRS_CONTAINS]
 
     def __len__(self):
+        if isinstance(self.__summary, int):
+            return self.__summary
         return len(self.keys())
 
     def __getitem__(self, key):
@@ -624,6 +1539,8 @@ class AttributeManager(object):
         Returns:
             a primitive object (string, number) or a numpy array.
         """
+        if isinstance(self.__summary, dict) and key in self.__summary:
+            return self.__summary[key]
         args = {
             CMD_KW_PATH: self.__path,
             CMD_KW_KEY: key,
@@ -637,6 +1554,7 @@ class AttributeManager(object):
         Set/overwrite attribute ``key`` with given ``value`` (scalar, string,
         or numpy array).
         """
+        self.__summary = None
         args = {
             CMD_KW_PATH: self.__path,
             CMD_KW_KEY: key,
@@ -656,6 +1574,8 @@ class AttributeManager(object):
             key: attribute key
             defaultvalue: default value to be returned if key is missing
         """
+        if isinstance(self.__summary, dict):
+            return self.__summary.get(key, defaultvalue)
         args = {
             CMD_KW_PATH: self.__path,
             CMD_KW_KEY: key,
@@ -675,9 +1595,76 @@ class AttributeManager(object):
 
     def to_dict(self):
         """
-        Return attributes as dict
+        Return all attributes as dict (in a single request)
         """
-        raise NotImplementedError()
+        if isinstance(self.__summary, dict):
+            return dict(self.__summary)
+        return self._get_many(None)
+
+    def get_many(self, keys, defaultvalue=None):
+        """
+        Return the values of multiple attributes as dict (in a single
+        request).
+
+        Args:
+            keys: attribute keys
+            defaultvalue: value of missing attributes
+        """
+        keys = list(keys)
+        if isinstance(self.__summary, dict):
+            values = self.__summary
+        else:
+            values = self._get_many(keys)
+
+        return {key: values.get(key, defaultvalue) for key in keys}
+
+    def _get_many(self, keys):
+        """
+        Returns a dict with the values of existing attributes ``keys`` (all
+        attributes if None)
+        """
+        args = {
+            CMD_KW_PATH: self.__path,
+        }
+        if keys is not None:
+            args[CMD_KW_KEYS] = keys
+        try:
+            result = self.conn.send_rcv(CMD_ATTRIBUTES_GET_MANY,
+                                        h5file=self.h5file, args=args)
+        except MessageError as me:
+            if me.status != UNKNOWN_COMMAND:
+                raise
+            # server does not support bulk attribute requests
+            missing = object()
+            if keys is None:
+                keys = self.keys()
+            values = ((key, self.get(key, missing)) for key in keys)
+            return {key: value for key, value in values
+                    if value is not missing}
+
+        return dict(result[RESPONSE_DATA])
+
+    def update(self, mapping):
+        """
+        Set/overwrite multiple attributes (in a single request).
+
+        Args:
+            mapping: dict (or iterable of key/value pairs) of attribute
+                keys and values (scalars, strings, or numpy arrays)
+        """
+        mapping = dict(mapping)
+        self.__summary = None
+        args = {
+            CMD_KW_PATH: self.__path,
+        }
+        try:
+            self.conn.send_rcv(CMD_ATTRIBUTES_UPDATE, h5file=self.h5file,
+                               args=args, data=mapping)
+        except MessageError as me:
+            if me.status != UNKNOWN_COMMAND:
+                raise
+            for key, value in mapping.items():
+                self[key] = value
 
 
 class Tree(list):
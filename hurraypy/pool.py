@@ -0,0 +1,266 @@
+# Copyright (c) 2016, Meteotest
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of Meteotest nor the
+#      names of its contributors may be used to endorse or promote products
+#      derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL <COPYRIGHT HOLDER> BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+Thread-safe pool of hurray connections
+"""
+
+import collections
+import contextlib
+import threading
+import time
+
+from hurraypy.client import connect, RequestTimeoutError, STREAM_THRESHOLD
+from hurraypy.exceptions import HurrayError
+from .cache import ChunkCache
+from .log import log
+from .nodes import File
+from .protocol import (CMD_CREATE_DATABASE, CMD_LIST_DATABASES,
+                       CMD_USE_DATABASE, CMD_KW_OVERWRITE, CMD_KW_PATH,
+                       RESPONSE_DATA)
+
+
+class PoolTimeoutError(Exception):
+    """Exception raised when no connection becomes available in time.
+    """
+
+
+class ConnectionPool(object):
+    """
+    Pool of ``Connection`` objects that can be shared by multiple threads.
+
+    Connections are checked out for the duration of a ``with`` block::
+
+        >>> pool = ConnectionPool("localhost:2222", size=8)
+        >>> with pool.connection() as conn:
+        ...     conn.list_files()
+
+    Nested ``connection()`` blocks in the same thread reuse the same
+    connection. The pool itself mimics the ``Connection`` API, i.e.,
+    ``File``, ``Group`` and ``Dataset`` objects obtained from the pool check
+    out a connection for every request and can be used from many threads at
+    once::
+
+        >>> f = pool.File("myfile.h5")
+        >>> dst = f["/mydataset"]  # use dst from any thread
+    """
+
+    def __init__(self, addr, size=4, max_idle=300, timeout=None, **kwargs):
+        """
+        Args:
+            addr: server address, cf. ``connect()``
+            size: maximum number of open connections
+            max_idle: idle connections are closed after ``max_idle``
+                seconds
+            timeout: maximum number of seconds to wait for a free
+                connection (None: wait forever)
+            kwargs: further arguments passed to ``Connection``
+        """
+        if size < 1:
+            raise ValueError("size must be positive")
+        self._addr = addr
+        self._size = size
+        self._max_idle = max_idle
+        self._timeout = timeout
+        self._kwargs = kwargs
+        self.stream_threshold = (kwargs.get("stream_threshold")
+                                 or STREAM_THRESHOLD)
+        # one chunk cache shared by all connections
+        if kwargs.get("chunk_cache") is True:
+            kwargs["chunk_cache"] = ChunkCache()
+        self.chunk_cache = kwargs.get("chunk_cache")
+
+        # idle connections, most recently used last: (conn, last used)
+        self._idle = collections.deque()
+        self._num_connections = 0
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.close()
+
+    def __repr__(self):
+        return ("<ConnectionPool (addr={}, size={})>"
+                .format(self._addr, self._size))
+
+    @property
+    def size(self):
+        """
+        maximum number of open connections
+        """
+        return self._size
+
+    def File(self, h5file, mode="w"):
+        """
+        Open hdf5 file (cf. ``Connection.File``)
+        """
+        self.send_rcv(CMD_USE_DATABASE, h5file=h5file, args={})
+        return File(conn=self, h5file=h5file, path="/")
+
+    def create_file(self, name, overwrite=False):
+        """
+        Create an hdf5 file (cf. ``Connection.create_file``)
+        """
+        args = {
+            CMD_KW_OVERWRITE: overwrite,
+        }
+        self.send_rcv(CMD_CREATE_DATABASE, h5file=name, args=args)
+
+        return File(conn=self, h5file=name, path='/')
+
+    def list_files(self, path=""):
+        """
+        cf. ``Connection.list_files``
+        """
+        args = {
+            CMD_KW_PATH: path,
+        }
+        result = self.send_rcv(CMD_LIST_DATABASES, args=args)
+
+        return result[RESPONSE_DATA]
+
+    def send_rcv(self, cmd, args, h5file=None, data=None, out=None,
+                 timeout=None):
+        """
+        Check out a connection and process a request (cf.
+        ``Connection.send_rcv``)
+        """
+        with self.connection() as conn:
+            return conn.send_rcv(cmd, args, h5file=h5file, data=data,
+                                 out=out, timeout=timeout)
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        Context manager that checks out a connection and returns it to the
+        pool afterwards. Within a thread, nested calls return the same
+        connection.
+        """
+        local = self._local
+        conn = getattr(local, "conn", None)
+        if conn is not None:
+            local.depth += 1
+            try:
+                yield conn
+            finally:
+                local.depth -= 1
+            return
+
+        conn = self._checkout()
+        local.conn = conn
+        local.depth = 1
+        healthy = True
+        try:
+            yield conn
+        except (HurrayError, RequestTimeoutError):
+            # error reported by the server or timeout, the connection is
+            # fine (responses to timed out requests are skipped)
+            raise
+        except BaseException:
+            # connection may be out of sync
+            healthy = False
+            raise
+        finally:
+            local.conn = None
+            local.depth = 0
+            self._checkin(conn, healthy)
+
+    def _checkout(self):
+        deadline = (None if self._timeout is None
+                    else time.monotonic() + self._timeout)
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise ValueError("pool is closed")
+                self._evict_idle()
+                while self._idle:
+                    conn, _ = self._idle.pop()
+                    if conn.is_alive():
+                        return conn
+                    log.debug("Discarding dead connection %s", conn)
+                    self._discard(conn)
+                if self._num_connections < self._size:
+                    # reserve a slot, connect outside the lock
+                    self._num_connections += 1
+                    break
+                remaining = (None if deadline is None
+                             else deadline - time.monotonic())
+                if remaining is not None and remaining <= 0:
+                    raise PoolTimeoutError("no connection available")
+                self._cond.wait(remaining)
+
+        try:
+            conn = connect(self._addr, **self._kwargs)
+        except BaseException:
+            with self._cond:
+                self._num_connections -= 1
+                self._cond.notify()
+            raise
+        conn.node_conn = self
+
+        return conn
+
+    def _checkin(self, conn, healthy=True):
+        with self._cond:
+            if healthy and not self._closed and not conn.closed():
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._discard(conn)
+            self._cond.notify()
+
+    def _discard(self, conn):
+        """
+        Close ``conn`` and free its slot (caller must hold the lock).
+        """
+        conn.close()
+        self._num_connections -= 1
+
+    def _evict_idle(self):
+        """
+        Close connections that have been idle for longer than
+        ``max_idle`` seconds (caller must hold the lock).
+        """
+        if self._max_idle is None:
+            return
+        now = time.monotonic()
+        while self._idle and now - self._idle[0][1] > self._max_idle:
+            conn, _ = self._idle.popleft()
+            log.debug("Closing idle connection %s", conn)
+            self._discard(conn)
+
+    def close(self):
+        """
+        Close all idle connections. Connections that are currently checked
+        out are closed when they are returned.
+        """
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.popleft()
+                self._discard(conn)
+            self._cond.notify_all()
@@ -25,9 +25,44 @@
 
 # note that the hurray server and the client contain the same file
 
+import struct
+
 MSG_LEN = 4
 PROTOCOL_VER = 1
 
+# Optional protocol features, negotiated per connection with CMD_NEGOTIATE.
+# The server reports the features it accepts in the version field of its
+# response (a plain v1 frame). Afterwards, the accepted features are or'ed
+# into the version field of every frame (in both directions).
+PROTOCOL_VER_MASK = 0xff
+# frames carry a 4-byte request id following the version field, responses
+# may arrive out of order
+PROTOCOL_FEATURE_REQUEST_ID = 0x100
+# message bodies may be compressed, the codec id (cf. ``compression.py``)
+# of compressed frames is stored in bits 16-23 of the version field
+PROTOCOL_FEATURE_COMPRESSION = 0x200
+PROTOCOL_CODEC_SHIFT = 16
+PROTOCOL_CODEC_MASK = 0xff << PROTOCOL_CODEC_SHIFT
+# compact protocol v2 (see below)
+PROTOCOL_FEATURE_V2 = 0x400
+# session handles (CMD_OPEN_HANDLE): requests may address a file and node
+# with a handle (CMD_KW_HANDLE) instead of the file name and node path
+PROTOCOL_FEATURE_HANDLES = 0x800
+
+# v1 frame headers: version, [request id,] message length
+HEADER_V1 = struct.Struct('>II')
+HEADER_V1_REQUEST_ID = struct.Struct('>III')
+
+# Protocol v2: frames have a fixed header (version, flags, request id,
+# message length). Requests are msgpack arrays [opcode, args, data], where
+# commands are replaced by ``OPCODES`` and argument names by
+# ``KEYWORD_IDS``. Responses are arrays [status, data]. Request ids are 0
+# unless PROTOCOL_FEATURE_REQUEST_ID has been negotiated.
+PROTOCOL_VER_2 = 2
+HEADER_V2 = struct.Struct('>IIII')
+# flags: codec id of compressed frames
+PROTOCOL_FLAG_CODEC_MASK = 0xff
+
 # command keywords
 CMD_KW_CMD = 'cmd'
 CMD_KW_ARGS = 'args'
@@ -48,6 +83,17 @@ CMD_KW_DB = 'db'
 CMD_KW_DB_RENAMETO = 'db_new_name'
 CMD_KW_OVERWRITE = 'overwrite'
 CMD_KW_STATUS = 'status'
+CMD_KW_FEATURES = 'features'
+CMD_KW_CODEC = 'codec'
+CMD_KW_COMPRESS = 'compress'
+CMD_KW_HANDLE = 'handle'
+CMD_KW_KEYS = 'keys'
+CMD_KW_ATTRS = 'attrs'
+CMD_KW_PATHS = 'paths'
+CMD_KW_MAX_DEPTH = 'max_depth'
+CMD_KW_PATTERN = 'pattern'
+CMD_KW_CURSOR = 'cursor'
+CMD_KW_LIMIT = 'limit'
 
 # commands
 CMD_CREATE_DATABASE = 'create_db'
@@ -60,18 +106,91 @@ CMD_REQUIRE_GROUP = 'require_group'
 CMD_CREATE_DATASET = 'create_dataset'
 CMD_REQUIRE_DATASET = 'require_dataset'
 CMD_GET_NODE = 'get_node'
+CMD_GET_NODES = 'get_nodes'
 CMD_CONTAINS = 'contains'
 CMD_GET_KEYS = 'get_keys'
 CMD_GET_TREE = 'get_tree'
+CMD_ITER_TREE = 'iter_tree'
 CMD_GET_FILESIZE = 'get_filesize'
 CMD_SLICE_DATASET = 'slice_dataset'
+CMD_READ_REGIONS = 'read_regions'
+CMD_READ_POINTS = 'read_points'
+CMD_WRITE_REGIONS = 'write_regions'
+CMD_WRITE_POINTS = 'write_points'
 CMD_BROADCAST_DATASET = 'broadcast_dataset'
+CMD_BATCH = 'batch'
+CMD_NEGOTIATE = 'negotiate'
+CMD_OPEN_HANDLE = 'open_handle'
 
 # attribute commands
 CMD_ATTRIBUTES_GET = 'attrs_getitem'
 CMD_ATTRIBUTES_SET = 'attrs_setitem'
 CMD_ATTRIBUTES_CONTAINS = 'attrs_contains'
 CMD_ATTRIBUTES_KEYS = 'attrs_keys'
+CMD_ATTRIBUTES_GET_MANY = 'attrs_get_many'
+CMD_ATTRIBUTES_UPDATE = 'attrs_update'
+
+# protocol v2 opcodes and keyword ids (only append new entries, the numbers
+# must not change)
+OPCODES = {
+    CMD_CREATE_DATABASE: 1,
+    CMD_RENAME_DATABASE: 2,
+    CMD_DELETE_DATABASE: 3,
+    CMD_USE_DATABASE: 4,
+    CMD_LIST_DATABASES: 5,
+    CMD_CREATE_GROUP: 6,
+    CMD_REQUIRE_GROUP: 7,
+    CMD_CREATE_DATASET: 8,
+    CMD_REQUIRE_DATASET: 9,
+    CMD_GET_NODE: 10,
+    CMD_CONTAINS: 11,
+    CMD_GET_KEYS: 12,
+    CMD_GET_TREE: 13,
+    CMD_GET_FILESIZE: 14,
+    CMD_SLICE_DATASET: 15,
+    CMD_BROADCAST_DATASET: 16,
+    CMD_BATCH: 17,
+    CMD_NEGOTIATE: 18,
+    CMD_ATTRIBUTES_GET: 19,
+    CMD_ATTRIBUTES_SET: 20,
+    CMD_ATTRIBUTES_CONTAINS: 21,
+    CMD_ATTRIBUTES_KEYS: 22,
+    CMD_OPEN_HANDLE: 23,
+    CMD_ATTRIBUTES_GET_MANY: 24,
+    CMD_ATTRIBUTES_UPDATE: 25,
+    CMD_GET_NODES: 26,
+    CMD_ITER_TREE: 27,
+    CMD_READ_REGIONS: 28,
+    CMD_READ_POINTS: 29,
+    CMD_WRITE_REGIONS: 30,
+    CMD_WRITE_POINTS: 31,
+}
+
+KEYWORD_IDS = {
+    CMD_KW_PATH: 1,
+    CMD_KW_SHAPE: 2,
+    CMD_KW_DTYPE: 3,
+    CMD_KW_COMPRESSION: 4,
+    CMD_KW_COMPRESSION_OPTS: 5,
+    CMD_KW_CHUNKS: 6,
+    CMD_KW_FILLVALUE: 7,
+    CMD_KW_REQUIRE_EXACT: 8,
+    CMD_KW_KEY: 9,
+    CMD_KW_DB: 10,
+    CMD_KW_DB_RENAMETO: 11,
+    CMD_KW_OVERWRITE: 12,
+    CMD_KW_FEATURES: 13,
+    CMD_KW_CODEC: 14,
+    CMD_KW_COMPRESS: 15,
+    CMD_KW_HANDLE: 16,
+    CMD_KW_KEYS: 17,
+    CMD_KW_ATTRS: 18,
+    CMD_KW_PATHS: 19,
+    CMD_KW_MAX_DEPTH: 20,
+    CMD_KW_PATTERN: 21,
+    CMD_KW_CURSOR: 22,
+    CMD_KW_LIMIT: 23,
+}
 
 # response keywords etc.
 RESPONSE_H5FILE = 'h5file'
@@ -79,8 +198,16 @@ RESPONSE_NODE_TYPE = 'nodetype'
 RESPONSE_NODE_SHAPE = 'shape'
 RESPONSE_NODE_DTYPE = 'dtype'
 RESPONSE_NODE_PATH = 'nodepath'
+# chunk shape of a dataset (None if it is stored contiguously)
+RESPONSE_NODE_CHUNKS = 'chunks'
 RESPONSE_NODE_KEYS = 'nodekeys'
 RESPONSE_NODE_TREE = 'nodetree'
+# attribute count, keys or values of a node (cf. CMD_KW_ATTRS)
+RESPONSE_NODE_ATTRS = 'attrs'
+# one page of CMD_ITER_TREE: nodes and cursor of the next page (None if
+# the traversal is complete)
+RESPONSE_NODES = 'nodes'
+RESPONSE_CURSOR = 'cursor'
 RESPONSE_ATTRS_CONTAINS = 'contains'
 RESPONSE_ATTRS_KEYS = 'keys'
 RESPONSE_DATA = 'data'
@@ -88,3 +215,9 @@ RESPONSE_DATA = 'data'
 NODE_TYPE_FILE = 'file'
 NODE_TYPE_GROUP = 'group'
 NODE_TYPE_DATASET = 'dataset'
+
+# values of CMD_KW_ATTRS: attribute information included in CMD_GET_TREE
+# responses
+ATTRS_COUNT = 'count'
+ATTRS_KEYS = 'keys'
+ATTRS_VALUES = 'values'
@@ -34,6 +34,7 @@ MISSING_ARGUMENT = 201
 INVALID_ARGUMENT = 202
 MISSING_DATA = 203
 INCOMPATIBLE_DATA = 204  # incompatible shape and/or dtype
+INVALID_HANDLE = 205
 
 # 3xx: Database Error
 FILE_EXISTS = 300
@@ -63,6 +64,7 @@ STATUS_MSGS = {
     INVALID_ARGUMENT: "invalid argument",
     MISSING_DATA: "missing data",
     INCOMPATIBLE_DATA: "incompatible dtype and/or shape ",
+    INVALID_HANDLE: "invalid or expired handle",
 
     FILE_EXISTS: "file already exists",
     FILE_NOT_FOUND: "file not found",
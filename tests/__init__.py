@@ -6,10 +6,64 @@ def get_tests():
 
 
 def full_suite():
+    from .aio import AsyncConnectionTestCase
+    from .buffer import BufferTestCase
+    from .client import (ConnectionTestCase, MultiplexedConnectionTestCase,
+                         ReconnectTestCase, TimeoutTestCase,
+                         CompressedConnectionTestCase,
+                         CompactProtocolTestCase, HandleTestCase,
+                         CachedConnectionTestCase, AttributeTestCase,
+                         TreeTestCase, ChunkCachedConnectionTestCase)
+    from .cache import MetadataCacheTestCase, ChunkCacheTestCase
+    from .compression import CompressionTestCase
     from .msgpack_ext import MsgPackTestCase
     #from .nodes import NodeTestCase
+    from .nodes import SelectionTestCase
+    from .pool import ConnectionPoolTestCase
 
+    aio_suite = unittest.TestLoader().loadTestsFromTestCase(
+        AsyncConnectionTestCase)
+    buffer_suite = unittest.TestLoader().loadTestsFromTestCase(BufferTestCase)
+    client_suite = unittest.TestLoader().loadTestsFromTestCase(
+        ConnectionTestCase)
+    compact_suite = unittest.TestLoader().loadTestsFromTestCase(
+        CompactProtocolTestCase)
+    handle_suite = unittest.TestLoader().loadTestsFromTestCase(
+        HandleTestCase)
+    cached_suite = unittest.TestLoader().loadTestsFromTestCase(
+        CachedConnectionTestCase)
+    cache_suite = unittest.TestLoader().loadTestsFromTestCase(
+        MetadataCacheTestCase)
+    attribute_suite = unittest.TestLoader().loadTestsFromTestCase(
+        AttributeTestCase)
+    tree_suite = unittest.TestLoader().loadTestsFromTestCase(TreeTestCase)
+    chunk_cache_suite = unittest.TestLoader().loadTestsFromTestCase(
+        ChunkCacheTestCase)
+    chunk_cached_suite = unittest.TestLoader().loadTestsFromTestCase(
+        ChunkCachedConnectionTestCase)
+    multiplex_suite = unittest.TestLoader().loadTestsFromTestCase(
+        MultiplexedConnectionTestCase)
+    reconnect_suite = unittest.TestLoader().loadTestsFromTestCase(
+        ReconnectTestCase)
+    timeout_suite = unittest.TestLoader().loadTestsFromTestCase(
+        TimeoutTestCase)
+    compressed_suite = unittest.TestLoader().loadTestsFromTestCase(
+        CompressedConnectionTestCase)
+    compression_suite = unittest.TestLoader().loadTestsFromTestCase(
+        CompressionTestCase)
     msgpack_suite = unittest.TestLoader().loadTestsFromTestCase(MsgPackTestCase)
+    selection_suite = unittest.TestLoader().loadTestsFromTestCase(
+        SelectionTestCase)
+    pool_suite = unittest.TestLoader().loadTestsFromTestCase(
+        ConnectionPoolTestCase)
     #node_suite = unittest.TestLoader().loadTestsFromTestCase(NodeTestCase)
 
-    return unittest.TestSuite([msgpack_suite,])
+    return unittest.TestSuite([aio_suite, buffer_suite, client_suite,
+                               compact_suite, handle_suite, cached_suite,
+                               cache_suite, chunk_cache_suite,
+                               chunk_cached_suite, attribute_suite, tree_suite,
+                               multiplex_suite,
+                               reconnect_suite, timeout_suite,
+                               compressed_suite, compression_suite,
+                               msgpack_suite,
+                               selection_suite, pool_suite])
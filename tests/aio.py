@@ -0,0 +1,155 @@
+import asyncio
+import unittest
+
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from hurraypy import aio
+from hurraypy.exceptions import NodeError
+from hurraypy.protocol import (CMD_USE_DATABASE, CMD_GET_NODE,
+                               CMD_SLICE_DATASET, CMD_ATTRIBUTES_GET,
+                               CMD_ATTRIBUTES_GET_MANY, CMD_KW_KEYS,
+                               CMD_KW_CMD, CMD_KW_ARGS, CMD_KW_PATH,
+                               CMD_KW_KEY, CMD_KW_DB, RESPONSE_H5FILE,
+                               RESPONSE_NODE_TYPE, RESPONSE_NODE_PATH,
+                               RESPONSE_NODE_SHAPE, RESPONSE_NODE_DTYPE,
+                               NODE_TYPE_DATASET, CMD_GET_NODES,
+                               CMD_KW_PATHS, CMD_ITER_TREE, RESPONSE_NODES,
+                               RESPONSE_CURSOR, CMD_ATTRIBUTES_KEYS,
+                               CMD_ATTRIBUTES_SET, CMD_ATTRIBUTES_UPDATE,
+                               CMD_KW_DATA, RESPONSE_ATTRS_KEYS)
+from hurraypy.status_codes import OK, KEY_ERROR, UNKNOWN_COMMAND
+from tests.socket_server import SocketServer
+
+
+class AsyncConnectionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.data = np.arange(1000.0).reshape(100, 10)
+        self.attrs = {'unit': 'm'}
+        # whether the server supports bulk attribute requests
+        self.bulk = True
+        self.requests = []
+        self.server = SocketServer(self.handle)
+
+    def tearDown(self):
+        self.server.close()
+
+    def handle(self, msg):
+        cmd, args = msg[CMD_KW_CMD], msg[CMD_KW_ARGS]
+        self.requests.append(cmd)
+        if (cmd in (CMD_ATTRIBUTES_GET_MANY, CMD_ATTRIBUTES_UPDATE)
+                and not self.bulk):
+            return {'status': UNKNOWN_COMMAND}
+        if cmd == CMD_USE_DATABASE:
+            return {'status': OK}
+        elif cmd == CMD_GET_NODE:
+            return {'status': OK,
+                    'data': self.node(args[CMD_KW_DB], args[CMD_KW_PATH])}
+        elif cmd == CMD_GET_NODES:
+            paths = args.get(CMD_KW_PATHS, ['/data'])
+            return {'status': OK, 'data': [
+                self.node(args[CMD_KW_DB], path) if path == '/data' else None
+                for path in paths]}
+        elif cmd == CMD_ITER_TREE:
+            return {'status': OK, 'data': {
+                RESPONSE_NODES: [self.node(args[CMD_KW_DB], '/data')],
+                RESPONSE_CURSOR: None}}
+        elif cmd == CMD_SLICE_DATASET:
+            return {'status': OK, 'data': self.data[args[CMD_KW_KEY]]}
+        elif cmd == CMD_ATTRIBUTES_GET:
+            if args[CMD_KW_KEY] in self.attrs:
+                return {'status': OK, 'data': self.attrs[args[CMD_KW_KEY]]}
+            return {'status': KEY_ERROR}
+        elif cmd == CMD_ATTRIBUTES_GET_MANY:
+            keys = args.get(CMD_KW_KEYS, list(self.attrs))
+            return {'status': OK, 'data': {k: self.attrs[k] for k in keys
+                                           if k in self.attrs}}
+        elif cmd == CMD_ATTRIBUTES_KEYS:
+            return {'status': OK,
+                    'data': {RESPONSE_ATTRS_KEYS: list(self.attrs)}}
+        elif cmd == CMD_ATTRIBUTES_SET:
+            self.attrs[args[CMD_KW_KEY]] = msg[CMD_KW_DATA]
+            return {'status': OK}
+        elif cmd == CMD_ATTRIBUTES_UPDATE:
+            self.attrs.update(msg[CMD_KW_DATA])
+            return {'status': OK}
+
+    def node(self, db, path):
+        return {
+            RESPONSE_NODE_TYPE: NODE_TYPE_DATASET,
+            RESPONSE_H5FILE: db,
+            RESPONSE_NODE_PATH: path,
+            RESPONSE_NODE_SHAPE: self.data.shape,
+            RESPONSE_NODE_DTYPE: self.data.dtype.name,
+        }
+
+    def test_dataset(self):
+
+        async def run():
+            conn = await aio.connect(self.server.addr, size=4)
+            f = await conn.File('test.h5')
+            dst = await f['/data']
+            self.assertIsInstance(dst, aio.Dataset)
+            self.assertIs(dst.conn, conn)
+
+            results = await asyncio.gather(
+                *[dst.read(np.s_[i:i + 5]) for i in range(50)])
+            for i, arr in enumerate(results):
+                assert_array_equal(arr, self.data[i:i + 5])
+
+            out = np.empty((3, 10))
+            arr = await dst.read(np.s_[0:3], out=out)
+            self.assertIs(arr, out)
+            assert_array_equal(out, self.data[0:3])
+
+            self.assertEqual(await dst.attrs['unit'], 'm')
+            self.assertEqual(await dst.attrs.get('foo', 'bar'), 'bar')
+            with self.assertRaises(NodeError):
+                await dst.attrs['foo']
+            self.assertEqual(await dst.attrs.to_dict(), {'unit': 'm'})
+            self.assertEqual(await dst.attrs.get_many(['unit', 'foo']),
+                             {'unit': 'm', 'foo': None})
+
+            (key, node), = await f.items()
+            self.assertEqual(key, 'data')
+            self.assertIsInstance(node, aio.Dataset)
+            nodes = await f.get_many(['data', 'foo'], default=False)
+            self.assertEqual(nodes['data'].path, '/data')
+            self.assertIs(nodes['foo'], False)
+            self.assertEqual(await f.visititems(lambda name, obj: name),
+                             '/data')
+
+            self.assertLessEqual(conn._num_streams, 4)
+            await conn.close()
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(run())
+        finally:
+            loop.close()
+
+    def test_attributes_fallback(self):
+        self.bulk = False
+
+        async def run():
+            conn = await aio.connect(self.server.addr)
+            f = await conn.File('test.h5')
+            dst = await f['/data']
+            del self.requests[:]
+
+            await dst.attrs.update({'scale': 0.5, 'offset': 1})
+            self.assertEqual(await dst.attrs.to_dict(),
+                             {'unit': 'm', 'scale': 0.5, 'offset': 1})
+            self.assertEqual(await dst.attrs.get_many(['unit', 'foo']),
+                             {'unit': 'm', 'foo': None})
+            await conn.close()
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(run())
+        finally:
+            loop.close()
+        self.assertEqual(self.requests.count('attrs_update'), 1)
+        self.assertEqual(self.requests.count('attrs_setitem'), 2)
+        self.assertEqual(self.requests.count('attrs_get_many'), 2)
@@ -0,0 +1,61 @@
+import socket
+import threading
+import unittest
+
+import numpy as np
+
+from hurraypy.buffer import Buffer, StreamClosedError
+
+
+class BufferTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.sock, self.peer = socket.socketpair()
+        self.buffer = Buffer(self.sock)
+
+    def tearDown(self):
+        self.buffer.close()
+        self.peer.close()
+
+    def test_read_into(self):
+        payload = bytes(range(256)) * 4000
+        sender = threading.Thread(target=self.peer.sendall,
+                                  args=(b'head' + payload,))
+        sender.start()
+
+        # part of the payload is buffered by read_bytes()
+        self.assertEqual(self.buffer.read_bytes(4), b'head')
+
+        buf = bytearray(len(payload))
+        self.assertEqual(self.buffer.read_into(buf), len(payload))
+        self.assertEqual(bytes(buf), payload)
+        sender.join()
+
+    def test_read_into_closed(self):
+        self.peer.sendall(b'abc')
+        self.peer.close()
+
+        with self.assertRaises(StreamClosedError):
+            self.buffer.read_into(bytearray(10))
+
+    def test_read_into_partial_chunk(self):
+        self.peer.sendall(b'0123456789')
+        self.assertEqual(self.buffer.read_bytes(2), b'01')
+
+        # consume only part of the buffered chunk
+        buf = bytearray(3)
+        self.buffer.read_into(buf)
+        self.assertEqual(bytes(buf), b'234')
+        self.assertEqual(self.buffer.read_bytes(5), b'56789')
+
+    def test_writev(self):
+        data = np.arange(100000, dtype='f8')
+        buffers = [b'head', bytearray(b'er'), data]
+        received = bytearray(6 + data.nbytes)
+        receiver = threading.Thread(target=Buffer(self.peer).read_into,
+                                    args=(received,))
+        receiver.start()
+        self.buffer.writev(buffers)
+        receiver.join()
+
+        self.assertEqual(bytes(received), b'header' + data.tobytes())
@@ -0,0 +1,136 @@
+import time
+import unittest
+
+import numpy as np
+
+from hurraypy.cache import ChunkCache, MetadataCache
+from hurraypy.nodes import Dataset
+from hurraypy.protocol import (CMD_GET_NODE, CMD_ATTRIBUTES_GET,
+                               CMD_ATTRIBUTES_SET, CMD_CREATE_GROUP,
+                               CMD_SLICE_DATASET, CMD_KW_DB, CMD_KW_PATH,
+                               CMD_KW_KEY, CMD_GET_TREE, CMD_KW_ATTRS,
+                               CMD_BROADCAST_DATASET, CMD_RENAME_DATABASE,
+                               CMD_WRITE_REGIONS, CMD_WRITE_POINTS)
+
+
+def args(path, key=None, db='f.h5'):
+    result = {CMD_KW_DB: db, CMD_KW_PATH: path}
+    if key is not None:
+        result[CMD_KW_KEY] = key
+    return result
+
+
+class MetadataCacheTestCase(unittest.TestCase):
+    def test_get_put(self):
+        cache = MetadataCache()
+        key = cache.key(CMD_GET_NODE, args('/a'))
+        self.assertIsNone(cache.get(key))
+        cache.put(key, {'status': 100, 'data': np.arange(3)})
+        result = cache.get(key)
+        self.assertEqual(result['data'].tolist(), [0, 1, 2])
+        result['data'][0] = 10  # does not modify the cache
+        self.assertEqual(cache.get(key)['data'][0], 0)
+        self.assertEqual(cache.stats(), {'hits': 2, 'misses': 1, 'size': 1})
+
+        self.assertIsNone(cache.key(CMD_SLICE_DATASET, args('/a', 0)))
+        self.assertIsNone(cache.key(CMD_GET_NODE, args('/a', slice(None))))
+
+        # options are part of the key
+        tree = args('/')
+        counts = dict(tree, **{CMD_KW_ATTRS: 'count'})
+        self.assertNotEqual(cache.key(CMD_GET_TREE, tree),
+                            cache.key(CMD_GET_TREE, counts))
+        cache.put(cache.key(CMD_GET_TREE, counts), {'status': 100})
+        cache.invalidate_request(CMD_ATTRIBUTES_SET, args('/a', 'unit'))
+        self.assertIsNone(cache.get(cache.key(CMD_GET_TREE, counts)))
+
+    def test_copies(self):
+        cache = MetadataCache()
+        key = cache.key(CMD_ATTRIBUTES_GET, args('/a', 'levels'))
+        conn = object()
+        dst = Dataset(conn, 'f.h5', '/a', (10,), 'f8')
+        result = {'status': 100, 'data': {'levels': np.arange(3),
+                                          'nodes': (dst,)}}
+        cache.put(key, result)
+        result['data']['levels'][0] = -1
+        result['data']['unit'] = 'm'
+
+        other = object()
+        first, second = cache.get(key, other), cache.get(key, other)
+        self.assertEqual(sorted(first['data']), ['levels', 'nodes'])
+        self.assertEqual(first['data']['levels'][0], 0)
+        first['data']['levels'][0] = -1
+        self.assertEqual(second['data']['levels'][0], 0)
+
+        node = first['data']['nodes'][0]
+        self.assertIsNot(node, dst)
+        self.assertIsNot(node, second['data']['nodes'][0])
+        self.assertIs(node.conn, other)
+        self.assertIs(node.attrs.conn, other)
+        self.assertEqual((node.path, node.shape), ('/a', (10,)))
+        self.assertIs(dst.conn, conn)
+
+    def test_lru_ttl(self):
+        cache = MetadataCache(maxsize=2, ttl=0.05)
+        keys = [cache.key(CMD_GET_NODE, args(p)) for p in ('/a', '/b', '/c')]
+        cache.put(keys[0], {})
+        cache.put(keys[1], {})
+        cache.get(keys[0])
+        cache.put(keys[2], {})
+        self.assertIsNotNone(cache.get(keys[0]))
+        self.assertIsNone(cache.get(keys[1]))
+        time.sleep(0.06)
+        self.assertIsNone(cache.get(keys[0]))
+        self.assertEqual(len(cache), 1)
+
+    def test_invalidate(self):
+        cache = MetadataCache()
+        node = cache.key(CMD_GET_NODE, args('/a'))
+        attr = cache.key(CMD_ATTRIBUTES_GET, args('/a', 'unit'))
+        other = cache.key(CMD_GET_NODE, args('/a', db='g.h5'))
+        for key in (node, attr, other):
+            cache.put(key, {})
+
+        cache.invalidate_request(CMD_SLICE_DATASET, args('/a', 0))
+        cache.invalidate_request(CMD_WRITE_REGIONS, args('/a'))
+        self.assertEqual(len(cache), 3)
+        cache.invalidate_request(CMD_ATTRIBUTES_SET, args('/a', 'unit'))
+        self.assertIsNone(cache.get(attr))
+        self.assertIsNotNone(cache.get(node))
+        cache.invalidate_request(CMD_CREATE_GROUP, args('/b'))
+        self.assertIsNone(cache.get(node))
+        self.assertIsNotNone(cache.get(other))
+
+
+class ChunkCacheTestCase(unittest.TestCase):
+    def test_budget(self):
+        cache = ChunkCache(maxbytes=3 * 80)
+        for i in range(4):
+            cache.put(('f.h5', '/a', (i,)), np.zeros(10))
+        self.assertEqual(cache.stats(), {'hits': 0, 'misses': 0, 'size': 3,
+                                         'nbytes': 240})
+        self.assertIsNone(cache.get(('f.h5', '/a', (0,))))
+        chunk = cache.get(('f.h5', '/a', (1,)))
+        with self.assertRaises(ValueError):
+            chunk[0] = 1  # read-only
+        # too large
+        cache.put(('f.h5', '/a', (9,)), np.zeros(31))
+        self.assertEqual(len(cache), 3)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_invalidate(self):
+        cache = ChunkCache()
+        for db, path in (('f.h5', '/a'), ('f.h5', '/b'), ('g.h5', '/a')):
+            cache.put((db, path, (0, 0)), np.zeros(5))
+
+        cache.invalidate_request(CMD_BROADCAST_DATASET, args('/a'))
+        self.assertEqual(len(cache), 2)
+        self.assertIsNotNone(cache.get(('g.h5', '/a', (0, 0))))
+        cache.invalidate_request(CMD_WRITE_POINTS, args('/b'))
+        self.assertEqual(len(cache), 1)
+        cache.put(('f.h5', '/b', (0, 0)), np.zeros(5))
+        cache.invalidate_request(CMD_RENAME_DATABASE, args('/', db='g.h5'))
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.nbytes, 40)
+        cache.clear()
+        self.assertEqual((len(cache), cache.nbytes), (0, 0))
@@ -0,0 +1,1047 @@
+from fnmatch import fnmatchcase
+from itertools import islice
+import threading
+import time
+import unittest
+
+import numpy as np
+from numpy.testing import assert_array_equal
+
+import hurraypy as hp
+from hurraypy.client import RequestTimeoutError
+from hurraypy.exceptions import MessageError, NodeError
+from hurraypy.protocol import (CMD_SLICE_DATASET, CMD_BATCH, CMD_GET_NODE,
+                               CMD_CREATE_GROUP, CMD_CREATE_DATASET,
+                               CMD_KW_CMD, CMD_KW_ARGS, CMD_KW_DATA,
+                               CMD_KW_KEY, CMD_KW_PATH, CMD_KW_DB,
+                               RESPONSE_H5FILE,
+                               RESPONSE_NODE_TYPE, RESPONSE_NODE_PATH,
+                               RESPONSE_NODE_SHAPE, RESPONSE_NODE_DTYPE,
+                               NODE_TYPE_DATASET, CMD_BROADCAST_DATASET,
+                               PROTOCOL_FEATURE_REQUEST_ID,
+                               PROTOCOL_FEATURE_COMPRESSION,
+                               PROTOCOL_FEATURE_V2, PROTOCOL_FEATURE_HANDLES,
+                               CMD_ATTRIBUTES_GET, CMD_ATTRIBUTES_SET,
+                               CMD_ATTRIBUTES_KEYS, CMD_ATTRIBUTES_GET_MANY,
+                               CMD_ATTRIBUTES_UPDATE, CMD_KW_KEYS,
+                               RESPONSE_ATTRS_KEYS, CMD_GET_TREE,
+                               CMD_KW_ATTRS, RESPONSE_NODE_TREE,
+                               RESPONSE_NODE_ATTRS, NODE_TYPE_GROUP,
+                               ATTRS_COUNT, ATTRS_KEYS, CMD_GET_NODES,
+                               CMD_GET_KEYS, CMD_KW_PATHS, RESPONSE_NODE_KEYS,
+                               CMD_ITER_TREE, CMD_KW_MAX_DEPTH, CMD_KW_PATTERN,
+                               CMD_KW_CURSOR, CMD_KW_LIMIT, RESPONSE_NODES,
+                               RESPONSE_CURSOR, RESPONSE_NODE_CHUNKS,
+                               CMD_READ_REGIONS, CMD_READ_POINTS,
+                               CMD_WRITE_REGIONS, CMD_WRITE_POINTS)
+from hurraypy.nodes import Dataset, Group
+from hurraypy.status_codes import (OK, TYPE_ERROR, GROUP_EXISTS, KEY_ERROR,
+                                   UNKNOWN_COMMAND, NODE_NOT_FOUND)
+from tests.socket_server import SocketServer
+
+
+class ConnectionTestCase(unittest.TestCase):
+
+    # whether the server supports the multi-region/point commands
+    regions = True
+    # whether the server supports CMD_BATCH
+    batches = True
+    # maximum number of responses to a batch (None: all)
+    batch_limit = None
+
+    def setUp(self):
+        self.data = np.arange(1000.0).reshape(100, 10)
+        self.requests = []
+        self.server = SocketServer(self.handle)
+        self.conn = hp.connect(self.server.addr)
+        self.dst = Dataset(self.conn, 'test.h5', '/data', self.data.shape,
+                           self.data.dtype)
+
+    def tearDown(self):
+        self.conn.close()
+        self.server.close()
+
+    def handle(self, msg):
+        self.requests.append(msg)
+        cmd, args = msg[CMD_KW_CMD], msg[CMD_KW_ARGS]
+        if cmd == CMD_SLICE_DATASET:
+            try:
+                return {'status': OK, 'data': self.data[args[CMD_KW_KEY]]}
+            except IndexError:
+                return {'status': TYPE_ERROR}
+        elif (cmd in (CMD_READ_REGIONS, CMD_READ_POINTS, CMD_WRITE_REGIONS,
+                      CMD_WRITE_POINTS) and not self.regions):
+            return {'status': UNKNOWN_COMMAND}
+        elif cmd == CMD_READ_REGIONS:
+            return {'status': OK,
+                    'data': [self.data[key] for key in args[CMD_KW_KEYS]]}
+        elif cmd == CMD_READ_POINTS:
+            return {'status': OK,
+                    'data': self.data[tuple(msg[CMD_KW_DATA].T)]}
+        elif cmd == CMD_BROADCAST_DATASET:
+            self.data[args[CMD_KW_KEY]] = msg[CMD_KW_DATA]
+        elif cmd == CMD_WRITE_REGIONS:
+            for key, value in zip(args[CMD_KW_KEYS], msg[CMD_KW_DATA]):
+                self.data[key] = value
+        elif cmd == CMD_WRITE_POINTS:
+            coords, values = msg[CMD_KW_DATA]
+            self.data[tuple(coords.T)] = values
+        elif cmd == CMD_BATCH and not self.batches:
+            return {'status': UNKNOWN_COMMAND}
+        elif cmd == CMD_BATCH:
+            responses = [self.handle(op) for op in msg[CMD_KW_DATA]]
+            return {'status': OK, 'data': responses[:self.batch_limit]}
+        elif cmd == CMD_CREATE_GROUP and args[CMD_KW_PATH] == '/exists':
+            return {'status': GROUP_EXISTS}
+        elif cmd in (CMD_GET_NODE, CMD_CREATE_DATASET):
+            return {'status': OK, 'data': {
+                RESPONSE_NODE_TYPE: NODE_TYPE_DATASET,
+                RESPONSE_H5FILE: args[CMD_KW_DB],
+                RESPONSE_NODE_PATH: args[CMD_KW_PATH],
+                RESPONSE_NODE_SHAPE: self.data.shape,
+                RESPONSE_NODE_DTYPE: self.data.dtype.name,
+                RESPONSE_NODE_CHUNKS: (8, 10),
+            }}
+        return {'status': OK, 'data': None}
+
+    def test_fancy_indexing(self):
+        mask = self.data[:, 0] % 30 == 0
+        for key in (np.s_[[1, 5, 7]], np.s_[..., 3], np.s_[2:5, [0, 9]],
+                    np.s_[mask], np.s_[np.int64(4)], np.s_[[], 1],
+                    np.s_[1, ...], np.s_[range(3), 2]):
+            assert_array_equal(self.dst[key], self.data[key])
+
+        self.dst[[0, 2], 1] = -1
+        assert_array_equal(self.requests[-1][CMD_KW_ARGS][CMD_KW_KEY][0],
+                           [0, 2])
+
+    def check_regions(self):
+        keys = [np.s_[0:10], np.s_[[3, 4], 5], np.s_[-1, -1]]
+        for arr, key in zip(self.dst.read_regions(keys), keys):
+            assert_array_equal(arr, self.data[key])
+        self.assertEqual(self.dst.read_regions([]), [])
+
+        values = self.dst.read_points([(0, 3), (10, 7), (99, 0)])
+        assert_array_equal(values, [3, 107, 990])
+        with self.assertRaises(ValueError):
+            self.dst.read_points([1, 2])
+
+    def test_read_regions(self):
+        self.check_regions()
+        self.assertEqual([msg[CMD_KW_CMD] for msg in self.requests],
+                         ['read_regions', 'read_points'])
+
+    def test_read_regions_fallback(self):
+        self.regions = False
+        self.check_regions()
+        cmds = [msg[CMD_KW_CMD] for msg in self.requests]
+        self.assertEqual(cmds.count('slice_dataset'), 6)
+
+    def check_write_regions(self):
+        expected = self.data.copy()
+        arr = np.ones((2, 10))
+        self.dst.write_regions([(np.s_[0, 0:3], -1), (np.s_[5:7], arr),
+                                (np.s_[[8, 9], 4], [-2, -3])])
+        expected[0, 0:3] = -1
+        expected[5:7] = arr
+        expected[[8, 9], 4] = [-2, -3]
+        assert_array_equal(self.data, expected)
+        self.dst.write_regions([])
+
+        self.dst.write_points([(0, 3), (10, 7), (99, 0)], [4, 5, 6])
+        self.dst.write_points([(1, 1)], 7)
+        expected[[0, 10, 99, 1], [3, 7, 0, 1]] = [4, 5, 6, 7]
+        assert_array_equal(self.data, expected)
+        with self.assertRaises(ValueError):
+            self.dst.write_points([(0, 1, 2)], 0)
+
+    def test_write_regions(self):
+        self.check_write_regions()
+        self.assertEqual([msg[CMD_KW_CMD] for msg in self.requests],
+                         ['write_regions', 'write_points', 'write_points'])
+
+    def test_write_regions_fallback(self):
+        self.regions = False
+        self.check_write_regions()
+        # the handler also records the operations of batches
+        cmds = [msg[CMD_KW_CMD] for msg in self.requests
+                if msg[CMD_KW_CMD] != CMD_BROADCAST_DATASET]
+        self.assertEqual(cmds, ['write_regions', 'batch', 'write_points',
+                                'write_regions', 'batch', 'write_points',
+                                'write_regions', 'batch'])
+        self.assertEqual(len(self.requests[1][CMD_KW_DATA]), 3)
+
+    def test_write_regions_no_batch(self):
+        self.regions = False
+        self.batches = False
+        self.check_write_regions()
+        cmds = [msg[CMD_KW_CMD] for msg in self.requests]
+        self.assertEqual(cmds[:5], ['write_regions', 'batch',
+                                    'broadcast_dataset', 'broadcast_dataset',
+                                    'broadcast_dataset'])
+
+    def test_iter_chunks(self):
+        dst = hp.File(self.conn, 'test.h5', '/')['data']
+        self.assertEqual(dst.chunks, (8, 10))
+
+        blocks = list(dst.iter_chunks())
+        self.assertEqual(len(blocks), 13)
+        self.assertEqual(blocks[1][0], (slice(8, 16),))
+        assert_array_equal(np.concatenate([arr for _, arr in blocks]),
+                           self.data)
+
+        # block sizes are rounded up to multiples of the chunk shape
+        blocks = list(dst.iter_chunks(block=10, prefetch=0))
+        self.assertEqual([sel for sel, _ in blocks[:2]],
+                         [(slice(0, 16),), (slice(16, 32),)])
+        self.assertEqual(blocks[-1][1].shape, (4, 10))
+
+        # not chunked along axis 1
+        blocks = list(self.dst.iter_chunks(axis=-1, block=3))
+        self.assertEqual(len(blocks), 4)
+        self.assertEqual(blocks[3][0], (slice(None), slice(9, 10)))
+        assert_array_equal(np.hstack([arr for _, arr in blocks]), self.data)
+
+        with self.assertRaises(ValueError):
+            next(self.dst.iter_chunks(axis=2))
+
+    def test_read_direct(self):
+        buf = np.empty((10, 10))
+        self.dst.read_direct(buf, np.s_[10:20])
+        assert_array_equal(buf, self.data[10:20])
+
+        # strided destination, filled in place
+        big = np.zeros((20, 20))
+        self.dst.read_direct(big, np.s_[5:15], np.s_[::2, ::2])
+        assert_array_equal(big[::2, ::2], self.data[5:15])
+        self.assertFalse(big[1::2].any())
+
+        # scalar selection
+        out = np.zeros(2)
+        self.dst.read_direct(out, np.s_[3, 4], np.s_[1:2])
+        self.assertEqual(out.tolist(), [0, self.data[3, 4]])
+
+        with self.assertRaises(ValueError):
+            self.dst.read_direct(buf, np.s_[0:5])
+        with self.assertRaises(TypeError):
+            self.dst.read_direct(big, np.s_[0:2], [0, 1])
+
+    def test_write_direct(self):
+        src = np.arange(40.0).reshape(4, 10)
+        self.dst.write_direct(src, np.s_[::2], np.s_[0:2])
+        msg = self.requests[-1]
+        self.assertEqual(msg[CMD_KW_CMD], CMD_BROADCAST_DATASET)
+        assert_array_equal(msg[CMD_KW_DATA], src[::2])
+
+    def test_iter_chunks_stop(self):
+        del self.requests[:]
+        for sel, arr in self.dst.iter_chunks(block=10, prefetch=3):
+            break
+        assert_array_equal(arr, self.data[:10])
+        # at most the prefetched blocks have been read
+        self.assertLessEqual(len(self.requests), 4)
+
+    def test_pipeline(self):
+        with self.conn.pipeline(max_in_flight=8) as pipe:
+            futures = [pipe.read(self.dst, i) for i in range(100)]
+            error = pipe.read(self.dst, 1000)
+
+        for i, future in enumerate(futures):
+            assert_array_equal(future.result(), self.data[i])
+        self.assertIsInstance(error.exception(), NodeError)
+        self.assertEqual(len(self.requests), 101)
+
+        # connection is still usable
+        assert_array_equal(self.dst[5], self.data[5])
+
+    def test_pipeline_execute(self):
+        pipe = self.conn.pipeline()
+        pipe.read(self.dst, 0)
+        pipe.read(self.dst, 1000)
+        with self.assertRaises(NodeError):
+            pipe.execute()
+
+        pipe.read(self.dst, 0)
+        pipe.read(self.dst, 1000)
+        results = pipe.execute(raise_on_error=False)
+        assert_array_equal(results[0], self.data[0])
+        self.assertIsInstance(results[1], NodeError)
+
+    def test_batch(self):
+        with self.conn.batch('test.h5') as b:
+            grp = b.file.require_group('/grp')
+            grp.attrs['unit'] = 'm'
+            dst = grp.create_dataset('data', data=self.data)
+            b.file.create_group('/exists')
+            with self.assertRaises(ValueError):
+                b.file['/grp']  # reads cannot be batched
+
+        self.assertEqual(len(self.requests), 5)
+        ops = self.requests[0][CMD_KW_DATA]
+        self.assertEqual([op[CMD_KW_CMD] for op in ops],
+                         ['require_group', 'attrs_setitem', 'create_dataset',
+                          'create_group'])
+        assert_array_equal(ops[2][CMD_KW_DATA], self.data)
+
+        self.assertEqual(len(b.results), 4)
+        self.assertIsInstance(b.results[3], NodeError)
+        self.assertEqual(b.results[3].status, GROUP_EXISTS)
+        self.assertIsInstance(dst.result(), Dataset)
+        self.assertIs(dst.result().conn, self.conn)
+
+    def test_batch_fallback(self):
+        self.batches = False
+        with self.conn.batch('test.h5') as b:
+            b.file.require_group('/grp')
+            dst = b.file.create_dataset('data', data=self.data)
+            b.file.create_group('/exists')
+
+        self.assertEqual([msg[CMD_KW_CMD] for msg in self.requests],
+                         ['batch', 'require_group', 'create_dataset',
+                          'create_group'])
+        self.assertEqual(len(b.results), 3)
+        self.assertEqual(b.results[2].status, GROUP_EXISTS)
+        self.assertIsInstance(dst.result(), Dataset)
+
+    def test_batch_missing_responses(self):
+        self.batch_limit = 1
+        b = self.conn.batch('test.h5')
+        first = b.file.create_dataset('first', data=self.data)
+        second = b.file.create_dataset('second', data=self.data)
+        with self.assertRaises(MessageError):
+            b.send()
+        for future in (first, second):
+            with self.assertRaises(MessageError):
+                future.result(timeout=0)
+
+
+class CompactProtocolTestCase(ConnectionTestCase):
+    """
+    Runs the ``ConnectionTestCase`` tests with protocol v2
+    """
+
+    def setUp(self):
+        self.data = np.arange(1000.0).reshape(100, 10)
+        self.requests = []
+        self.server = SocketServer(self.handle, features=PROTOCOL_FEATURE_V2)
+        self.conn = hp.connect(self.server.addr, protocol=2)
+        self.dst = Dataset(self.conn, 'test.h5', '/data', self.data.shape,
+                           self.data.dtype)
+
+    def test_compact(self):
+        assert_array_equal(self.dst[3], self.data[3])
+        self.assertEqual(self.requests[-1][CMD_KW_ARGS],
+                         {CMD_KW_KEY: 3, CMD_KW_PATH: '/data',
+                          CMD_KW_DB: 'test.h5'})
+        self.assertEqual(self.server.compact_requests, 1)
+
+        f = self.conn.File('test.h5')
+        dst = f['/data']
+        self.assertIsInstance(dst, Dataset)
+        self.assertIs(dst.conn, self.conn)
+        self.assertEqual(dst.shape, self.data.shape)
+
+    def test_features(self):
+        # v2 combined with multiplexing and compression
+        features = (PROTOCOL_FEATURE_V2 | PROTOCOL_FEATURE_REQUEST_ID
+                    | PROTOCOL_FEATURE_COMPRESSION)
+        server = SocketServer(self.handle, features=features)
+        conn = hp.connect(server.addr, protocol=2, multiplex=True,
+                          compression='zlib')
+        self.assertTrue(conn.multiplexed)
+        dst = Dataset(conn, 'test.h5', '/data', self.data.shape,
+                      self.data.dtype)
+        assert_array_equal(dst[:], self.data)
+        assert_array_equal(dst[1], self.data[1])
+        self.assertEqual(server.compact_requests, 2)
+        self.assertEqual(server.compressed_responses, 1)
+        conn.close()
+        server.close()
+
+    def test_fallback(self):
+        server = SocketServer(self.handle)
+        conn = hp.connect(server.addr, protocol=2)
+        dst = Dataset(conn, 'test.h5', '/data', self.data.shape,
+                      self.data.dtype)
+        assert_array_equal(dst[1], self.data[1])
+        self.assertEqual(server.compact_requests, 0)
+        conn.close()
+        server.close()
+
+
+class HandleTestCase(ConnectionTestCase):
+    """
+    Runs the ``ConnectionTestCase`` tests with session handles
+    """
+
+    def setUp(self):
+        self.data = np.arange(1000.0).reshape(100, 10)
+        self.requests = []
+        self.server = SocketServer(self.handle,
+                                   features=PROTOCOL_FEATURE_HANDLES)
+        self.conn = hp.connect(self.server.addr, handles=True)
+        self.dst = Dataset(self.conn, 'test.h5', '/data', self.data.shape,
+                           self.data.dtype)
+
+    def test_handles(self):
+        f = self.conn.File('test.h5')
+        dst = f['/data']
+        # handles are opened with the second request for a node
+        self.assertEqual(self.server.handles, {})
+        assert_array_equal(dst[1], self.data[1])
+        self.assertEqual(list(self.server.handles.values()),
+                         [('test.h5', '/data')])
+        self.assertEqual(self.server.handle_requests, 1)
+        self.assertEqual(self.requests[-1][CMD_KW_ARGS][CMD_KW_PATH], '/data')
+        f['/data']
+        self.assertEqual(self.server.handle_requests, 2)
+        self.assertEqual(len(self.server.handles), 1)
+
+        # handles expired on the server => fall back to paths and reopen
+        self.server.handles.clear()
+        assert_array_equal(dst[2], self.data[2])
+        self.assertEqual(self.server.handle_requests, 2)
+        assert_array_equal(dst[3], self.data[3])
+        self.assertEqual(list(self.server.handles.values()),
+                         [('test.h5', '/data')])
+        self.assertEqual(self.server.handle_requests, 3)
+
+        # handles are dropped when the file is deleted
+        f.delete()
+        dst[5]
+        self.assertEqual(self.server.handle_requests, 3)
+
+    def test_fallback(self):
+        server = SocketServer(self.handle)
+        conn = hp.connect(server.addr, handles=True)
+        dst = conn.File('test.h5')['/data']
+        assert_array_equal(dst[1], self.data[1])
+        self.assertEqual(server.handles, {})
+        conn.close()
+        server.close()
+
+
+class CachedConnectionTestCase(ConnectionTestCase):
+    """
+    Runs the ``ConnectionTestCase`` tests with a metadata cache
+    """
+
+    def setUp(self):
+        ConnectionTestCase.setUp(self)
+        self.conn.close()
+        self.conn = hp.connect(self.server.addr, cache=True)
+        self.dst = Dataset(self.conn, 'test.h5', '/data', self.data.shape,
+                           self.data.dtype)
+
+    def test_cache(self):
+        f = self.conn.File('test.h5')
+        for i in range(3):
+            dst = f['/data']
+            dst.attrs['unit']
+        self.assertIs(dst.conn, self.conn)
+        self.assertEqual([r[CMD_KW_CMD] for r in self.requests],
+                         ['use_db', 'get_node', 'attrs_getitem'])
+        self.assertEqual(self.conn.cache.stats(),
+                         {'hits': 4, 'misses': 2, 'size': 2})
+
+        # writes invalidate the cache
+        dst.attrs['unit'] = 'm'
+        dst.attrs['unit']
+        f['/data']
+        f.create_group('/grp')
+        f['/data']
+        self.assertEqual([r[CMD_KW_CMD] for r in self.requests[3:]],
+                         ['attrs_setitem', 'attrs_getitem', 'create_group',
+                          'get_node'])
+
+
+class AttributeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.attrs = {'unit': 'm', 'scale': 0.5, 'levels': np.arange(5)}
+        self.bulk = True
+        self.requests = []
+        self.server = SocketServer(self.handle)
+        self.conn = hp.connect(self.server.addr)
+        self.dst = Dataset(self.conn, 'test.h5', '/data', (10,), 'f8')
+
+    def tearDown(self):
+        self.conn.close()
+        self.server.close()
+
+    def handle(self, msg):
+        cmd, args = msg[CMD_KW_CMD], msg[CMD_KW_ARGS]
+        self.requests.append(cmd)
+        if cmd in (CMD_ATTRIBUTES_GET_MANY, CMD_ATTRIBUTES_UPDATE):
+            if not self.bulk:
+                return {'status': UNKNOWN_COMMAND}
+        if cmd == CMD_ATTRIBUTES_GET_MANY:
+            keys = args.get(CMD_KW_KEYS, list(self.attrs))
+            return {'status': OK, 'data': {k: self.attrs[k] for k in keys
+                                           if k in self.attrs}}
+        elif cmd == CMD_ATTRIBUTES_UPDATE:
+            self.attrs.update(msg[CMD_KW_DATA])
+        elif cmd == CMD_ATTRIBUTES_KEYS:
+            return {'status': OK,
+                    'data': {RESPONSE_ATTRS_KEYS: list(self.attrs)}}
+        elif cmd == CMD_ATTRIBUTES_GET:
+            if args[CMD_KW_KEY] not in self.attrs:
+                return {'status': KEY_ERROR}
+            return {'status': OK, 'data': self.attrs[args[CMD_KW_KEY]]}
+        elif cmd == CMD_ATTRIBUTES_SET:
+            self.attrs[args[CMD_KW_KEY]] = msg[CMD_KW_DATA]
+        return {'status': OK, 'data': None}
+
+    def check_attrs(self):
+        attrs = self.dst.attrs
+        values = attrs.to_dict()
+        self.assertEqual(sorted(values), ['levels', 'scale', 'unit'])
+        assert_array_equal(values['levels'], np.arange(5))
+        self.assertEqual(attrs.get_many(['unit', 'foo'], 'bar'),
+                         {'unit': 'm', 'foo': 'bar'})
+
+        attrs.update({'unit': 'km', 'offset': np.ones(3)})
+        self.assertEqual(self.attrs['unit'], 'km')
+        assert_array_equal(self.attrs['offset'], np.ones(3))
+
+    def test_bulk(self):
+        self.check_attrs()
+        self.assertEqual(self.requests, ['attrs_get_many', 'attrs_get_many',
+                                         'attrs_update'])
+
+    def test_fallback(self):
+        self.bulk = False
+        self.check_attrs()
+        self.assertEqual(self.requests.count('attrs_getitem'), 5)
+        self.assertEqual(self.requests.count('attrs_setitem'), 2)
+
+
+class ChunkCachedConnectionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.data = np.arange(1000.0).reshape(100, 10)
+        self.keys = []
+        self.server = SocketServer(self.handle)
+        self.conn = hp.connect(self.server.addr, chunk_cache=True)
+        self.dst = Dataset(self.conn, 'test.h5', '/data', self.data.shape,
+                           self.data.dtype, chunks=(8, 5))
+
+    def tearDown(self):
+        self.conn.close()
+        self.server.close()
+
+    def handle(self, msg):
+        cmd, args = msg[CMD_KW_CMD], msg[CMD_KW_ARGS]
+        if cmd == CMD_SLICE_DATASET:
+            self.keys.append(args[CMD_KW_KEY])
+            return {'status': OK, 'data': self.data[args[CMD_KW_KEY]]}
+        elif cmd == CMD_BROADCAST_DATASET:
+            self.data[args[CMD_KW_KEY]] = msg[CMD_KW_DATA]
+        return {'status': OK, 'data': None}
+
+    def test_windows(self):
+        cache = self.conn.chunk_cache
+        assert_array_equal(self.dst[52:100], self.data[52:100])
+        # chunk-aligned region
+        self.assertEqual(self.keys, [(slice(48, 100), slice(0, 10))])
+        self.assertEqual(len(cache), 14)
+
+        # overlapping window: only the missing chunks are requested
+        assert_array_equal(self.dst[30:70, 3], self.data[30:70, 3])
+        self.assertEqual(self.keys[1:], [(slice(24, 48), slice(0, 5))])
+        assert_array_equal(self.dst[60:90], self.data[60:90])
+        self.assertEqual(len(self.keys), 2)
+        self.assertGreater(cache.hits, 0)
+
+        # other selections
+        self.assertEqual(self.dst[61, 7], self.data[61, 7])
+        assert_array_equal(self.dst[50:99:3, ::4], self.data[50:99:3, ::4])
+        out = np.empty((4, 10))
+        self.assertIs(self.dst.read(np.s_[70:74], out=out), out)
+        assert_array_equal(out, self.data[70:74])
+        self.assertEqual(len(self.keys), 2)
+
+        # larger than the cache
+        self.conn.chunk_cache.maxbytes = 1000
+        assert_array_equal(self.dst[0:20], self.data[0:20])
+        self.assertEqual(self.keys[2:], [slice(0, 20)])
+
+    def test_invalidation(self):
+        self.dst[60:70]
+        self.dst[60:62] = np.zeros((2, 10))
+        self.assertEqual(len(self.conn.chunk_cache), 0)
+        assert_array_equal(self.dst[60:70], self.data[60:70])
+        self.assertFalse(self.data[60:62].any())
+
+        # writes in pipelines
+        self.dst[60:70]
+        with self.conn.pipeline() as pipe:
+            pipe.send_rcv(CMD_BROADCAST_DATASET,
+                          {CMD_KW_PATH: '/data', CMD_KW_KEY: 0},
+                          h5file='test.h5', data=np.ones(10))
+        self.assertEqual(len(self.conn.chunk_cache), 0)
+
+
+class TreeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.attrs = {
+            '/': {},
+            '/grp': {'unit': 'm', 'scale': 0.5},
+            '/grp/data': {'levels': np.arange(3)},
+        }
+        self.multi = True
+        self.paged = True
+        self.requests = []
+        self.server = SocketServer(self.handle)
+        self.conn = hp.connect(self.server.addr)
+        self.file = hp.File(self.conn, 'test.h5', '/')
+
+    def node_type(self, path):
+        return NODE_TYPE_DATASET if path == '/grp/data' else NODE_TYPE_GROUP
+
+    def tearDown(self):
+        self.conn.close()
+        self.server.close()
+
+    def children(self, path):
+        return [p for p in self.attrs
+                if p != '/' and (p.rsplit('/', 1)[0] or '/') == path]
+
+    def node(self, path, nodetype, option):
+        node = {RESPONSE_H5FILE: 'test.h5', RESPONSE_NODE_TYPE: nodetype,
+                RESPONSE_NODE_PATH: path}
+        if nodetype == NODE_TYPE_DATASET:
+            node.update({RESPONSE_NODE_SHAPE: (3,), RESPONSE_NODE_DTYPE: 'f8'})
+        attrs = self.attrs[path]
+        if option == ATTRS_COUNT:
+            node[RESPONSE_NODE_ATTRS] = len(attrs)
+        elif option == ATTRS_KEYS:
+            node[RESPONSE_NODE_ATTRS] = list(attrs)
+        elif option is not None:
+            node[RESPONSE_NODE_ATTRS] = attrs
+        return node
+
+    def iter_tree(self, args):
+        base = args[CMD_KW_PATH].rstrip('/')
+        max_depth = args.get(CMD_KW_MAX_DEPTH)
+        pattern = args.get(CMD_KW_PATTERN)
+        paths = []
+        for path in sorted(self.attrs):
+            if path != (base or '/') and not path.startswith(base + '/'):
+                continue
+            depth = path[len(base):].count('/') if path != '/' else 0
+            if max_depth is not None and depth > max_depth:
+                continue
+            if pattern is None or fnmatchcase(path, pattern):
+                paths.append(path)
+        start = args.get(CMD_KW_CURSOR, 0)
+        end = start + args[CMD_KW_LIMIT]
+        return {
+            RESPONSE_NODES: [self.node(p, self.node_type(p),
+                                       args.get(CMD_KW_ATTRS))
+                             for p in paths[start:end]],
+            RESPONSE_CURSOR: end if end < len(paths) else None,
+        }
+
+    def handle(self, msg):
+        cmd, args = msg[CMD_KW_CMD], msg[CMD_KW_ARGS]
+        self.requests.append(cmd)
+        if cmd == CMD_GET_TREE:
+            option = args.get(CMD_KW_ATTRS)
+
+            def subtree(path):
+                return [self.node(path, self.node_type(path), option),
+                        [subtree(child) for child in self.children(path)]]
+
+            tree = subtree(args[CMD_KW_PATH])
+            return {'status': OK, 'data': {RESPONSE_NODE_TREE: tree}}
+        elif cmd == CMD_ITER_TREE:
+            if not self.paged:
+                return {'status': UNKNOWN_COMMAND}
+            return {'status': OK, 'data': self.iter_tree(args)}
+        elif cmd == CMD_GET_NODES:
+            if not self.multi:
+                return {'status': UNKNOWN_COMMAND}
+            paths = args.get(CMD_KW_PATHS)
+            if paths is None:
+                paths = self.children(args[CMD_KW_PATH])
+            return {'status': OK, 'data': [
+                self.node(p, self.node_type(p), None) if p in self.attrs
+                else None for p in paths]}
+        elif cmd == CMD_GET_NODE:
+            path = args[CMD_KW_PATH]
+            if path not in self.attrs:
+                return {'status': NODE_NOT_FOUND}
+            return {'status': OK,
+                    'data': self.node(path, self.node_type(path), None)}
+        elif cmd == CMD_GET_KEYS:
+            path = args[CMD_KW_PATH]
+            keys = [p.rsplit('/', 1)[1] for p in self.children(path)]
+            return {'status': OK, 'data': {RESPONSE_NODE_KEYS: keys}}
+        elif cmd == CMD_ATTRIBUTES_KEYS:
+            return {'status': OK, 'data': {
+                RESPONSE_ATTRS_KEYS: list(self.attrs[args[CMD_KW_PATH]])}}
+        return {'status': OK, 'data': None}
+
+    def test_render_counts(self):
+        tree = self.file.tree(attrs='count')
+        html = tree._repr_html_()
+        self.assertIn('grp', html)
+        self.assertEqual(self.requests, ['get_tree'])
+
+        grp = tree[1][0][0]
+        self.assertEqual(len(grp.attrs), 2)
+        # keys are not part of the summary
+        self.assertEqual(sorted(grp.attrs.keys()), ['scale', 'unit'])
+        self.assertEqual(self.requests, ['get_tree', 'attrs_keys'])
+
+    def test_render_without_summary(self):
+        self.file.tree()._repr_html_()
+        self.assertEqual(self.requests, ['get_tree', 'attrs_keys',
+                                         'attrs_keys', 'attrs_keys'])
+
+    def test_visititems_values(self):
+        visited = {}
+
+        def collect(name, obj):
+            visited[name] = obj.attrs.to_dict()
+
+        self.file.visititems(collect, attrs='values')
+        self.assertEqual(self.requests, ['iter_tree'])
+        self.assertEqual(sorted(visited), ['/', '/grp', '/grp/data'])
+        self.assertEqual(visited['/grp'], {'unit': 'm', 'scale': 0.5})
+        assert_array_equal(visited['/grp/data']['levels'], np.arange(3))
+
+    def test_keys_and_changes(self):
+        grp = self.file.tree(attrs='keys')[1][0][0]
+        self.assertEqual(sorted(grp.attrs), ['scale', 'unit'])
+        self.assertIn('unit', grp.attrs)
+        self.assertNotIn('foo', grp.attrs)
+        self.assertEqual(self.requests, ['get_tree'])
+
+        # modifications discard the snapshot
+        grp.attrs['foo'] = 1
+        self.attrs['/grp']['foo'] = 1
+        self.assertEqual(len(grp.attrs), 3)
+        self.assertEqual(self.requests, ['get_tree', 'attrs_setitem',
+                                         'attrs_keys'])
+
+    def check_nodes(self):
+        self.assertEqual([(k, type(v)) for k, v in self.file.items()],
+                         [('grp', Group)])
+        grp = self.file['grp']
+        data, = grp.values()
+        self.assertEqual((data.path, data.shape), ('/grp/data', (3,)))
+
+        nodes = grp.get_many(['data', '/grp', 'missing'])
+        self.assertEqual(sorted(nodes), ['/grp', 'data', 'missing'])
+        self.assertEqual(nodes['data'].path, '/grp/data')
+        self.assertIsInstance(nodes['/grp'], Group)
+        self.assertIsNone(nodes['missing'])
+
+    def test_get_nodes(self):
+        self.check_nodes()
+        self.assertEqual(self.requests, ['get_nodes', 'get_node',
+                                         'get_nodes', 'get_nodes'])
+
+    def test_get_nodes_fallback(self):
+        self.multi = False
+        self.check_nodes()
+        self.assertEqual(self.requests.count('get_nodes'), 3)
+        self.assertEqual(self.requests.count('get_node'), 6)
+
+    def check_traversal(self):
+        def paths(**kwargs):
+            return [n.path for n in self.file.iter_tree(**kwargs)]
+
+        self.assertEqual(paths(page_size=2), ['/', '/grp', '/grp/data'])
+        self.assertEqual(paths(max_depth=1), ['/', '/grp'])
+        self.assertEqual(paths(pattern='*/data'), ['/grp/data'])
+        self.assertEqual([n.path for n in self.file['grp'].iter_tree()],
+                         ['/grp', '/grp/data'])
+
+        visited = []
+
+        def find_grp(name, obj):
+            visited.append(name)
+            if isinstance(obj, Group) and name != '/':
+                return name
+
+        self.assertEqual(self.file.visititems(find_grp), '/grp')
+        self.assertEqual(visited, ['/', '/grp'])
+        self.assertIsNone(self.file.visit(visited.append))
+        self.assertEqual(visited[2:], ['/', '/grp', '/grp/data'])
+
+    def test_iter_tree(self):
+        self.check_traversal()
+        self.assertEqual(self.requests.count('iter_tree'), 7)
+
+        # stopping early does not request further pages
+        del self.requests[:]
+        nodes = list(islice(self.file.iter_tree(page_size=1), 2))
+        self.assertEqual(len(nodes), 2)
+        self.assertEqual(self.requests, ['iter_tree'] * 2)
+
+    def test_iter_tree_fallback(self):
+        self.paged = False
+        self.check_traversal()
+        self.assertEqual(self.requests.count('get_tree'), 6)
+
+    def test_invalid_option(self):
+        with self.assertRaises(ValueError):
+            self.file.tree(attrs='everything')
+        self.assertEqual(self.requests, [])
+
+
+class MultiplexedConnectionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.data = np.arange(1000.0).reshape(100, 10)
+        self.server = SocketServer(self.handle,
+                                   features=PROTOCOL_FEATURE_REQUEST_ID)
+        self.conn = hp.connect(self.server.addr, multiplex=True)
+        self.dst = Dataset(self.conn, 'test.h5', '/data', self.data.shape,
+                           self.data.dtype)
+
+    def tearDown(self):
+        self.conn.close()
+        self.server.close()
+
+    def handle(self, msg):
+        key = msg[CMD_KW_ARGS][CMD_KW_KEY]
+        if key == 0:
+            time.sleep(0.5)  # slow request
+        return {'status': OK, 'data': self.data[key]}
+
+    def test_out_of_order(self):
+        self.assertTrue(self.conn.multiplexed)
+        finished = []
+
+        def read(key):
+            assert_array_equal(self.dst[key], self.data[key])
+            finished.append(key)
+
+        slow = threading.Thread(target=read, args=(0,))
+        slow.start()
+        time.sleep(0.1)
+        threads = [threading.Thread(target=read, args=(i,))
+                   for i in range(1, 20)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        slow.join()
+
+        # fast requests were not blocked by the slow one
+        self.assertEqual(len(finished), 20)
+        self.assertEqual(finished[-1], 0)
+
+    def test_pipeline(self):
+        with self.conn.pipeline(max_in_flight=4) as pipe:
+            futures = [pipe.read(self.dst, i) for i in range(1, 50)]
+        for i, future in enumerate(futures, 1):
+            assert_array_equal(future.result(), self.data[i])
+
+    def test_fallback(self):
+        server = SocketServer(self.handle)
+        conn = hp.connect(server.addr, multiplex=True)
+        self.assertFalse(conn.multiplexed)
+        dst = Dataset(conn, 'test.h5', '/data', self.data.shape,
+                      self.data.dtype)
+        assert_array_equal(dst[5], self.data[5])
+        conn.close()
+        server.close()
+
+
+class ReconnectTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.data = np.arange(1000.0).reshape(100, 10)
+        self.drop = False
+        self.server = SocketServer(self.handle,
+                                   features=PROTOCOL_FEATURE_REQUEST_ID)
+
+    def tearDown(self):
+        self.server.close()
+
+    def handle(self, msg):
+        if self.drop:
+            # connection lost while processing the request
+            self.drop = False
+            self.server.drop_connections()
+            return None
+        if msg[CMD_KW_CMD] == CMD_SLICE_DATASET:
+            key = msg[CMD_KW_ARGS][CMD_KW_KEY]
+            return {'status': OK, 'data': self.data[key]}
+        return {'status': OK}
+
+    def check_reconnect(self, multiplex):
+        conn = hp.connect(self.server.addr, multiplex=multiplex,
+                          retry_backoff=0.01)
+        self.assertEqual(conn.multiplexed, multiplex)
+        dst = Dataset(conn, 'test.h5', '/data', self.data.shape,
+                      self.data.dtype)
+        assert_array_equal(dst[1], self.data[1])
+
+        # server restarts between requests
+        self.server.drop_connections()
+        time.sleep(0.05)
+        assert_array_equal(dst[2], self.data[2])
+        dst.attrs['unit'] = 'm'
+
+        # idempotent requests are retried
+        self.drop = True
+        assert_array_equal(dst[3], self.data[3])
+
+        # others are not
+        self.drop = True
+        with self.assertRaises(IOError):
+            dst.attrs['unit'] = 'm'
+        dst.attrs['unit'] = 'm'
+        self.assertEqual(conn.multiplexed, multiplex)
+
+        conn.close()
+        with self.assertRaises(IOError):
+            dst[1]
+
+    def test_reconnect(self):
+        self.check_reconnect(multiplex=False)
+
+    def test_reconnect_multiplexed(self):
+        self.check_reconnect(multiplex=True)
+
+    def test_retries_exhausted(self):
+        conn = hp.connect(self.server.addr, retries=2, retry_backoff=0.01)
+        dst = Dataset(conn, 'test.h5', '/data', self.data.shape,
+                      self.data.dtype)
+        self.assertTrue(self.server.wait_connections(1))
+        self.server.close()
+        with self.assertRaises(IOError):
+            dst[1]
+
+
+class TimeoutTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.data = np.arange(1000.0).reshape(100, 10)
+
+    def handle(self, msg):
+        key = msg[CMD_KW_ARGS][CMD_KW_KEY]
+        if key == 0:
+            time.sleep(0.3)  # slow request
+        return {'status': OK, 'data': self.data[key]}
+
+    def check_timeout(self, server, multiplex):
+        conn = hp.connect(server.addr, multiplex=multiplex, timeout=5)
+        dst = Dataset(conn, 'test.h5', '/data', self.data.shape,
+                      self.data.dtype)
+        args = {CMD_KW_KEY: 0, CMD_KW_PATH: '/data'}
+        with self.assertRaises(RequestTimeoutError):
+            conn.send_rcv(CMD_SLICE_DATASET, args, h5file='test.h5',
+                          timeout=0.1)
+
+        # the connection is reused, the late response is skipped
+        for i in range(1, 5):
+            assert_array_equal(dst[i], self.data[i])
+        self.assertEqual(len(server.connections), 1)
+        self.assertTrue(conn.is_alive())
+        conn.close()
+        server.close()
+
+    def test_timeout(self):
+        self.check_timeout(SocketServer(self.handle), multiplex=False)
+
+    def test_timeout_multiplexed(self):
+        server = SocketServer(self.handle,
+                              features=PROTOCOL_FEATURE_REQUEST_ID)
+        self.check_timeout(server, multiplex=True)
+
+    def test_timeout_partial_response(self):
+        # times out while reading the message body
+        server = SocketServer(self.handle, split_delay=0.2)
+        conn = hp.connect(server.addr)
+        dst = Dataset(conn, 'test.h5', '/data', self.data.shape,
+                      self.data.dtype)
+        args = {CMD_KW_KEY: slice(None), CMD_KW_PATH: '/data'}
+        with self.assertRaises(RequestTimeoutError):
+            conn.send_rcv(CMD_SLICE_DATASET, args, h5file='test.h5',
+                          timeout=0.1)
+        assert_array_equal(dst[1:3], self.data[1:3])
+        self.assertEqual(len(server.connections), 1)
+        conn.close()
+        server.close()
+
+
+class CompressedConnectionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # smooth field, compresses well
+        x = np.linspace(0, 1, 200)
+        self.data = np.outer(np.round(x, 2), np.ones(200))
+        self.server = SocketServer(
+            self.handle,
+            features=PROTOCOL_FEATURE_REQUEST_ID | PROTOCOL_FEATURE_COMPRESSION)
+
+    def tearDown(self):
+        self.server.close()
+
+    def handle(self, msg):
+        key = msg[CMD_KW_ARGS][CMD_KW_KEY]
+        if msg[CMD_KW_CMD] == CMD_BROADCAST_DATASET:
+            self.data[key] = msg[CMD_KW_DATA]
+            return {'status': OK}
+        return {'status': OK, 'data': self.data[key]}
+
+    def check_compression(self, multiplex):
+        conn = hp.connect(self.server.addr, multiplex=multiplex,
+                          compression='zlib')
+        dst = Dataset(conn, 'test.h5', '/data', self.data.shape,
+                      self.data.dtype)
+
+        assert_array_equal(dst[:], self.data)
+        out = np.empty_like(self.data)
+        dst.read(out=out)
+        assert_array_equal(out, self.data)
+        self.assertEqual(self.server.compressed_responses, 2)
+
+        # small messages are not compressed
+        assert_array_equal(dst[0, :3], self.data[0, :3])
+        self.assertEqual(self.server.compressed_responses, 2)
+
+        value = np.ones((100, 200))
+        dst[:100] = value
+        assert_array_equal(self.data[:100], value)
+        self.assertEqual(self.server.compressed_requests, 1)
+
+        # per-call override
+        args = {CMD_KW_KEY: (0, slice(0, 3)), CMD_KW_PATH: '/data'}
+        result = conn.send_rcv(CMD_SLICE_DATASET, args, h5file='test.h5',
+                               compress=True)
+        assert_array_equal(result['data'], self.data[0, :3])
+        self.assertEqual(self.server.compressed_responses, 3)
+        args = {CMD_KW_KEY: slice(None), CMD_KW_PATH: '/data'}
+        conn.send_rcv(CMD_SLICE_DATASET, args, h5file='test.h5',
+                      compress=False)
+        self.assertEqual(self.server.compressed_responses, 3)
+        args = {CMD_KW_KEY: slice(None), CMD_KW_PATH: '/data'}
+        conn.send_rcv(CMD_BROADCAST_DATASET, args, h5file='test.h5',
+                      data=np.zeros((200, 200)), compress=False)
+        self.assertEqual(self.server.compressed_requests, 1)
+        conn.close()
+
+    def test_compression(self):
+        self.check_compression(multiplex=False)
+
+    def test_compression_multiplexed(self):
+        self.check_compression(multiplex=True)
+
+    def test_fallback(self):
+        server = SocketServer(self.handle)
+        conn = hp.connect(server.addr, compression='lzma')
+        dst = Dataset(conn, 'test.h5', '/data', self.data.shape,
+                      self.data.dtype)
+        assert_array_equal(dst[:], self.data)
+        self.assertEqual(server.compressed_responses, 0)
+        conn.close()
+        server.close()
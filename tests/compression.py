@@ -0,0 +1,25 @@
+import unittest
+import zlib
+
+from hurraypy.compression import codec_names, get_codec, register_codec
+
+
+class CompressionTestCase(unittest.TestCase):
+    def test_codecs(self):
+        data = b"hurray" * 1000
+        for name in ("zlib", "lzma"):
+            codec = get_codec(name)
+            self.assertIs(get_codec(codec.id), codec)
+            compressed = codec.compress(data)
+            self.assertLess(len(compressed), len(data))
+            self.assertEqual(codec.decompress(compressed), data)
+
+    def test_register(self):
+        register_codec("zlib9", 99, lambda d: zlib.compress(d, 9),
+                       zlib.decompress)
+        self.assertIn("zlib9", codec_names())
+        self.assertEqual(get_codec(99).name, "zlib9")
+        with self.assertRaises(ValueError):
+            get_codec("unknown")
+        with self.assertRaises(ValueError):
+            register_codec("invalid", 256, None, None)
@@ -1,8 +1,10 @@
+import io
 import unittest
 
 import msgpack
 import numpy as np
-from hurraypy.msgpack_ext import encode, get_decoder
+from hurraypy.msgpack_ext import (encode, get_decoder, packb_iovec,
+                                  StreamUnpacker)
 from numpy.testing import assert_array_equal
 
 
@@ -26,3 +28,98 @@ class MsgPackTestCase(unittest.TestCase):
                                          encoding='utf-8')
 
         self.assertEqual(slice_in, unpacked_slice)
+
+    def test_ellipsis_and_scalars(self):
+        key = (Ellipsis, np.int64(3), np.float32(0.5))
+        packed = msgpack.packb(key, default=encode, use_bin_type=True)
+        unpacked = msgpack.unpackb(packed, object_hook=get_decoder({}),
+                                   encoding='utf-8')
+        self.assertEqual(unpacked, [Ellipsis, 3, 0.5])
+
+    def test_fortran_order(self):
+        data = np.asfortranarray(np.arange(12.0).reshape(3, 4))
+        packed = msgpack.packb(data, default=encode, use_bin_type=True)
+        unpacked = msgpack.unpackb(packed, object_hook=get_decoder({}),
+                                   encoding='utf-8')
+        assert_array_equal(unpacked, data)
+
+        stream = io.BytesIO(packed)
+        assert_array_equal(
+            StreamUnpacker(stream.read, stream.readinto).unpack(), data)
+
+    def test_numpy_scalars(self):
+        for scalar, cls in ((np.int64(3), int), (np.uint8(3), int),
+                            (np.float32(0.5), float), (np.bool_(True), bool)):
+            self.assertIs(type(encode(scalar)), cls)
+
+    def test_packb_iovec(self):
+        for data in (np.arange(100000, dtype='f8').reshape(200, 500),
+                     np.arange(10, dtype='u1'),
+                     np.array(3.5),
+                     np.arange(6).reshape(2, 3).T,  # not C-contiguous
+                     'foo', None):
+            for msg in ({'cmd': 'foo', 'args': {'path': '/x'}, 'data': data},
+                        [15, {1: '/x'}, data]):
+                buffers = packb_iovec(msg)
+                joined = b''.join(bytes(memoryview(b)) for b in buffers)
+
+                self.assertEqual(joined, msgpack.packb(msg, default=encode,
+                                                       use_bin_type=True))
+
+    def test_stream_unpacker(self):
+        msg = {
+            'status': 100,
+            'data': {
+                'ints': (0, 1, -1, -100, 300, -40000, 2**40, -2**40),
+                'floats': (0.5, -1e300),
+                'str': 'x' * 300,
+                'bin': b'\x00' * 70000,
+                'bools': (True, False, None),
+                'array': np.arange(50000, dtype='<i4').reshape(100, 500),
+                'scalar_array': np.array(1.5),
+                'fortran': np.asfortranarray(np.arange(6.0).reshape(2, 3)),
+            },
+        }
+        packed = msgpack.packb(msg, default=encode, use_bin_type=True)
+        expected = msgpack.unpackb(packed, object_hook=get_decoder(None),
+                                   use_list=False, encoding='utf-8')
+
+        stream = io.BytesIO(packed)
+        unpacker = StreamUnpacker(stream.read, stream.readinto,
+                                  object_hook=get_decoder(None))
+        result = unpacker.unpack()
+
+        self.assertEqual(unpacker.bytes_read, len(packed))
+        self.assertEqual(sorted(result['data']), sorted(expected['data']))
+        for key, value in expected['data'].items():
+            if isinstance(value, np.ndarray):
+                assert_array_equal(result['data'][key], value)
+            else:
+                self.assertEqual(result['data'][key], value)
+
+    def test_stream_unpacker_out(self):
+        data = np.random.random((20, 30))
+        packed = msgpack.packb({'status': 100, 'data': data}, default=encode,
+                               use_bin_type=True)
+
+        out = np.empty_like(data)
+        stream = io.BytesIO(packed)
+        result = StreamUnpacker(stream.read, stream.readinto, out=out).unpack()
+
+        self.assertIs(result['data'], out)
+        assert_array_equal(out, data)
+
+        # non-contiguous output arrays are filled after receiving the data
+        out = np.empty((30, 20)).T
+        stream = io.BytesIO(packed)
+        result = StreamUnpacker(stream.read, stream.readinto, out=out).unpack()
+        self.assertIs(result['data'], out)
+        assert_array_equal(out, data)
+
+        # mismatches are detected before the array data is consumed
+        for out in (np.empty((1, 30)), np.empty((20, 30), dtype='f4')):
+            stream = io.BytesIO(packed)
+            unpacker = StreamUnpacker(stream.read, stream.readinto, out=out)
+            with self.assertRaises(ValueError):
+                unpacker.unpack()
+            self.assertLess(unpacker.bytes_read, data.nbytes)
@@ -6,12 +6,20 @@ from numpy.testing import assert_array_equal
 
 import hurraypy as hp
 from hurraypy.exceptions import DatabaseError, MessageError, NodeError
-from hurraypy.nodes import Group, Dataset
+from hurraypy.nodes import Group, Dataset, _split_selection
+from hurraypy.protocol import (CMD_CREATE_DATASET, CMD_SLICE_DATASET,
+                               CMD_BROADCAST_DATASET, CMD_KW_CMD, CMD_KW_ARGS,
+                               CMD_KW_DATA, CMD_KW_KEY, CMD_KW_PATH,
+                               CMD_KW_DB, CMD_KW_SHAPE, CMD_KW_DTYPE,
+                               RESPONSE_H5FILE, RESPONSE_NODE_TYPE,
+                               RESPONSE_NODE_PATH, RESPONSE_NODE_SHAPE,
+                               RESPONSE_NODE_DTYPE, NODE_TYPE_DATASET)
 from hurraypy.status_codes import (INVALID_ARGUMENT, FILE_EXISTS,
                                    FILE_NOT_FOUND, GROUP_EXISTS,
                                    DATASET_EXISTS, NODE_NOT_FOUND, VALUE_ERROR,
-                                   TYPE_ERROR, KEY_ERROR)
+                                   TYPE_ERROR, KEY_ERROR, OK)
 from tests.server_mock import MockServer
+from tests.socket_server import SocketServer
 
 
 def _connect(*args):
@@ -262,3 +270,81 @@ class NodeTestCase(unittest.TestCase):
                                           'path': data_path},
                                          None)
         self.assertEqual(val, default)
+
+
+class SelectionTestCase(unittest.TestCase):
+
+    def test_split_selection(self):
+        data = np.arange(1000 * 7).reshape(1000, 7)
+        key = (slice(10, 500, 3), slice(2, None))
+        expected = data[key]
+        row_nbytes = expected[0].nbytes
+
+        pieces = _split_selection(data.shape, key, row_nbytes,
+                                  10 * row_nbytes)
+        self.assertEqual(len(pieces), 17)
+
+        out = np.empty_like(expected)
+        for dst_key, sel_key in pieces:
+            out[sel_key] = data[dst_key]
+        assert_array_equal(out, expected)
+
+        # keys that cannot be split along the first axis
+        self.assertIsNone(_split_selection(data.shape, 3, 8, 8))
+        self.assertIsNone(_split_selection(data.shape, slice(None, None, -1),
+                                           8, 8))
+
+    def handle(self, msg):
+        cmd, args = msg[CMD_KW_CMD], msg[CMD_KW_ARGS]
+        self.requests.append(cmd)
+        data = msg[CMD_KW_DATA]
+        if cmd == CMD_CREATE_DATASET:
+            if data is None:
+                data = np.zeros(args[CMD_KW_SHAPE], args[CMD_KW_DTYPE])
+            self.datasets[args[CMD_KW_PATH]] = data.copy()
+            return {'status': OK, 'data': {
+                RESPONSE_NODE_TYPE: NODE_TYPE_DATASET,
+                RESPONSE_H5FILE: args[CMD_KW_DB],
+                RESPONSE_NODE_PATH: args[CMD_KW_PATH],
+                RESPONSE_NODE_SHAPE: data.shape,
+                RESPONSE_NODE_DTYPE: data.dtype.name,
+            }}
+        elif cmd == CMD_SLICE_DATASET:
+            arr = self.datasets[args[CMD_KW_PATH]]
+            return {'status': OK, 'data': arr[args[CMD_KW_KEY]]}
+        elif cmd == CMD_BROADCAST_DATASET:
+            self.datasets[args[CMD_KW_PATH]][args[CMD_KW_KEY]] = data
+        return {'status': OK}
+
+    def test_split_round_trip(self):
+        self.requests = []
+        self.datasets = {}
+        server = SocketServer(self.handle)
+        # pieces of 10 rows
+        conn = hp.connect(server.addr, stream_threshold=800)
+        try:
+            data = np.arange(1000.0).reshape(100, 10)
+            f = conn.File('test.h5')
+            del self.requests[:]
+
+            # streamed create_dataset: empty dataset + 10 writes
+            dst = f.create_dataset('data', data=data)
+            self.assertEqual(self.requests,
+                             ['create_dataset'] + ['broadcast_dataset'] * 10)
+            assert_array_equal(self.datasets['/data'], data)
+
+            del self.requests[:]
+            assert_array_equal(dst[:], data)
+            assert_array_equal(dst[5:95:2, 1:], data[5:95:2, 1:])
+            self.assertEqual(self.requests, ['slice_dataset'] * 15)
+
+            del self.requests[:]
+            dst[20:60] = -data[20:60]
+            dst[3] = -1
+            data[20:60] *= -1
+            data[3] = -1
+            assert_array_equal(self.datasets['/data'], data)
+            self.assertEqual(self.requests, ['broadcast_dataset'] * 5)
+        finally:
+            conn.close()
+            server.close()
@@ -0,0 +1,117 @@
+import socket
+import threading
+import time
+import unittest
+
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from hurraypy.nodes import Dataset
+from hurraypy.pool import ConnectionPool, PoolTimeoutError
+from hurraypy.protocol import CMD_SLICE_DATASET
+from hurraypy.status_codes import OK
+from tests.socket_server import SocketServer
+
+
+class ConnectionPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.data = np.arange(100.0)
+        self.keys = []
+        self.server = SocketServer(self.handle)
+        self.pool = ConnectionPool(self.server.addr, size=2)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.close()
+
+    def handle(self, msg):
+        self.keys.append(msg['args']['key'])
+        return {'status': OK, 'data': self.data[msg['args']['key']]}
+
+    def read(self, key):
+        args = {'path': '/data', 'key': key}
+        return self.pool.send_rcv(CMD_SLICE_DATASET, args=args, h5file='f')
+
+    def test_threads(self):
+        errors = []
+
+        def worker(i):
+            try:
+                for j in range(20):
+                    key = slice(i, i + j)
+                    assert_array_equal(self.read(key)['data'],
+                                       self.data[key])
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(i,))
+                   for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(self.server.connections), 2)
+
+    def test_read_parallel(self):
+        self.assertEqual(self.pool.size, 2)
+        dst = Dataset(self.pool, 'f', '/data', self.data.shape, 'f8',
+                      chunks=(8,))
+        assert_array_equal(dst.read_parallel(np.s_[3:97]), self.data[3:97])
+        # pieces start at chunk boundaries
+        starts = sorted(key[0].start for key in self.keys)
+        self.assertGreater(len(starts), 1)
+        self.assertEqual(starts[0], 3)
+        self.assertTrue(all(start % 8 == 0 for start in starts[1:]))
+
+        out = np.zeros(25)
+        arr = dst.read_parallel(np.s_[50::2], out=out, workers=3)
+        self.assertIs(arr, out)
+        assert_array_equal(out, self.data[50::2])
+
+        # not splittable
+        self.assertEqual(dst.read_parallel(5), 5.0)
+        with self.assertRaises(ValueError):
+            dst.read_parallel(np.s_[0:10], out=np.zeros(5))
+
+    def test_thread_affinity(self):
+        with self.pool.connection() as conn:
+            with self.pool.connection() as conn2:
+                self.assertIs(conn, conn2)
+        with self.pool.connection() as conn3:
+            self.assertIs(conn, conn3)
+
+    def test_timeout(self):
+        pool = ConnectionPool(self.server.addr, size=1, timeout=0.1)
+        with pool.connection():
+            result = []
+            thread = threading.Thread(
+                target=lambda: result.append(self._try_checkout(pool)))
+            thread.start()
+            thread.join()
+        self.assertIsInstance(result[0], PoolTimeoutError)
+        pool.close()
+
+    def _try_checkout(self, pool):
+        try:
+            with pool.connection():
+                pass
+        except PoolTimeoutError as e:
+            return e
+
+    def test_dead_and_idle_connections(self):
+        with self.pool.connection() as conn:
+            self.read(slice(0, 1))
+        # server closes the connection => discarded on next checkout
+        self.server.connections[0].shutdown(socket.SHUT_RDWR)
+        time.sleep(0.05)
+        with self.pool.connection() as conn2:
+            self.assertIsNot(conn, conn2)
+
+        self.pool._max_idle = 0
+        time.sleep(0.01)
+        with self.pool.connection() as conn3:
+            self.assertIsNot(conn2, conn3)
+        self.assertTrue(conn2.closed())
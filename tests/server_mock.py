@@ -5,7 +5,10 @@ Mocks hurray server messages
 # TODO this does not work at the moment. Does it really make sense to mock the
 # whole server, duplicating most of the server code?
 
+import msgpack
+
 from hurraypy.protocol import (CMD_CREATE_DATABASE, CMD_USE_DATABASE,
+                               CMD_BATCH,
                                CMD_CREATE_GROUP, CMD_REQUIRE_GROUP,
                                CMD_CREATE_DATASET, CMD_GET_NODE, CMD_GET_KEYS,
                                CMD_GET_TREE,
@@ -89,7 +92,13 @@ class MockServer(object):
         status = OK
         data = None
 
-        if cmd in DATABASE_COMMANDS:  # Database related commands
+        if cmd == CMD_BATCH:
+            if CMD_KW_DATA not in msg:
+                return self.response(MISSING_DATA)
+            # process operations one by one, collecting their responses
+            data = [msgpack.unpackb(self.handle_request(op), raw=False)
+                    for op in msg[CMD_KW_DATA]]
+        elif cmd in DATABASE_COMMANDS:  # Database related commands
             # Database name has to be defined
             if CMD_KW_DB not in args:
                 return self.response(MISSING_ARGUMENT)
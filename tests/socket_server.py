@@ -0,0 +1,263 @@
+"""
+Minimal socket server speaking the hurray wire protocol. Requests are
+dispatched to a handler function, which makes it easy to test the client's
+transport layer without a real hurray server.
+"""
+
+import itertools
+import socket
+import struct
+import threading
+import time
+
+import msgpack
+
+from hurraypy.compression import get_codec
+from hurraypy.msgpack_ext import encode, get_decoder
+from hurraypy.protocol import (PROTOCOL_VER, PROTOCOL_FEATURE_REQUEST_ID,
+                               PROTOCOL_FEATURE_COMPRESSION,
+                               PROTOCOL_CODEC_SHIFT, PROTOCOL_CODEC_MASK,
+                               PROTOCOL_FEATURE_V2, PROTOCOL_VER_2, HEADER_V2,
+                               OPCODES, KEYWORD_IDS, CMD_KW_DATA,
+                               PROTOCOL_FEATURE_HANDLES, CMD_OPEN_HANDLE,
+                               CMD_KW_HANDLE, CMD_KW_DB, CMD_KW_PATH,
+                               CMD_NEGOTIATE, CMD_KW_CMD, CMD_KW_ARGS,
+                               CMD_KW_FEATURES, CMD_KW_CODEC, CMD_KW_COMPRESS)
+from hurraypy.status_codes import OK, UNKNOWN_COMMAND, INVALID_HANDLE
+
+
+class SocketServer(object):
+
+    def __init__(self, handler, features=0, split_delay=None,
+                 compression_threshold=1024):
+        """
+        Args:
+            handler: callable ``handler(msg) -> response``, where ``msg`` is
+                the decoded request (dict) and ``response`` a dict
+            features: supported protocol features (if 0, ``CMD_NEGOTIATE``
+                is unknown to the server)
+            split_delay: if given, responses are sent in two parts with a
+                delay of ``split_delay`` seconds in between
+            compression_threshold: minimum size of compressed responses
+        """
+        self.handler = handler
+        self.features = features
+        self.split_delay = split_delay
+        self.compression_threshold = compression_threshold
+        # number of compressed messages received and sent
+        self.compressed_requests = 0
+        self.compressed_responses = 0
+        # number of protocol v2 messages received
+        self.compact_requests = 0
+        # session handles: handle => (file name, node path)
+        self.handles = {}
+        self._handle_ids = itertools.count(1)
+        # number of requests using a handle
+        self.handle_requests = 0
+        self.connections = []
+        # registers connections (and rejects them after close())
+        self._lock = threading.Lock()
+        self._closed = False
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(('127.0.0.1', 0))
+        self._sock.listen(16)
+        self.addr = '127.0.0.1:{}'.format(self._sock.getsockname()[1])
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        try:
+            # wakes up the thread blocked in accept()
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+        self.drop_connections()
+
+    def drop_connections(self):
+        """
+        Close all client connections, but keep accepting new ones
+        """
+        with self._lock:
+            connections, self.connections = self.connections, []
+        for conn in connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.close()
+
+    def wait_connections(self, num, timeout=1.0):
+        """
+        Wait until ``num`` client connections have been accepted (a client's
+        ``connect()`` may return before the server registers the connection)
+
+        Returns:
+            True if the connections have been accepted in time
+        """
+        deadline = time.time() + timeout
+        while len(self.connections) < num:
+            if time.time() > deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            with self._lock:
+                closed = self._closed
+                if not closed:
+                    self.connections.append(conn)
+            if closed:
+                # accepted before, but registered after close()
+                conn.close()
+                return
+            thread = threading.Thread(target=self._serve, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def _read(self, stream, num_bytes):
+        data = stream.read(num_bytes)
+        if len(data) < num_bytes:
+            raise EOFError()
+        return data
+
+    def _serve(self, conn):
+        stream = conn.makefile('rb')
+        state = {'features': 0, 'lock': threading.Lock(), 'codec': None}
+        try:
+            while True:
+                request_id = None
+                compact = state['features'] & PROTOCOL_FEATURE_V2
+                if compact:
+                    _, codec_id, request_id, msg_length = HEADER_V2.unpack(
+                        self._read(stream, HEADER_V2.size))
+                else:
+                    version, = struct.unpack('>I', self._read(stream, 4))
+                    if state['features'] & PROTOCOL_FEATURE_REQUEST_ID:
+                        request_id, = struct.unpack('>I',
+                                                    self._read(stream, 4))
+                    msg_length, = struct.unpack('>I', self._read(stream, 4))
+                    codec_id = ((version & PROTOCOL_CODEC_MASK)
+                                >> PROTOCOL_CODEC_SHIFT)
+                if not state['features'] & PROTOCOL_FEATURE_REQUEST_ID:
+                    request_id = None
+                body = self._read(stream, msg_length)
+                if codec_id:
+                    self.compressed_requests += 1
+                    body = get_codec(codec_id).decompress(body)
+                msg = msgpack.unpackb(body, object_hook=get_decoder(None),
+                                      use_list=False, raw=False)
+                if compact:
+                    self.compact_requests += 1
+                    msg = self._expand(msg)
+
+                if msg[CMD_KW_CMD] == CMD_NEGOTIATE and self.features:
+                    args = msg[CMD_KW_ARGS]
+                    features = args[CMD_KW_FEATURES] & self.features
+                    if features & PROTOCOL_FEATURE_COMPRESSION:
+                        state['codec'] = get_codec(args[CMD_KW_CODEC])
+                    self.send(conn, state, {'status': OK}, version=features)
+                    state['features'] = features
+                elif msg[CMD_KW_CMD] == CMD_NEGOTIATE:
+                    self.send(conn, state, {'status': UNKNOWN_COMMAND})
+                elif request_id is not None:
+                    # handle requests concurrently
+                    thread = threading.Thread(
+                        target=self._handle,
+                        args=(conn, state, msg, request_id))
+                    thread.daemon = True
+                    thread.start()
+                else:
+                    self._handle(conn, state, msg)
+        except (EOFError, OSError):
+            conn.close()
+
+    def _expand(self, msg):
+        """
+        Convert a v2 message to the v1 format passed to the handler
+        """
+        opcode, args, data = msg
+        commands = {v: k for k, v in OPCODES.items()}
+        keywords = {v: k for k, v in KEYWORD_IDS.items()}
+        return {
+            CMD_KW_CMD: commands.get(opcode, opcode),
+            CMD_KW_ARGS: {keywords.get(k, k): v for k, v in args.items()},
+            CMD_KW_DATA: data,
+        }
+
+    def _resolve_handle(self, msg):
+        """
+        Handle CMD_OPEN_HANDLE and replace handles in requests by file name
+        and path
+
+        Returns:
+            response or None
+        """
+        args = msg[CMD_KW_ARGS]
+        if msg[CMD_KW_CMD] == CMD_OPEN_HANDLE:
+            handle = next(self._handle_ids)
+            self.handles[handle] = (args[CMD_KW_DB], args[CMD_KW_PATH])
+            return {'status': OK, 'data': handle}
+        if CMD_KW_HANDLE in args:
+            if args[CMD_KW_HANDLE] not in self.handles:
+                return {'status': INVALID_HANDLE}
+            self.handle_requests += 1
+            args = dict(args)
+            db, path = self.handles[args.pop(CMD_KW_HANDLE)]
+            args[CMD_KW_DB], args[CMD_KW_PATH] = db, path
+            msg[CMD_KW_ARGS] = args
+        return None
+
+    def _handle(self, conn, state, msg, request_id=None):
+        response = None
+        if state['features'] & PROTOCOL_FEATURE_HANDLES:
+            response = self._resolve_handle(msg)
+        if response is None:
+            response = self.handler(msg)
+        if response is not None:
+            try:
+                self.send(conn, state, response, request_id=request_id,
+                          compress=msg[CMD_KW_ARGS].get(CMD_KW_COMPRESS))
+            except OSError:
+                # connection closed in the meantime
+                pass
+
+    def send(self, conn, state, response, version=0, request_id=None,
+             compress=None):
+        compact = state['features'] & PROTOCOL_FEATURE_V2
+        if compact:
+            response = [response['status'], response.get('data')]
+        body = msgpack.packb(response, default=encode, use_bin_type=True)
+        version |= PROTOCOL_VER | state['features']
+        codec = state['codec']
+        if compress is None:
+            compress = len(body) >= self.compression_threshold
+        codec_id = 0
+        if codec is not None and compress:
+            self.compressed_responses += 1
+            body = codec.compress(body)
+            codec_id = codec.id
+            version |= codec.id << PROTOCOL_CODEC_SHIFT
+        if compact:
+            header = HEADER_V2.pack(PROTOCOL_VER_2, codec_id, request_id or 0,
+                                    len(body))
+        elif request_id is not None:
+            header = struct.pack('>III', version, request_id, len(body))
+        else:
+            header = struct.pack('>II', version, len(body))
+        frame = header + body
+        with state['lock']:
+            if self.split_delay is not None:
+                conn.sendall(frame[:len(frame) // 2])
+                time.sleep(self.split_delay)
+                frame = frame[len(frame) // 2:]
+            conn.sendall(frame)